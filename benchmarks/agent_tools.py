@@ -0,0 +1,195 @@
+"""
+Latency of the agent's read-only tools.
+
+Calls CurrentPriceTool, PriceHistoryTool and AlertStatusTool the way the
+agent does (a new tool instance per call) against a local price stand-in,
+a week of price history and a populated alerts database, and reports:
+
+- what instantiating a tool costs, against building the PriceTrackerBot
+  that PriceTrackerTool used to create on every instantiation
+- the first call (one price fetch) and repeat calls (cache hits)
+- bursts of concurrent calls on an empty cache, and how many price fetches
+  they caused (one per burst with single flight)
+
+Run from the project root:
+    python benchmarks/agent_tools.py --calls 1000 --concurrency 8 32
+    python benchmarks/agent_tools.py --json --output benchmarks/results.jsonl
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+sys.path.insert(0, PROJECT_ROOT)
+
+from commands import BASE_PRICE, CONTRACT, fill_history  # noqa: E402
+from pipeline import git_version, percentile  # noqa: E402
+from stand_ins import Faults, FakePriceServer  # noqa: E402
+
+
+def timed(call, runs: int) -> list:
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def summary(seconds: list) -> dict:
+    return {
+        "p50_ms": percentile(seconds, 50) * 1000,
+        "p99_ms": percentile(seconds, 99) * 1000,
+        "max_ms": max(seconds) * 1000,
+    }
+
+
+def burst(call, size: int) -> list:
+    """Start `size` threads that all call at once; each thread's latency"""
+    barrier = threading.Barrier(size)
+    seconds = [0.0] * size
+
+    def worker(i):
+        barrier.wait()
+        started = time.perf_counter()
+        call()
+        seconds[i] = time.perf_counter() - started
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return seconds
+
+
+def seed_alerts(count: int):
+    from price_tracking_agency.price_tracker.tools.price_alerts import KIND_ABOVE, KIND_BELOW, AlertStore
+
+    store = AlertStore()
+    with store._db:
+        store._db.executemany(
+            "INSERT INTO alerts (user_id, guild_id, channel_id, contract, kind, threshold, armed, created_at) "
+            "VALUES (?, 1, NULL, ?, ?, ?, ?, 0)",
+            [(1000 + i % 500, CONTRACT, (KIND_ABOVE, KIND_BELOW)[i % 2], BASE_PRICE * (0.5 + i / count), i % 3 > 0)
+             for i in range(count)])
+    store.close()
+
+
+def run(args) -> dict:
+    from price_tracking_agency.price_tracker.tools.AlertStatusTool import AlertStatusTool
+    from price_tracking_agency.price_tracker.tools.CurrentPriceTool import CurrentPriceTool
+    from price_tracking_agency.price_tracker.tools.PriceHistoryTool import PriceHistoryTool
+    from price_tracking_agency.price_tracker.tools.price_aggregator import PriceAggregator
+    from price_tracking_agency.price_tracker.tools.price_fetcher import PriceTrackerTool
+    from price_tracking_agency.price_tracker.tools.price_queries import price_queries
+    from price_tracking_agency.price_tracker.tools.price_source import CoinGeckoPriceSource
+    from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
+    from price_tracking_agency.price_tracker.tools.tracker_config import load_tracker_config
+
+    fill_history(args.history_days, args.seed)
+    seed_alerts(args.alerts)
+    prices = FakePriceServer(Faults(args.price_latency, args.price_jitter), seed=args.seed)
+    prices.start()
+    prices.prices[CONTRACT] = BASE_PRICE
+
+    # The tools read the same config file the agent would
+    config = load_tracker_config()
+    queries = price_queries()
+    queries._source = PriceAggregator({"source0": CoinGeckoPriceSource(url=prices.source_url("0"))})
+    result = {}
+    try:
+        # What a tool instantiation cost before and after
+        result["instantiate_ms"] = {
+            "PriceTrackerBot (old PriceTrackerTool)": summary(timed(
+                lambda: PriceTrackerBot(update_interval=300, config=config), args.instantiations)),
+            "PriceTrackerTool": summary(timed(PriceTrackerTool, args.instantiations)),
+            "CurrentPriceTool": summary(timed(CurrentPriceTool, args.instantiations)),
+        }
+
+        requests = prices.counts.get("requests", 0)
+        result["first_call_ms"] = summary(timed(lambda: CurrentPriceTool().run(), 1))
+        result["repeat_calls_ms"] = {
+            "CurrentPriceTool": summary(timed(lambda: CurrentPriceTool().run(), args.calls)),
+            "PriceHistoryTool": summary(timed(lambda: PriceHistoryTool(window="24h").run(), args.calls)),
+            "AlertStatusTool": summary(timed(lambda: AlertStatusTool().run(), args.calls)),
+        }
+        result["sequential_price_requests"] = prices.counts.get("requests", 0) - requests
+
+        result["bursts"] = []
+        for size in args.concurrency:
+            queries.cache.clear()
+            fetches = queries.fetches
+            seconds = burst(lambda: CurrentPriceTool().run(), size)
+            result["bursts"].append({"concurrent": size, **summary(seconds), "fetches": queries.fetches - fetches})
+        result["answer"] = CurrentPriceTool().run()
+    finally:
+        prices.stop()
+
+    return {
+        "benchmark": "agent_tools",
+        "version": git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "params": vars(args),
+        **result,
+        "stand_ins": {"price": dict(prices.counts)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the agent's read-only tools against local stand-ins")
+    parser.add_argument("--calls", type=int, default=1000, help="Sequential calls per tool")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32],
+                        help="Concurrent calls per burst on an empty cache")
+    parser.add_argument("--instantiations", type=int, default=20)
+    parser.add_argument("--alerts", type=int, default=10_000)
+    parser.add_argument("--history-days", type=int, default=8)
+    parser.add_argument("--price-latency", type=float, default=0.15, help="Seconds per price API call")
+    parser.add_argument("--price-jitter", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--output", help="Append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    # Keep the snapshot, history and alerts out of the working tree
+    with tempfile.TemporaryDirectory(prefix="agent-tools-bench-") as workdir:
+        os.environ["SNAPSHOT_PATH"] = os.path.join(workdir, "snapshot.json")
+        os.environ["HISTORY_DIR"] = os.path.join(workdir, "history")
+        os.environ["ALERTS_DB"] = os.path.join(workdir, "alerts.db")
+        os.environ["TRACKER_CONFIG"] = os.path.join(workdir, "tracker_config.json")
+        with open(os.environ["TRACKER_CONFIG"], "w", encoding="utf-8") as f:
+            json.dump({"tokens": {"PDT": CONTRACT}, "guilds": {"1": "PDT"}, "presence_token": "PDT"}, f)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run(args)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"agent tools @ {result['version']}: {result['answer']}")
+    print("instantiate: " + ", ".join(f"{name} {times['p50_ms']:.2f}ms"
+                                       for name, times in result["instantiate_ms"].items()))
+    print(f"first CurrentPriceTool call (fetches): {result['first_call_ms']['p50_ms']:.1f}ms")
+    for name, times in result["repeat_calls_ms"].items():
+        print(f"{name} x{args.calls}: p50 {times['p50_ms']:.3f}ms, p99 {times['p99_ms']:.3f}ms, "
+              f"max {times['max_ms']:.1f}ms")
+    print(f"price API requests during sequential calls: {result['sequential_price_requests']}")
+    for entry in result["bursts"]:
+        print(f"{entry['concurrent']:>3} concurrent on an empty cache: p50 {entry['p50_ms']:.1f}ms, "
+              f"p99 {entry['p99_ms']:.1f}ms, {entry['fetches']} price fetch(es)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Scaling benchmark of the sharded cluster mode.
+
+Runs the real ShardSupervisor, PricePublisher and sharded PriceTrackerBot
+workers, each worker process with its own Discord stand-in for the guilds
+of its shards. Every tick publishes a new price and is timed until each
+guild's nickname edit has landed, for 1, 2, 4, ... workers up to the
+number of CPU cores. Guild updates per second should grow with the
+workers until the cores run out.
+
+Run from the project root:
+    python benchmarks/cluster.py --guilds 400 --ticks 5
+    python benchmarks/cluster.py --workers 1 2 4 8 --kill-worker --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+sys.path.insert(0, PROJECT_ROOT)
+
+from pipeline import git_version, percentile  # noqa: E402
+from stand_ins import Faults, FakeDiscord  # noqa: E402
+
+CONTRACT = "0xeff2a458e464b07088bdb441c21a42ab4b61e07e"
+BASE_PRICE = 0.0421
+FIRST_GUILD_ID = 10_000
+
+
+class CountingDiscord(FakeDiscord):
+    """FakeDiscord that also counts nickname edits into a counter shared with the parent"""
+
+    def __init__(self, edits, slot: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.edits = edits
+        self.slot = slot
+
+    def count(self, name: str):
+        super().count(name)
+        if name == "nickname_edits":
+            with self.edits.get_lock():
+                self.edits[self.slot] += 1
+
+
+def bench_worker(edits, discord_latency: float, spec, config):
+    """Cluster worker with an in-process Discord stand-in for its shards' guilds"""
+    from price_tracking_agency.price_tracker.tools.shard_cluster import run_worker, shard_for
+
+    guild_ids = [guild.guild_id for guild in config.guilds
+                 if shard_for(guild.guild_id, spec.shard_count) in spec.shard_ids]
+    fake_discord = CountingDiscord(edits, spec.index, guild_ids, Faults(discord_latency, discord_latency / 3))
+    fake_discord.start()
+    fake_discord.patch_discord_py()
+    with contextlib.redirect_stdout(sys.stderr):
+        run_worker(spec, config)
+
+
+async def wait_for(predicate, timeout: float, interval: float = 0.005):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Cluster did not reach the expected state")
+        await asyncio.sleep(interval)
+
+
+async def measure(workers: int, args, config) -> dict:
+    from price_tracking_agency.price_tracker.tools.price_source import PriceQuote
+    from price_tracking_agency.price_tracker.tools.shard_cluster import ShardSupervisor
+
+    # Fresh snapshots, so nicknames applied by a previous run are not skipped
+    workdir = tempfile.TemporaryDirectory(prefix="cluster-bench-")
+    os.environ["SNAPSHOT_PATH"] = os.path.join(workdir.name, "snapshot.json")
+    context = multiprocessing.get_context("spawn")
+    edits = context.Array("q", workers)
+    supervisor = ShardSupervisor(
+        workers, config=config, shard_count=workers,
+        socket_path=os.path.join(workdir.name, "prices.sock"),
+        target=functools.partial(bench_worker, edits, args.discord_latency))
+    await supervisor.publisher.start()
+    started = time.perf_counter()
+    supervisor.start_workers()
+    monitor = asyncio.create_task(supervisor.supervise(check_every=0.1))
+    guilds = len(config.guilds)
+    price = BASE_PRICE
+
+    async def tick() -> float:
+        nonlocal price
+        # A new price every tick, so every guild's nickname changes
+        price = round(price + 0.0001, 6)
+        target = sum(edits) + guilds
+        tick_started = time.perf_counter()
+        supervisor.publisher.publish({CONTRACT: PriceQuote(price=price, change_24h=1.0)})
+        await wait_for(lambda: sum(edits) >= target, args.timeout)
+        return time.perf_counter() - tick_started
+
+    try:
+        await wait_for(lambda: supervisor.publisher.subscribers == workers, args.timeout)
+        startup_seconds = time.perf_counter() - started
+        # Warm-up tick: the first edit in each guild also fetches its member
+        await tick()
+        tick_seconds: List[float] = []
+        for _ in range(args.ticks):
+            # Real ticks are seconds to minutes apart; back-to-back ticks
+            # would mostly measure the writer's per-guild route limit
+            await asyncio.sleep(args.pause)
+            tick_seconds.append(await tick())
+
+        restart = None
+        if args.kill_worker:
+            killed = time.perf_counter()
+            supervisor._processes[0].kill()
+            await wait_for(lambda: supervisor.restarts and supervisor.publisher.subscribers == workers,
+                           args.timeout)
+            resubscribed = time.perf_counter() - killed
+            restart = {"resubscribed_s": resubscribed, "next_tick_s": await tick()}
+    finally:
+        monitor.cancel()
+        await asyncio.gather(monitor, return_exceptions=True)
+        supervisor.stop_workers()
+        await supervisor.publisher.close()
+        workdir.cleanup()
+
+    total_seconds = sum(tick_seconds)
+    return {
+        "workers": workers,
+        "startup_s": startup_seconds,
+        "tick_latency_ms": {
+            "p50": percentile(tick_seconds, 50) * 1000,
+            "max": max(tick_seconds) * 1000,
+        },
+        "guild_updates": guilds * len(tick_seconds),
+        "guild_updates_per_second": guilds * len(tick_seconds) / total_seconds,
+        "edits_per_worker": list(edits),
+        "restart": restart,
+    }
+
+
+async def run(args) -> dict:
+    from price_tracking_agency.price_tracker.tools.tracker_config import GuildConfig, TokenConfig, TrackerConfig
+
+    # Snowflake-style IDs so guilds spread over shards the way Discord's do
+    config = TrackerConfig(
+        tokens={"PDT": TokenConfig(symbol="PDT", contract=CONTRACT)},
+        guilds=[GuildConfig(guild_id=(FIRST_GUILD_ID + i) << 22, token="PDT") for i in range(args.guilds)],
+        presence_token="PDT",
+    )
+    runs = [await measure(workers, args, config) for workers in args.workers]
+    for result in runs:
+        result["speedup"] = result["guild_updates_per_second"] / runs[0]["guild_updates_per_second"]
+    return {
+        "benchmark": "cluster",
+        "version": git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "params": vars(args),
+        "runs": runs,
+    }
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = [w for w in (1, 2, 4, 8, 16) if w <= cores] or [1]
+    if default_workers[-1] != cores and cores <= 16:
+        default_workers.append(cores)
+
+    parser = argparse.ArgumentParser(description="Benchmark cluster mode scaling against local stand-ins")
+    parser.add_argument("--guilds", type=int, default=400)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers,
+                        help="Worker counts to compare (default: powers of two up to the CPU count)")
+    parser.add_argument("--pause", type=float, default=1.0, help="Untimed seconds between ticks")
+    parser.add_argument("--discord-latency", type=float, default=0.03, help="Seconds per Discord REST call")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for a tick or startup")
+    parser.add_argument("--kill-worker", action="store_true",
+                        help="Kill a worker after each run and time its automatic restart")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--output", help="Append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    # Workers inherit these: keep their history out of the working tree and
+    # lift the global rate limit so Discord's 50/s does not cap the cluster
+    os.environ["METRICS_PORT"] = "off"
+    os.environ["LOG_LEVEL"] = "OFF"
+    os.environ["DISCORD_TOKEN"] = "benchmark-token"
+    os.environ["DISCORD_GLOBAL_RATE"] = "1000000"
+    with tempfile.TemporaryDirectory(prefix="cluster-bench-") as workdir:
+        os.environ["HISTORY_DIR"] = os.path.join(workdir, "history")
+        os.environ["ALERTS_DB"] = os.path.join(workdir, "alerts.db")
+
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{args.guilds} guilds x {args.ticks} ticks on {result['cpu_count']} cores @ {result['version']}")
+    for run_result in result["runs"]:
+        latency = run_result["tick_latency_ms"]
+        line = (f"{run_result['workers']:>2} workers: {run_result['guild_updates_per_second']:8.1f} guild updates/s "
+                f"(x{run_result['speedup']:.2f}), tick p50 {latency['p50']:.0f}ms, "
+                f"max {latency['max']:.0f}ms, startup {run_result['startup_s']:.1f}s, "
+                f"edits per worker {run_result['edits_per_worker']}")
+        if run_result["restart"]:
+            restart = run_result["restart"]
+            line += (f"; killed worker back in {restart['resubscribed_s']:.1f}s, "
+                     f"next tick {restart['next_tick_s'] * 1000:.0f}ms")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Load test of the /price and /chart slash commands.
+
+Runs the real PriceTrackerBot against local price and Discord stand-ins,
+with a week of price history, then sends bursts of hundreds of concurrent
+slash command invocations over the gateway and reports the time from each
+dispatch to the bot's response, how many charts were rendered and how many
+price API requests the commands caused (there should be none).
+
+Run from the project root:
+    python benchmarks/commands.py --bursts 100 300 500
+    python benchmarks/commands.py --json --output benchmarks/results.jsonl
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+sys.path.insert(0, PROJECT_ROOT)
+
+from pipeline import StallMonitor, git_version, percentile  # noqa: E402
+from stand_ins import Faults, FakeDiscord, FakePriceServer  # noqa: E402
+
+CONTRACT = "0xeff2a458e464b07088bdb441c21a42ab4b61e07e"
+BASE_PRICE = 0.0421
+FIRST_GUILD_ID = 10_000
+
+
+def fill_history(days: int, seed: int):
+    """A one-minute random walk ending now, written where the bot will read it"""
+    import numpy as np
+
+    from price_tracking_agency.price_tracker.tools.price_history import PriceHistoryStore
+
+    store = PriceHistoryStore()
+    samples = days * 24 * 60
+    now = time.time()
+    walk = BASE_PRICE * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.002, samples)))
+    for i, price in enumerate(walk):
+        store.record(CONTRACT, float(price), now - (samples - i) * 60)
+    store.flush()
+
+
+async def run(args) -> dict:
+    from price_tracking_agency.price_tracker.tools.log_config import configure_logging
+    from price_tracking_agency.price_tracker.tools.metrics import COMMAND_SECONDS, ERRORS
+    from price_tracking_agency.price_tracker.tools.price_aggregator import PriceAggregator
+    from price_tracking_agency.price_tracker.tools.price_history import WINDOWS
+    from price_tracking_agency.price_tracker.tools.price_source import CoinGeckoPriceSource
+    from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
+    from price_tracking_agency.price_tracker.tools.tracker_config import GuildConfig, TokenConfig, TrackerConfig
+
+    configure_logging(args.log_level)
+    fill_history(args.history_days, args.seed)
+    prices = FakePriceServer(Faults(0.05, 0.02), seed=args.seed + 1)
+    prices.start()
+    prices.prices[CONTRACT] = BASE_PRICE
+    guild_ids = list(range(FIRST_GUILD_ID, FIRST_GUILD_ID + args.guilds))
+    fake_discord = FakeDiscord(guild_ids, Faults(args.discord_latency, args.discord_jitter), seed=args.seed)
+    fake_discord.start()
+    fake_discord.patch_discord_py()
+
+    config = TrackerConfig(
+        tokens={"PDT": TokenConfig(symbol="PDT", contract=CONTRACT)},
+        guilds=[GuildConfig(guild_id=guild_id, token="PDT") for guild_id in guild_ids],
+        presence_token="PDT",
+    )
+    bot = PriceTrackerBot(update_interval=3600, config=config)
+    bot._price_source = PriceAggregator({"source0": CoinGeckoPriceSource(url=prices.source_url("0"))})
+    client = bot._discord_client
+    rng = random.Random(args.seed)
+
+    await client.login("benchmark-token")
+    connection = asyncio.create_task(client.connect(reconnect=False))
+    bursts = []
+    try:
+        # on_ready starts the loop, whose first tick fills the snapshot, then syncs the commands
+        await client.wait_until_ready()
+        while bot.price_update_loop is None or not bot._snapshot.get(CONTRACT):
+            await asyncio.sleep(0.01)
+        if bot._sync_task is not None:
+            await bot._sync_task
+        bot.price_update_loop.stop()
+        price_requests = prices.counts.get("requests", 0)
+
+        for size in args.bursts:
+            await asyncio.sleep(args.pause)
+            invocations = [
+                (rng.choice(guild_ids), "price", {}) if rng.random() < args.price_share
+                else (rng.choice(guild_ids), "chart", {"window": rng.choice(list(WINDOWS))})
+                for _ in range(size)
+            ]
+            fake_discord.interaction_seconds.clear()
+            fake_discord.responses.clear()
+            renders_before = bot._commands.charts.renders
+            monitor = StallMonitor()
+            monitor.start()
+            started = time.perf_counter()
+            # Dispatched from the stand-in's thread so this loop stays the bot's
+            await asyncio.to_thread(fake_discord.interact, invocations)
+            while len(fake_discord.interaction_seconds) < size:
+                if time.perf_counter() - started > args.timeout:
+                    raise TimeoutError(f"{len(fake_discord.interaction_seconds)} of {size} commands answered")
+                await asyncio.sleep(0.005)
+            wall = time.perf_counter() - started
+            await monitor.stop()
+            latencies = fake_discord.interaction_seconds
+            bursts.append({
+                "invocations": size,
+                "latency_ms": {
+                    "p50": percentile(latencies, 50) * 1000,
+                    "p90": percentile(latencies, 90) * 1000,
+                    "p99": percentile(latencies, 99) * 1000,
+                    "max": max(latencies) * 1000,
+                },
+                "wall_s": wall,
+                "commands_per_second": size / wall,
+                "charts": sum(kind == "file" for kind in fake_discord.responses.values()),
+                "chart_renders": bot._commands.charts.renders - renders_before,
+                "event_loop": monitor.report(),
+            })
+        price_requests = prices.counts.get("requests", 0) - price_requests
+    finally:
+        await client.close()
+        connection.cancel()
+        await asyncio.gather(connection, return_exceptions=True)
+        await bot._price_source.close()
+        prices.stop()
+        fake_discord.stop()
+
+    return {
+        "benchmark": "commands",
+        "version": git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "bursts": bursts,
+        "failed_commands": int(ERRORS.value(stage="command")),
+        "price_api_requests_during_bursts": price_requests,
+        "handler_mean_ms": {
+            command: COMMAND_SECONDS.total(command=command) / COMMAND_SECONDS.count(command=command) * 1000
+            for command in ("price", "chart") if COMMAND_SECONDS.count(command=command)
+        },
+        "stand_ins": {"price": dict(prices.counts), "discord": dict(fake_discord.counts)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the slash commands against local stand-ins")
+    parser.add_argument("--bursts", type=int, nargs="+", default=[100, 300, 500],
+                        help="Concurrent invocations per burst")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--price-share", type=float, default=0.5, help="Share of /price; the rest are /chart")
+    parser.add_argument("--history-days", type=int, default=8)
+    parser.add_argument("--pause", type=float, default=1.0, help="Untimed seconds before each burst")
+    parser.add_argument("--discord-latency", type=float, default=0.03, help="Seconds per Discord REST call")
+    parser.add_argument("--discord-jitter", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="OFF")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--output", help="Append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    os.environ["METRICS_PORT"] = "off"
+    # Keep the bot's snapshot and history out of the working tree
+    with tempfile.TemporaryDirectory(prefix="commands-bench-") as workdir:
+        os.environ["SNAPSHOT_PATH"] = os.path.join(workdir, "snapshot.json")
+        os.environ["HISTORY_DIR"] = os.path.join(workdir, "history")
+        os.environ["ALERTS_DB"] = os.path.join(workdir, "alerts.db")
+
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{args.guilds} guilds, {args.price_share:.0%} /price @ {result['version']}: "
+          f"{result['failed_commands']} failed, {result['price_api_requests_during_bursts']} price API requests")
+    for burst in result["bursts"]:
+        latency = burst["latency_ms"]
+        loop = burst["event_loop"]
+        print(f"{burst['invocations']:>4} concurrent: p50 {latency['p50']:.0f}ms, p90 {latency['p90']:.0f}ms, "
+              f"p99 {latency['p99']:.0f}ms, max {latency['max']:.0f}ms, {burst['commands_per_second']:.0f} "
+              f"commands/s, {burst['charts']} charts from {burst['chart_renders']} renders, "
+              f"loop max lag {loop['max_lag_ms']:.0f}ms")
+    print("handler means (incl. response): "
+          + ", ".join(f"/{command} {ms:.1f}ms" for command, ms in result["handler_mean_ms"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+End-to-end benchmark of the price update pipeline.
+
+Runs the real PriceTrackerBot (aggregator, writer, snapshot, history and a
+real discord.py client) against local price and Discord stand-ins with
+configurable latency, errors and 429s, then reports cycle latency
+percentiles, guild updates per second and event loop stalls.
+
+Run from the project root:
+    python benchmarks/pipeline.py --guilds 100 --cycles 20
+    python benchmarks/pipeline.py --json --output benchmarks/results.jsonl
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+sys.path.insert(0, PROJECT_ROOT)
+
+from stand_ins import Faults, FakeDiscord, FakePriceServer  # noqa: E402
+
+CONTRACT = "0xeff2a458e464b07088bdb441c21a42ab4b61e07e"
+BASE_PRICE = 0.0421
+FIRST_GUILD_ID = 10_000
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class StallMonitor:
+    """
+    Measures event loop responsiveness: a task that wakes every `interval`
+    seconds records how late each wake-up was
+    """
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.01):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    def report(self) -> Dict[str, float]:
+        stalls = [lag for lag in self.lags if lag >= self.threshold]
+        return {
+            "samples": len(self.lags),
+            "p99_lag_ms": percentile(self.lags, 99) * 1000,
+            "max_lag_ms": max(self.lags, default=0.0) * 1000,
+            "stalls": len(stalls),
+            "total_stall_ms": sum(stalls) * 1000,
+        }
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    from price_tracking_agency.price_tracker.tools.log_config import configure_logging
+    from price_tracking_agency.price_tracker.tools.metrics import ERRORS, STAGE_SECONDS
+    from price_tracking_agency.price_tracker.tools.price_aggregator import PriceAggregator
+    from price_tracking_agency.price_tracker.tools.price_source import CoinGeckoPriceSource
+    from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
+    from price_tracking_agency.price_tracker.tools.tracker_config import GuildConfig, TokenConfig, TrackerConfig
+
+    configure_logging(args.log_level)
+    prices = FakePriceServer(Faults(args.price_latency, args.price_jitter, args.price_error_rate,
+                                    args.price_429_rate), seed=args.seed + 1)
+    prices.start()
+    prices.prices[CONTRACT] = BASE_PRICE
+    guild_ids = range(FIRST_GUILD_ID, FIRST_GUILD_ID + args.guilds)
+    fake_discord = FakeDiscord(guild_ids, Faults(args.discord_latency, args.discord_jitter,
+                                                 args.discord_error_rate, args.discord_429_rate), seed=args.seed)
+    fake_discord.start()
+    fake_discord.patch_discord_py()
+
+    config = TrackerConfig(
+        tokens={"PDT": TokenConfig(symbol="PDT", contract=CONTRACT)},
+        guilds=[GuildConfig(guild_id=guild_id, token="PDT") for guild_id in guild_ids],
+        presence_token="PDT",
+    )
+    bot = PriceTrackerBot(update_interval=3600, config=config)
+    bot._price_source = PriceAggregator(
+        {f"source{i}": CoinGeckoPriceSource(url=prices.source_url(str(i))) for i in range(args.sources)})
+    # Fetch on every cycle instead of serving the snapshot
+    bot._snapshot.fresh_ttl = 0
+    client = bot._discord_client
+
+    await client.login("benchmark-token")
+    connection = asyncio.create_task(client.connect(reconnect=False))
+    try:
+        # on_ready renders and starts the loop; its first tick is the warm-up
+        await client.wait_until_ready()
+        while bot.price_update_loop is None:
+            await asyncio.sleep(0.01)
+        bot.price_update_loop.stop()
+        while bot.price_update_loop.is_running():
+            await asyncio.sleep(0.01)
+
+        monitor = StallMonitor()
+        monitor.start()
+        cycle_seconds, updates = [], []
+        failures_before = ERRORS.value(stage="cycle")
+        for cycle in range(args.cycles):
+            if cycle:
+                # Real ticks are minutes apart; back-to-back cycles would
+                # mostly measure the writer's per-guild route limit
+                await asyncio.sleep(args.pause)
+            # A new price every cycle, so every guild's nickname changes
+            prices.prices[CONTRACT] = round(BASE_PRICE + 0.0001 * (cycle + 1), 6)
+            edits_before = fake_discord.counts.get("nickname_edits", 0)
+            started = time.perf_counter()
+            await bot.price_update_loop_func()
+            cycle_seconds.append(time.perf_counter() - started)
+            updates.append(fake_discord.counts.get("nickname_edits", 0) - edits_before)
+        await monitor.stop()
+    finally:
+        await client.close()
+        connection.cancel()
+        await asyncio.gather(connection, return_exceptions=True)
+        await bot._price_source.close()
+        prices.stop()
+        fake_discord.stop()
+
+    total_seconds = sum(cycle_seconds)
+    return {
+        "benchmark": "pipeline",
+        "version": git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "cycles": args.cycles,
+        "failed_cycles": int(ERRORS.value(stage="cycle") - failures_before),
+        "cycle_latency_ms": {
+            "p50": percentile(cycle_seconds, 50) * 1000,
+            "p90": percentile(cycle_seconds, 90) * 1000,
+            "p99": percentile(cycle_seconds, 99) * 1000,
+            "max": max(cycle_seconds) * 1000,
+            "mean": total_seconds / len(cycle_seconds) * 1000,
+        },
+        "guild_updates": sum(updates),
+        "guild_updates_per_second": sum(updates) / total_seconds if total_seconds else 0.0,
+        "event_loop": monitor.report(),
+        # Includes the warm-up tick
+        "stage_mean_ms": {
+            stage: STAGE_SECONDS.total(stage=stage) / STAGE_SECONDS.count(stage=stage) * 1000
+            for stage in ("fetch", "parse", "nickname", "presence", "cycle")
+            if STAGE_SECONDS.count(stage=stage)
+        },
+        "stand_ins": {"price": dict(prices.counts), "discord": dict(fake_discord.counts)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the price update pipeline against local stand-ins")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--pause", type=float, default=1.0, help="Untimed seconds between cycles")
+    parser.add_argument("--sources", type=int, default=2, help="Price stand-ins behind the aggregator")
+    parser.add_argument("--price-latency", type=float, default=0.05, help="Seconds per price request")
+    parser.add_argument("--price-jitter", type=float, default=0.02)
+    parser.add_argument("--price-error-rate", type=float, default=0.0)
+    parser.add_argument("--price-429-rate", type=float, default=0.0)
+    parser.add_argument("--discord-latency", type=float, default=0.03, help="Seconds per Discord REST call")
+    parser.add_argument("--discord-jitter", type=float, default=0.01)
+    parser.add_argument("--discord-error-rate", type=float, default=0.0)
+    parser.add_argument("--discord-429-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="OFF")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--output", help="Append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    os.environ["METRICS_PORT"] = "off"
+    # Keep the bot's snapshot and history out of the working tree
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as workdir:
+        os.environ["SNAPSHOT_PATH"] = os.path.join(workdir, "snapshot.json")
+        os.environ["HISTORY_DIR"] = os.path.join(workdir, "history")
+        os.environ["ALERTS_DB"] = os.path.join(workdir, "alerts.db")
+
+        # The bot's startup prints go to stderr so stdout stays machine-readable
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    latency = result["cycle_latency_ms"]
+    loop = result["event_loop"]
+    print(f"{args.guilds} guilds x {args.cycles} cycles ({result['failed_cycles']} failed) @ {result['version']}")
+    print(f"cycle latency: p50 {latency['p50']:.0f}ms, p90 {latency['p90']:.0f}ms, "
+          f"p99 {latency['p99']:.0f}ms, max {latency['max']:.0f}ms")
+    print(f"throughput: {result['guild_updates_per_second']:.1f} guild updates/s "
+          f"({result['guild_updates']} nickname edits)")
+    print(f"event loop: p99 lag {loop['p99_lag_ms']:.1f}ms, max {loop['max_lag_ms']:.1f}ms, "
+          f"{loop['stalls']} stalls totalling {loop['total_stall_ms']:.0f}ms")
+    print("stage means: " + ", ".join(f"{stage} {ms:.2f}ms" for stage, ms in result["stage_mean_ms"].items()))
+    print(f"stand-ins: price {result['stand_ins']['price']}, discord {result['stand_ins']['discord']}")
+
+
+if __name__ == "__main__":
+    main()
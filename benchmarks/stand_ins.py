@@ -0,0 +1,293 @@
+"""
+Local stand-ins for the price APIs and Discord (REST and gateway) used by
+the benchmarks. Each one serves from its own thread and event loop, so the
+bot under test has its loop to itself.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import WSMsgType, web
+
+BOT_ID = 1
+JOINED_AT = "2024-01-01T00:00:00+00:00"
+
+
+@dataclass
+class Faults:
+    """Latency and failures injected into every response"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 0.1
+    # 503 fails fast; discord.py retries 500/502/504 itself with multi-second sleeps
+    error_status: int = 503
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def outcome(self, rng: random.Random) -> Optional[str]:
+        """None for a normal response, else "error" or "rate_limited" """
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+
+class StandInServer:
+    """An aiohttp application served on 127.0.0.1 from a background thread"""
+
+    def __init__(self, faults: Optional[Faults] = None, seed: int = 0):
+        self.faults = faults or Faults()
+        self.rng = random.Random(seed)
+        self.app = web.Application()
+        self.url = ""
+        self.counts: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    def count(self, name: str):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    async def inject(self) -> Optional[web.Response]:
+        """Apply the configured latency and maybe return a failure response"""
+        await asyncio.sleep(self.faults.delay(self.rng))
+        outcome = self.faults.outcome(self.rng)
+        if outcome == "rate_limited":
+            self.count("rate_limited")
+            retry_after = self.faults.retry_after
+            return json_response(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": False},
+                status=429, headers={"Retry-After": str(retry_after), "Via": "1.1 stand-in"},
+            )
+        if outcome == "error":
+            self.count("errors")
+            return json_response({"message": "stand-in failure"}, status=self.faults.error_status)
+        return None
+
+    def start(self) -> str:
+        ready = threading.Event()
+
+        async def serve():
+            self._loop = asyncio.get_running_loop()
+            self._stopped = asyncio.Event()
+            runner = web.AppRunner(self.app, access_log=None)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+            ready.set()
+            await self._stopped.wait()
+            await runner.cleanup()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+
+def json_response(data, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    # discord.py only parses an exact "application/json" content type
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={"Content-Type": "application/json", **(headers or {})})
+
+
+def _static(data):
+    async def handler(request: web.Request) -> web.Response:
+        return json_response(data)
+    return handler
+
+
+class FakePriceServer(StandInServer):
+    """
+    CoinGecko-style `/simple/token_price` stand-in at `/coingecko/<name>`,
+    serving whatever is in `prices`
+    """
+
+    def __init__(self, faults: Optional[Faults] = None, seed: int = 0):
+        super().__init__(faults, seed)
+        self.prices: Dict[str, float] = {}
+        self.app.router.add_get("/coingecko/{name}", self._token_price)
+
+    def source_url(self, name: str) -> str:
+        return f"{self.url}/coingecko/{name}"
+
+    async def _token_price(self, request: web.Request) -> web.Response:
+        self.count("requests")
+        failure = await self.inject()
+        if failure is not None:
+            return failure
+        contracts = request.query.get("contract_addresses", "").split(",")
+        return json_response({
+            contract: {"usd": self.prices[contract], "usd_24h_change": 1.5}
+            for contract in contracts if contract in self.prices
+        })
+
+
+class FakeDiscord(StandInServer):
+    """
+    Discord REST and gateway stand-in. READY lists `guild_ids`, each followed
+    by a small GUILD_CREATE carrying only the bot's member; a sharded
+    IDENTIFY gets only the guilds of its shard. Nickname edits and presence
+    updates are counted; faults apply to REST calls.
+
+    `interact()` sends slash command invocations over the gateway and
+    `interaction_seconds` collects the time from each dispatch to the bot's
+    response.
+    """
+
+    def __init__(self, guild_ids: Iterable[int], faults: Optional[Faults] = None, seed: int = 0):
+        super().__init__(faults, seed)
+        self.guild_ids: List[int] = list(guild_ids)
+        self.nicknames: Dict[int, str] = {}
+        self.interaction_seconds: List[float] = []
+        self.responses: Dict[int, str] = {}
+        self._sent_at: Dict[int, float] = {}
+        self._next_interaction = 1_000_000
+        self._dispatch = None
+        router = self.app.router
+        router.add_get("/gateway", self._gateway)
+        router.add_get("/api/v10/users/@me", _static(_user(BOT_ID)))
+        router.add_get("/api/v10/oauth2/applications/@me", _static({
+            "id": str(BOT_ID), "name": "Price tracker", "icon": None, "description": "",
+            "bot_public": True, "bot_require_code_grant": False, "owner": _user(2),
+            "verify_key": "", "flags": 0,
+        }))
+        router.add_patch("/api/v10/guilds/{guild_id}/members/@me", self._edit_nickname)
+        router.add_get("/api/v10/guilds/{guild_id}/members/{user_id}", self._get_member)
+        router.add_put("/api/v10/applications/{application_id}/commands", self._sync_commands)
+        router.add_post("/api/v10/interactions/{interaction_id}/{token}/callback", self._interaction_callback)
+
+    def patch_discord_py(self):
+        """Point discord.py's REST routes and gateway at this stand-in"""
+        import yarl
+        from discord.gateway import DiscordWebSocket
+        from discord.http import Route
+
+        Route.BASE = f"{self.url}/api/v10"
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f"{self.url.replace('http', 'ws', 1)}/gateway")
+
+    async def _edit_nickname(self, request: web.Request) -> web.Response:
+        self.count("nickname_requests")
+        failure = await self.inject()
+        if failure is not None:
+            return failure
+        body = await request.json()
+        guild_id = int(request.match_info["guild_id"])
+        self.nicknames[guild_id] = body.get("nick")
+        self.count("nickname_edits")
+        return json_response(_member(BOT_ID, nick=body.get("nick")))
+
+    async def _get_member(self, request: web.Request) -> web.Response:
+        failure = await self.inject()
+        if failure is not None:
+            return failure
+        return json_response(_member(int(request.match_info["user_id"])))
+
+    async def _sync_commands(self, request: web.Request) -> web.Response:
+        self.count("command_syncs")
+        return json_response([])
+
+    async def _interaction_callback(self, request: web.Request) -> web.Response:
+        received = time.perf_counter()
+        failure = await self.inject()
+        if failure is not None:
+            return failure
+        interaction_id = int(request.match_info["interaction_id"])
+        # Chart responses are multipart with the PNG attached
+        self.responses[interaction_id] = "file" if request.content_type.startswith("multipart/") else "message"
+        await request.read()
+        self.interaction_seconds.append(received - self._sent_at.pop(interaction_id))
+        self.count("interaction_responses")
+        return json_response({"interaction": {"id": str(interaction_id), "type": 2}})
+
+    def interact(self, invocations: Iterable[Tuple[int, str, Dict[str, str]]]):
+        """
+        Send (guild_id, command, options) slash command invocations over the
+        gateway, all at once, from the stand-in's thread
+        """
+        future = asyncio.run_coroutine_threadsafe(self._send_interactions(list(invocations)), self._loop)
+        future.result()
+
+    async def _send_interactions(self, invocations):
+        for guild_id, command, options in invocations:
+            self._next_interaction += 1
+            interaction_id = self._next_interaction
+            self._sent_at[interaction_id] = time.perf_counter()
+            await self._dispatch("INTERACTION_CREATE", {
+                "id": str(interaction_id), "application_id": str(BOT_ID), "type": 2, "version": 1,
+                "token": f"interaction-{interaction_id}", "guild_id": str(guild_id),
+                "member": {**_member(3), "permissions": "0"}, "locale": "en-US", "guild_locale": "en-US",
+                "app_permissions": "0", "attachment_size_limit": 8 * 2 ** 20, "entitlements": [],
+                "data": {"id": "1", "name": command, "type": 1, "options": [
+                    {"name": name, "type": 3, "value": value} for name, value in options.items()]},
+            })
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        sequence = 0
+
+        async def dispatch(event, data):
+            nonlocal sequence
+            sequence += 1
+            await ws.send_str(json.dumps({"op": 0, "t": event, "s": sequence, "d": data}))
+
+        self._dispatch = dispatch
+        await ws.send_str(json.dumps({"op": 10, "d": {"heartbeat_interval": 41250}}))
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(msg.data)
+            if payload["op"] == 1:
+                await ws.send_str(json.dumps({"op": 11}))
+            elif payload["op"] == 2:
+                shard_id, shard_count = payload["d"].get("shard") or (0, 1)
+                guild_ids = [guild_id for guild_id in self.guild_ids if (guild_id >> 22) % shard_count == shard_id]
+                await dispatch("READY", {
+                    "v": 10, "user": _user(BOT_ID), "session_id": "stand-in",
+                    "resume_gateway_url": str(request.url.with_path("/gateway")),
+                    "guilds": [{"id": str(guild_id), "unavailable": True} for guild_id in guild_ids],
+                    "application": {"id": str(BOT_ID), "flags": 0},
+                    "shard": [shard_id, shard_count],
+                })
+                for guild_id in guild_ids:
+                    await dispatch("GUILD_CREATE", _guild(guild_id))
+            elif payload["op"] == 3:
+                self.count("presence_updates")
+        return ws
+
+
+def _user(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+            "global_name": f"User {user_id}", "avatar": None, "bot": user_id == BOT_ID}
+
+
+def _member(user_id: int, nick: Optional[str] = None) -> dict:
+    return {"user": _user(user_id), "roles": [], "nick": nick, "joined_at": JOINED_AT,
+            "deaf": False, "mute": False, "flags": 0}
+
+
+def _guild(guild_id: int) -> dict:
+    return {
+        "id": str(guild_id), "name": f"guild {guild_id}", "icon": None, "owner_id": "2",
+        "member_count": 2, "large": False, "unavailable": False, "joined_at": JOINED_AT,
+        "roles": [{"id": str(guild_id), "name": "@everyone", "color": 0, "hoist": False, "position": 0,
+                   "permissions": "0", "managed": False, "mentionable": False, "flags": 0}],
+        "channels": [], "members": [_member(BOT_ID)], "presences": [], "emojis": [], "stickers": [],
+        "features": [], "threads": [], "voice_states": [], "stage_instances": [],
+        "guild_scheduled_events": [], "verification_level": 0, "default_message_notifications": 0,
+        "explicit_content_filter": 0, "mfa_level": 0, "premium_tier": 0, "preferred_locale": "en-US",
+        "system_channel_flags": 0, "nsfw_level": 0,
+    }
@@ -0,0 +1,84 @@
+"""
+Startup benchmark: import time (`python -X importtime`) and resident memory
+for each entry point mode.
+
+Run from the project root:
+    python benchmarks/startup.py [--runs 3] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+# What each mode imports before it starts doing work
+MODES = {
+    "bot": "import bot; from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot",
+    "agency": "import bot; from price_tracking_agency.price_tracker.price_tracker import PriceTracker",
+    "pdtbot": "import run_bot",
+}
+
+MEASURE = (
+    "import resource, time; started = time.perf_counter(); {code}; "
+    "print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def measure(code: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+    # Import-time checks only need the variables to be present
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", MEASURE.format(code=code)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed, max_rss_kb = result.stdout.strip().splitlines()[-1].split()
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((name, int(self_us), int(cumulative_us)))
+    top_level = sorted((m for m in modules if not m[0].startswith(" ")), key=lambda m: -m[2])
+
+    return {
+        "import_seconds": float(elapsed),
+        "modules": len(modules),
+        "max_rss_mb": int(max_rss_kb) / 1024,
+        "agency_swarm_loaded": any(m[0].strip() == "agency_swarm" for m in modules),
+        "heaviest": [(name.strip(), cumulative / 1e6) for name, _, cumulative in top_level[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and RSS per run mode")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode; the median is reported")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = {}
+    for mode, code in MODES.items():
+        runs = [measure(code) for _ in range(args.runs)]
+        results[mode] = dict(
+            runs[0],
+            import_seconds=statistics.median(r["import_seconds"] for r in runs),
+            max_rss_mb=statistics.median(r["max_rss_mb"] for r in runs),
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for mode, r in results.items():
+        print(f"{mode:>7}: {r['import_seconds']:.2f}s import, {r['max_rss_mb']:.0f} MiB RSS, "
+              f"{r['modules']} modules, agency_swarm {'loaded' if r['agency_swarm_loaded'] else 'not loaded'}")
+        print("         heaviest: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in r["heaviest"]))
+
+
+if __name__ == "__main__":
+    main()
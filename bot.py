@@ -7,20 +7,34 @@ import argparse
 project_root = str(Path(__file__).parent)
 sys.path.insert(0, project_root)
 
-from price_tracking_agency.price_tracker.tools.price_fetcher import PriceTrackerTool
-from price_tracking_agency.agency import agency
+# Each mode imports only what it needs, so bot mode never loads agency_swarm
+# or builds the agent.
 
 def run_bot():
     """Run the price tracking bot"""
-    tool = PriceTrackerTool()
+    from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
+
+    bot = PriceTrackerBot()
     try:
         print("Starting price tracking bot...")
-        tool.run()
+        bot.run()
     except Exception as e:
         print(f"Error running bot: {e}")
 
+def run_cluster(workers=None):
+    """Run the bot as a price publisher and several sharded worker processes"""
+    from price_tracking_agency.price_tracker.tools.shard_cluster import run_cluster as start_cluster
+
+    try:
+        print("Starting price tracking cluster...")
+        start_cluster(workers)
+    except Exception as e:
+        print(f"Error running cluster: {e}")
+
 def run_agency():
     """Run the full agency"""
+    from price_tracking_agency.agency import agency
+
     try:
         print("Starting agency...")
         agency.run_demo()
@@ -29,13 +43,18 @@ def run_agency():
 
 def main():
     parser = argparse.ArgumentParser(description='Run PDT Price Tracking Bot')
-    parser.add_argument('--mode', choices=['bot', 'agency'], default='bot',
-                       help='Run mode: bot (price tracking only) or agency (full agency)')
+    parser.add_argument('--mode', choices=['bot', 'cluster', 'agency'], default='bot',
+                       help='Run mode: bot (price tracking only), cluster (sharded bot in several '
+                            'processes) or agency (full agency)')
+    parser.add_argument('--workers', type=int,
+                       help='Worker processes in cluster mode (default: one per CPU core)')
     
     args = parser.parse_args()
     
     if args.mode == 'bot':
         run_bot()
+    elif args.mode == 'cluster':
+        run_cluster(args.workers)
     else:
         run_agency()
 
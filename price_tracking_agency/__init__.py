@@ -1,3 +1,9 @@
-from price_tracking_agency.price_tracker import PriceTracker
+__all__ = ['PriceTracker']
 
-__all__ = ['PriceTracker'] 
\ No newline at end of file
+
+def __getattr__(name):
+    # The agent pulls in agency_swarm, so it is only imported on first use
+    if name == 'PriceTracker':
+        from price_tracking_agency.price_tracker import PriceTracker
+        return PriceTracker
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
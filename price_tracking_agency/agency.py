@@ -6,7 +6,9 @@ price_tracker = PriceTracker()
 agency = Agency(
     [price_tracker],
     shared_instructions="agency_manifesto.md",
-    temperature=0.5
+    temperature=0.5,
+    # Tool calls from one run execute in parallel threads; the price tools share one cache
+    async_mode="tools_threading",
 )
 
 if __name__ == "__main__":
@@ -1,10 +1,9 @@
-from price_tracking_agency.price_tracker import PriceTracker
-from price_tracking_agency.price_tracker.tools.price_fetcher import PriceTrackerTool
+from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
 
 def main():
-    # Create and run the price tracker tool directly
-    tool = PriceTrackerTool()
-    tool.run()
+    # Create and run the price tracker directly, without the agent stack
+    bot = PriceTrackerBot()
+    bot.run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,6 +1,9 @@
 from agency_swarm import Agent
 from agency_swarm.util import set_openai_key
 from price_tracking_agency.price_tracker.tools.price_fetcher import PriceTrackerTool
+from price_tracking_agency.price_tracker.tools.CurrentPriceTool import CurrentPriceTool
+from price_tracking_agency.price_tracker.tools.PriceHistoryTool import PriceHistoryTool
+from price_tracking_agency.price_tracker.tools.AlertStatusTool import AlertStatusTool
 import os
 from dotenv import load_dotenv
 
@@ -16,8 +19,7 @@ class PriceTracker(Agent):
             name="PriceTracker",
             description="Tracks PDT-Token price and updates Discord roles/status",
             instructions="./instructions.md",
-            tools_folder="./tools",
-            tools=[PriceTrackerTool],
+            tools=[PriceTrackerTool, CurrentPriceTool, PriceHistoryTool, AlertStatusTool],
             temperature=0.5,
         ) 
 
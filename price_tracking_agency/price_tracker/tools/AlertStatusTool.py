@@ -0,0 +1,44 @@
+"""
+Agent tool: status of the price alerts users have set with /alert
+"""
+
+__all__ = ['AlertStatusTool']
+
+from typing import Optional
+
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+
+from .price_queries import price_queries
+
+
+class AlertStatusTool(BaseTool):
+    """
+    Get how many price alerts are set and how many are armed (waiting to
+    fire) rather than already fired, or list one Discord user's alerts.
+    """
+
+    user_id: Optional[int] = Field(
+        default=None,
+        description="Discord user ID to list alerts for. Leave empty for totals across all users."
+    )
+
+    class ToolConfig:
+        async_mode = "threading"
+
+    def run(self):
+        status = price_queries().alerts(self.user_id)
+        if self.user_id is not None:
+            if not status["alerts"]:
+                return f"User {self.user_id} has no alerts."
+            return "\n".join(f"#{alert_id} {text}: {'armed' if armed else 'fired, waiting to re-arm'}"
+                             for alert_id, text, armed in status["alerts"])
+        if not status["total"]:
+            return "No price alerts are set."
+        kinds = ", ".join(f"{count} {kind}" for kind, count in status["by_kind"].items())
+        return f"{status['total']} alerts ({kinds}), {status['armed']} armed and {status['total'] - status['armed']} fired."
+
+
+# Add a test case
+if __name__ == "__main__":
+    print(AlertStatusTool().run())
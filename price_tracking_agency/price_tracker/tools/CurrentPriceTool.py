@@ -0,0 +1,43 @@
+"""
+Agent tool: latest price of a tracked token
+"""
+
+__all__ = ['CurrentPriceTool']
+
+import time
+from typing import Optional
+
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+
+from .price_queries import price_queries
+
+
+class CurrentPriceTool(BaseTool):
+    """
+    Get the latest USD price and 24h change of a tracked token. Answers come
+    from a shared cache refreshed every few seconds, so call it whenever a
+    price is needed.
+    """
+
+    token: Optional[str] = Field(
+        default=None,
+        description="Token symbol, e.g. PDT. Defaults to the main tracked token."
+    )
+
+    class ToolConfig:
+        async_mode = "threading"
+
+    def run(self):
+        try:
+            token, cached = price_queries().quote(self.token)
+        except (ValueError, LookupError) as e:
+            return str(e)
+        quote = cached.quote
+        change = f"{quote.change_24h:+.2f}% in 24h" if quote.change_24h is not None else "24h change unknown"
+        return f"{token.symbol}: ${quote.price:.6f} ({change}), as of {time.time() - cached.fetched_at:.0f}s ago"
+
+
+# Add a test case
+if __name__ == "__main__":
+    print(CurrentPriceTool().run())
@@ -0,0 +1,54 @@
+"""
+Agent tool: price history of a tracked token over a time window
+"""
+
+__all__ = ['PriceHistoryTool']
+
+import time
+from typing import Literal, Optional
+
+from agency_swarm.tools import BaseTool
+from pydantic import Field
+
+from .price_queries import price_queries
+
+
+class PriceHistoryTool(BaseTool):
+    """
+    Get a token's price change, high, low and volatility over the last hour,
+    day or week, with a dozen prices spread over the window. Read from the
+    tracker's local price history.
+    """
+
+    window: Literal["1h", "24h", "7d"] = Field(
+        default="24h",
+        description="Time window: 1h, 24h or 7d"
+    )
+    token: Optional[str] = Field(
+        default=None,
+        description="Token symbol, e.g. PDT. Defaults to the main tracked token."
+    )
+
+    class ToolConfig:
+        async_mode = "threading"
+
+    def run(self):
+        queries = price_queries()
+        try:
+            token = queries.resolve_token(self.token)
+            history = queries.history(self.token, self.window)
+        except ValueError as e:
+            return str(e)
+        stats = history["stats"]
+        if stats is None:
+            return f"Not enough {token.symbol} history for the {self.window} window yet."
+        now = time.time()
+        points = ", ".join(f"{(now - timestamp) / 60:.0f}m ago ${price:.6f}" for timestamp, price in history["points"])
+        return (f"{token.symbol} over {self.window}: {stats.change_pct:+.2f}%, high ${stats.high:.6f}, "
+                f"low ${stats.low:.6f}, volatility {stats.volatility_pct:.2f}% from {stats.samples} samples. "
+                f"Prices: {points}")
+
+
+# Add a test case
+if __name__ == "__main__":
+    print(PriceHistoryTool(window="24h").run())
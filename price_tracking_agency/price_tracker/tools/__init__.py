@@ -2,8 +2,29 @@
 Tools for the price tracking bot
 """
 
-from .price_fetcher import PriceTrackerTool
-
 __all__ = [
-    'PriceTrackerTool'
-] 
\ No newline at end of file
+    'PriceTrackerBot',
+    'PriceTrackerTool',
+    'CurrentPriceTool',
+    'PriceHistoryTool',
+    'AlertStatusTool',
+]
+
+# Imported on first use so bot mode never loads agency_swarm
+_LAZY = {
+    'PriceTrackerBot': '.price_tracker_bot',
+    'PriceTrackerTool': '.price_fetcher',
+    'CurrentPriceTool': '.CurrentPriceTool',
+    'PriceHistoryTool': '.PriceHistoryTool',
+    'AlertStatusTool': '.AlertStatusTool',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        value = getattr(import_module(_LAZY[name], __name__), name)
+        # Tools live in modules named after them, and importing one binds the module to that name
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
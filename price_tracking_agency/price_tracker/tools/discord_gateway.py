@@ -0,0 +1,241 @@
+"""
+Discord gateway settings: a lean mode that only caches what the tracker uses
+"""
+
+__all__ = ['GATEWAY_MODES', 'client_options', 'own_member']
+
+import os
+from typing import Any, Dict, Optional
+
+import discord
+
+DEFAULT_GATEWAY_MODE = "lean"
+GATEWAY_MODES = ("lean", "full")
+
+
+def client_options(mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    discord.Client keyword arguments for a gateway mode, `$GATEWAY_MODE` by default.
+
+    "lean" subscribes to the guilds intent only and turns off member caching,
+    member chunking and the message cache. The bots only edit their own
+    nickname and presence, and Discord still sends the bot's own member with
+    every guild, so nothing they use goes missing. "full" is the previous
+    everything-on setup.
+    """
+    mode = mode or os.getenv("GATEWAY_MODE") or DEFAULT_GATEWAY_MODE
+    if mode == "full":
+        return {"intents": discord.Intents.all()}
+    if mode != "lean":
+        raise ValueError(f"Unknown GATEWAY_MODE {mode!r}, expected one of {list(GATEWAY_MODES)}")
+    intents = discord.Intents.none()
+    intents.guilds = True  # Guilds, roles and channels; enough for nickname edits
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+
+async def own_member(client: discord.Client, guild: discord.Guild) -> discord.Member:
+    """The bot's member in `guild`, fetched over REST when it is not cached"""
+    member = guild.get_member(client.user.id)
+    if member is None:
+        member = await guild.fetch_member(client.user.id)
+        # discord.py keeps the bot's own member cached even with member
+        # caching off; do the same so the next tick skips the request
+        guild._add_member(member)
+    return member
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Memory and READY-time benchmark against a local fake gateway that
+    # replays one large guild. Each mode connects from its own process so
+    # the RSS numbers only contain that client's caches.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.discord_gateway
+    import asyncio
+    import gc
+    import json
+    import resource
+    import subprocess
+    import sys
+    import threading
+    import time
+
+    from aiohttp import WSMsgType, web
+
+    MEMBERS = 100_000
+    ROLES = 50
+    CHANNELS = 200
+    CHUNK_SIZE = 1000  # Discord's own GUILD_MEMBERS_CHUNK size
+    LARGE_THRESHOLD = 250
+    BOT_ID = 1
+    GUILD_ID = 1000
+    JOINED_AT = "2024-01-01T00:00:00+00:00"
+
+    def user(user_id):
+        return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+                "global_name": f"User {user_id}", "avatar": None, "bot": user_id == BOT_ID}
+
+    def member(user_id):
+        return {"user": user(user_id), "roles": [str(GUILD_ID + 1 + user_id % ROLES)], "nick": None,
+                "joined_at": JOINED_AT, "deaf": False, "mute": False, "flags": 0}
+
+    def presence(user_id):
+        return {"user": {"id": str(user_id)}, "status": "online", "client_status": {"desktop": "online"},
+                "activities": [{"name": "a game", "type": 0, "created_at": 0}]}
+
+    def guild_create(intents):
+        presences_intent = bool(intents & discord.Intents(presences=True).value)
+        # Large guilds only carry the bot, plus online members up to the
+        # large threshold when presences are on; the rest needs chunking
+        ids = [BOT_ID] + (list(range(2, LARGE_THRESHOLD + 1)) if presences_intent else [])
+        return {
+            "id": str(GUILD_ID), "name": "Large guild", "icon": None, "owner_id": "2",
+            "member_count": MEMBERS + 1, "large": True, "unavailable": False, "joined_at": JOINED_AT,
+            "roles": [{"id": str(GUILD_ID + i), "name": f"role{i}", "color": 0, "hoist": False,
+                       "position": i, "permissions": "0", "managed": False, "mentionable": False,
+                       "flags": 0} for i in range(ROLES + 1)],
+            "channels": [{"id": str(GUILD_ID + 10_000 + i), "type": 0, "name": f"channel-{i}",
+                          "position": i, "permission_overwrites": []} for i in range(CHANNELS)],
+            "members": [member(i) for i in ids],
+            "presences": [presence(i) for i in ids if i != BOT_ID] if presences_intent else [],
+            "emojis": [], "stickers": [], "features": [], "threads": [], "voice_states": [],
+            "stage_instances": [], "guild_scheduled_events": [], "verification_level": 0,
+            "default_message_notifications": 0, "explicit_content_filter": 0, "mfa_level": 0,
+            "premium_tier": 0, "preferred_locale": "en-US", "system_channel_flags": 0, "nsfw_level": 0,
+        }
+
+    async def gateway(request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        sequence = 0
+
+        async def dispatch(event, data):
+            nonlocal sequence
+            sequence += 1
+            await ws.send_str(json.dumps({"op": 0, "t": event, "s": sequence, "d": data}))
+
+        await ws.send_str(json.dumps({"op": 10, "d": {"heartbeat_interval": 41250}}))
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(msg.data)
+            if payload["op"] == 1:
+                await ws.send_str(json.dumps({"op": 11}))
+            elif payload["op"] == 2:
+                await dispatch("READY", {
+                    "v": 10, "user": user(BOT_ID), "session_id": "bench",
+                    "resume_gateway_url": str(request.url.with_path("/gateway")),
+                    "guilds": [{"id": str(GUILD_ID), "unavailable": True}],
+                    "application": {"id": str(BOT_ID), "flags": 0},
+                })
+                await dispatch("GUILD_CREATE", guild_create(payload["d"]["intents"]))
+            elif payload["op"] == 8:
+                request_data = payload["d"]
+                count = -(-MEMBERS // CHUNK_SIZE)
+                for index in range(count):
+                    ids = range(2 + index * CHUNK_SIZE, 2 + min(MEMBERS, (index + 1) * CHUNK_SIZE))
+                    chunk = {"guild_id": str(GUILD_ID), "members": [member(i) for i in ids],
+                             "chunk_index": index, "chunk_count": count, "nonce": request_data.get("nonce")}
+                    if request_data.get("presences"):
+                        chunk["presences"] = [presence(i) for i in ids]
+                    await dispatch("GUILD_MEMBERS_CHUNK", chunk)
+        return ws
+
+    def rest(data):
+        async def handler(request):
+            # discord.py only parses an exact "application/json" content type
+            return web.Response(body=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+        return handler
+
+    def start_fake_discord():
+        ready = threading.Event()
+        address = {}
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/gateway", gateway)
+            app.router.add_get("/api/v10/users/@me", rest(user(BOT_ID)))
+            app.router.add_get("/api/v10/oauth2/applications/@me", rest({
+                "id": str(BOT_ID), "name": "Price tracker", "icon": None, "description": "",
+                "bot_public": True, "bot_require_code_grant": False, "owner": user(2),
+                "verify_key": "", "flags": 0,
+            }))
+            app.router.add_get(f"/api/v10/guilds/{GUILD_ID}/members/{BOT_ID}", rest(member(BOT_ID)))
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            address['port'] = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return f"127.0.0.1:{address['port']}"
+
+    def rss_mb():
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+    async def connect(mode, host):
+        import yarl
+        from discord.gateway import DiscordWebSocket
+        from discord.http import Route
+
+        Route.BASE = f"http://{host}/api/v10"
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f"ws://{host}/gateway")
+        # Both modes wait this long after the last GUILD_CREATE before READY;
+        # shorten it so the numbers show the chunking cost
+        client = discord.Client(**client_options(mode), guild_ready_timeout=0.2)
+        ready = asyncio.Event()
+
+        @client.event
+        async def on_ready():
+            ready.set()
+
+        gc.collect()
+        baseline = rss_mb()
+        started = time.perf_counter()
+        async with client:
+            await client.login("bench-token")
+            runner = asyncio.create_task(client.connect(reconnect=False))
+            await ready.wait()
+            elapsed = time.perf_counter() - started
+            guild = client.get_guild(GUILD_ID)
+            me = await own_member(client, guild)
+            # Drop it from the cache to exercise the on-demand REST fetch
+            guild._remove_member(me)
+            fetched = await own_member(client, guild)
+            gc.collect()
+            result = {
+                "mode": mode,
+                "ready_seconds": elapsed,
+                "cached_members": len(guild.members),
+                "own_member_refetched": fetched.id == me.id and guild.get_member(me.id) is not None,
+                "rss_delta_mb": rss_mb() - baseline,
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+            await client.close()
+            runner.cancel()
+        print(json.dumps(result))
+
+    if len(sys.argv) == 4 and sys.argv[1] == "--client":
+        asyncio.run(connect(sys.argv[2], sys.argv[3]))
+        sys.exit()
+
+    host = start_fake_discord()
+    print(f"Fake gateway replaying a guild with {MEMBERS:,} members, {ROLES} roles, {CHANNELS} channels")
+    for mode in GATEWAY_MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "price_tracking_agency.price_tracker.tools.discord_gateway",
+             "--client", mode, host],
+            stdout=subprocess.PIPE, text=True, check=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['mode']:>4}: READY after {r['ready_seconds'] * 1000:6.0f}ms, "
+              f"{r['cached_members']:>6} members cached, +{r['rss_delta_mb']:.0f} MiB after READY, "
+              f"peak RSS {r['peak_rss_mb']:.0f} MiB, own member refetched: {r['own_member_refetched']}")
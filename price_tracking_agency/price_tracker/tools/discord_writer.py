@@ -0,0 +1,234 @@
+"""
+Deduplicating, rate-limit aware Discord write scheduler
+"""
+
+__all__ = [
+    'SURFACE_NICKNAME', 'SURFACE_PRESENCE', 'SURFACE_ROLE', 'SURFACE_ALERT',
+    'RateLimitBucket', 'DiscordWriter',
+]
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import discord
+
+from .metrics import DISCORD_RATE_LIMITED, DISCORD_WRITES_SKIPPED, ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Surfaces the bot writes to. Presence belongs to the gateway connection, so
+# it is keyed without a guild.
+SURFACE_NICKNAME = "nickname"  # PATCH /guilds/{guild_id}/members/@me
+SURFACE_PRESENCE = "presence"  # gateway PRESENCE_UPDATE
+SURFACE_ROLE = "role"          # PATCH /guilds/{guild_id}/roles/{role_id}
+SURFACE_ALERT = "alert"        # POST /channels/{channel_id}/messages, keyed by channel or DM user
+
+# Conservative (writes, seconds) limits per route bucket. Guild routes get one
+# bucket per guild, matching Discord's major-parameter bucketing.
+DEFAULT_ROUTE_LIMITS = {
+    SURFACE_NICKNAME: (5, 5.0),
+    SURFACE_ROLE: (5, 5.0),
+    SURFACE_PRESENCE: (5, 60.0),
+    SURFACE_ALERT: (5, 5.0),
+}
+# Discord's global limit is 50 requests per second per bot
+DEFAULT_GLOBAL_LIMIT = (50, 1.0)
+
+WriteKey = Tuple[Optional[int], str]
+
+
+class RateLimitBucket:
+    """
+    Sliding-window limiter allowing at most `rate` acquisitions in any
+    `per`-second window
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._sent: Deque[float] = deque()
+        self._paused_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until an acquisition is allowed"""
+        now = time.monotonic()
+        while self._sent and self._sent[0] <= now - self.per:
+            self._sent.popleft()
+        delay = max(0.0, self._paused_until - now)
+        if len(self._sent) >= self.rate:
+            delay = max(delay, self._sent[0] + self.per - now)
+        return delay
+
+    def pause(self, retry_after: float):
+        """Hold every acquisition for `retry_after` seconds"""
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    async def acquire(self):
+        while True:
+            delay = self.delay()
+            if delay <= 0:
+                self._sent.append(time.monotonic())
+                return
+            await asyncio.sleep(delay)
+
+
+class DiscordWriter:
+    """
+    Applies nickname, presence and role writes without wasting requests.
+
+    Each (guild, surface) remembers the last value applied; submitting the
+    same value again is dropped. Writes queued for the same surface are merged
+    so only the latest value is sent, after a short debounce. Sends wait on a
+    per-route bucket and the global bucket, so fanning out over many guilds
+    stays under Discord's limits instead of relying on 429 retries.
+    """
+
+    def __init__(self, route_limits: Optional[Dict[str, Tuple[int, float]]] = None,
+                 global_limit: Tuple[int, float] = DEFAULT_GLOBAL_LIMIT,
+                 debounce: float = 0.25):
+        self.route_limits = dict(DEFAULT_ROUTE_LIMITS, **(route_limits or {}))
+        self.debounce = debounce
+        self._global = RateLimitBucket(*global_limit)
+        self._buckets: Dict[WriteKey, RateLimitBucket] = {}
+        self._applied: Dict[WriteKey, Any] = {}
+        self._pending: Dict[WriteKey, Tuple[Any, Callable[[Any], Awaitable[Any]]]] = {}
+        self._workers: Dict[WriteKey, asyncio.Task] = {}
+        self.sent = 0
+        self.skipped = 0
+        self.merged = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def submit(self, guild_id: Optional[int], surface: str, value: Any,
+               apply: Callable[[Any], Awaitable[Any]]) -> bool:
+        """
+        Queue `apply(value)` for a surface. Returns False if the write was
+        dropped because `value` is already applied.
+        """
+        key = (guild_id, surface)
+        if key in self._pending:
+            # A newer value replaces the one still waiting to be sent
+            self.merged += 1
+            DISCORD_WRITES_SKIPPED.inc(surface=surface, reason="merged")
+        elif self._applied.get(key) == value:
+            self.skipped += 1
+            DISCORD_WRITES_SKIPPED.inc(surface=surface, reason="unchanged")
+            return False
+
+        self._pending[key] = (value, apply)
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return True
+
+    def last_applied(self, guild_id: Optional[int], surface: str) -> Any:
+        return self._applied.get((guild_id, surface))
+
+    def applied(self) -> Dict[WriteKey, Any]:
+        """Snapshot of every value applied so far"""
+        return dict(self._applied)
+
+    def restore(self, applied: Dict[WriteKey, Any]):
+        """Seed applied values, e.g. from a snapshot taken before a restart"""
+        self._applied.update(applied)
+
+    def invalidate(self, guild_id: Optional[int], surface: Optional[str] = None):
+        """Forget applied values, e.g. after the bot rejoins a guild"""
+        for key in list(self._applied):
+            if key[0] == guild_id and (surface is None or key[1] == surface):
+                del self._applied[key]
+
+    async def acquire(self, guild_id: Optional[int], surface: str):
+        """Wait for a slot in a surface's route bucket and the global bucket, for requests a write needs first"""
+        await self._bucket((guild_id, surface)).acquire()
+        await self._global.acquire()
+
+    async def flush(self):
+        """Wait until every queued write has been sent or dropped"""
+        while self._workers:
+            workers = list(self._workers.values())
+            await asyncio.gather(*workers, return_exceptions=True)
+            for key, worker in list(self._workers.items()):
+                if worker.done():
+                    del self._workers[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "merged": self.merged,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+        }
+
+    def _bucket(self, key: WriteKey) -> RateLimitBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = RateLimitBucket(*self.route_limits[key[1]])
+            self._buckets[key] = bucket
+        return bucket
+
+    async def _drain(self, key: WriteKey):
+        await asyncio.sleep(self.debounce)
+        bucket = self._bucket(key)
+        while key in self._pending:
+            await self.acquire(*key)
+
+            # Take the latest value only once we are allowed to send it
+            value, apply = self._pending.pop(key)
+            if self._applied.get(key) == value:
+                self.skipped += 1
+                DISCORD_WRITES_SKIPPED.inc(surface=key[1], reason="unchanged")
+                continue
+            try:
+                with STAGE_SECONDS.time(stage=key[1]):
+                    await apply(value)
+            except discord.HTTPException as e:
+                self.failed += 1
+                ERRORS.inc(stage=key[1])
+                if e.status == 429:
+                    self.rate_limited += 1
+                    DISCORD_RATE_LIMITED.inc(surface=key[1])
+                    bucket.pause(float(getattr(e.response, 'headers', {}).get('Retry-After', bucket.per)))
+                logger.warning(f"Discord {key[1]} write failed for guild {key[0]}: {e}")
+            except Exception as e:
+                self.failed += 1
+                ERRORS.inc(stage=key[1])
+                logger.warning(f"Discord {key[1]} write failed for guild {key[0]}: {e}")
+            else:
+                self._applied[key] = value
+                self.sent += 1
+
+
+# Add a test case
+if __name__ == "__main__":
+    GUILDS = 200
+
+    async def main():
+        writer = DiscordWriter(route_limits={SURFACE_NICKNAME: (2, 1.0)}, global_limit=(50, 1.0),
+                               debounce=0.05)
+        sent_at = []
+
+        async def fake_edit(value):
+            sent_at.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        # Three ticks with a burst of prices per guild: only the last value per
+        # guild should be written, and the repeat tick should write nothing
+        for price in ("PDT $0.0410", "PDT $0.0420", "PDT $0.0421"):
+            for guild_id in range(GUILDS):
+                writer.submit(guild_id, SURFACE_NICKNAME, price, fake_edit)
+        await writer.flush()
+        for guild_id in range(GUILDS):
+            writer.submit(guild_id, SURFACE_NICKNAME, "PDT $0.0421", fake_edit)
+        await writer.flush()
+
+        busiest = max(sum(1 for t in sent_at if s <= t < s + 1.0) for s in sent_at)
+        print(f"{writer.stats()} in {time.monotonic() - started:.2f}s, "
+              f"busiest second: {busiest} writes (global limit 50)")
+
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+Logging setup with structured fields and a switch to turn it off
+"""
+
+__all__ = ['StructuredFormatter', 'configure_logging']
+
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats the fields passed with `extra=` along with the message: as
+    trailing key=value pairs, or as one JSON object per line when `json_lines`
+    is set.
+    """
+
+    def __init__(self, json_lines: bool = False):
+        super().__init__(LOG_FORMAT)
+        self.json_lines = json_lines
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        fields = _fields(record)
+        line = super().formatMessage(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not self.json_lines:
+            return super().format(record)
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """
+    Route every logger through one structured handler.
+
+    `level` defaults to `$LOG_LEVEL` (INFO, or DEBUG when DEBUG=1); "OFF"
+    silences logging entirely. `fmt` defaults to `$LOG_FORMAT`: "text" or "json".
+    """
+    level = (level or os.getenv("LOG_LEVEL") or ("DEBUG" if os.getenv("DEBUG") == "1" else "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT") or "text").lower()
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Unknown LOG_FORMAT {fmt!r}, expected 'text' or 'json'")
+
+    root = logging.getLogger()
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_lines=fmt == "json"))
+    root.handlers[:] = [handler]
+    root.setLevel(logging.CRITICAL + 1 if level == "OFF" else level)
+
+
+# Add a test case
+if __name__ == "__main__":
+    for fmt in ("text", "json"):
+        configure_logging("INFO", fmt)
+        logging.getLogger("price_tracker").info(
+            "Price update", extra={"token": "PDT", "price": 0.0421, "change_24h": 3.5})
+    configure_logging("OFF")
+    logging.getLogger("price_tracker").warning("not shown")
@@ -0,0 +1,322 @@
+"""
+On-chain token pricing from liquidity pool state via batched Multicall3 reads
+"""
+
+__all__ = [
+    'MULTICALL3_ADDRESS', 'ETH_USD_FEED_BASE', 'SYNC_TOPIC', 'SWAP_V3_TOPIC',
+    'PoolMetadata', 'OnChainPriceEngine', 'OnChainPriceSource', 'engines_from_config', 'close_engines',
+]
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector, keccak, to_checksum_address
+from web3 import AsyncWeb3
+
+from .metrics import STAGE_SECONDS
+from .price_source import PriceQuote, PriceSource
+from .rpc_pool import build_web3
+from .tracker_config import ETH_USD_FEED_BASE, TrackerConfig
+
+logger = logging.getLogger(__name__)
+
+# Multicall3 is deployed at the same address on every major EVM chain, Base included
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+POOL_V2 = "v2"
+POOL_V3 = "v3"
+
+Call = Tuple[str, bytes]
+
+
+def _selector(signature: str) -> bytes:
+    return function_signature_to_4byte_selector(signature)
+
+
+AGGREGATE3 = _selector("aggregate3((address,bool,bytes)[])")
+TOKEN0 = _selector("token0()")
+TOKEN1 = _selector("token1()")
+DECIMALS = _selector("decimals()")
+GET_RESERVES = _selector("getReserves()")
+SLOT0 = _selector("slot0()")
+LATEST_ROUND_DATA = _selector("latestRoundData()")
+
+# Pool events carrying the post-swap state: V2 pools emit Sync with the new
+# reserves on every swap, V3 pools put the new sqrtPriceX96 in Swap itself
+SYNC_TOPIC = "0x" + keccak(text="Sync(uint112,uint112)").hex()
+SWAP_V3_TOPIC = "0x" + keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex()
+
+
+@dataclass(frozen=True)
+class PoolMetadata:
+    """Immutable pool facts, read once and cached"""
+    token0: str
+    token1: str
+    decimals0: int
+    decimals1: int
+    feed_decimals: Optional[int]
+
+
+class OnChainPriceEngine:
+    """
+    Prices a token in USD from its liquidity pool.
+
+    Each tick reads the pool's reserves (Uniswap V2 style `getReserves`) or
+    `slot0` (V3 style) together with the quote asset's Chainlink USD price in
+    a single Multicall3 `eth_call`, then computes the price locally. Token
+    order and decimals never change, so they are read on the first call only.
+    When `quote_feed` is None the quote asset is treated as a USD stablecoin.
+    """
+
+    def __init__(self, w3: AsyncWeb3, token: str, pool: str, pool_version: str = POOL_V2,
+                 quote_feed: Optional[str] = ETH_USD_FEED_BASE,
+                 multicall: str = MULTICALL3_ADDRESS):
+        if pool_version not in (POOL_V2, POOL_V3):
+            raise ValueError(f"Unsupported pool version {pool_version!r}, expected 'v2' or 'v3'")
+        self.w3 = w3
+        self.token = to_checksum_address(token)
+        self.pool = to_checksum_address(pool)
+        self.pool_version = pool_version
+        self.quote_feed = to_checksum_address(quote_feed) if quote_feed else None
+        self.multicall = to_checksum_address(multicall)
+        self._metadata: Optional[PoolMetadata] = None
+
+    async def _aggregate(self, calls: Sequence[Call]) -> List[bytes]:
+        """Run `calls` in one eth_call to Multicall3, failing if any call reverts"""
+        data = AGGREGATE3 + encode(
+            ['(address,bool,bytes)[]'],
+            [[(target, False, call_data) for target, call_data in calls]],
+        )
+        raw = await self.w3.eth.call({'to': self.multicall, 'data': data})
+        (results,) = decode(['(bool,bytes)[]'], bytes(raw))
+        return [return_data for _, return_data in results]
+
+    async def metadata(self) -> PoolMetadata:
+        if self._metadata is None:
+            token0_raw, token1_raw = await self._aggregate([(self.pool, TOKEN0), (self.pool, TOKEN1)])
+            token0 = to_checksum_address(decode(['address'], token0_raw)[0])
+            token1 = to_checksum_address(decode(['address'], token1_raw)[0])
+            if self.token not in (token0, token1):
+                raise ValueError(f"Pool {self.pool} does not contain token {self.token}")
+
+            calls = [(token0, DECIMALS), (token1, DECIMALS)]
+            if self.quote_feed:
+                calls.append((self.quote_feed, DECIMALS))
+            results = await self._aggregate(calls)
+            decimals = [decode(['uint8'], raw)[0] for raw in results]
+            self._metadata = PoolMetadata(
+                token0=token0,
+                token1=token1,
+                decimals0=decimals[0],
+                decimals1=decimals[1],
+                feed_decimals=decimals[2] if self.quote_feed else None,
+            )
+            logger.info(f"Cached pool metadata for {self.pool}: {self._metadata}")
+        return self._metadata
+
+    @property
+    def log_topic(self) -> str:
+        """Topic of the pool event that carries its new price"""
+        return SYNC_TOPIC if self.pool_version == POOL_V2 else SWAP_V3_TOPIC
+
+    def _state_price(self, meta: PoolMetadata, reserve0: int = 0, reserve1: int = 0,
+                     sqrt_price_x96: int = 0) -> Fraction:
+        """Price of token0 denominated in token1, adjusted for decimals"""
+        scale = Fraction(10 ** meta.decimals0, 10 ** meta.decimals1)
+        if self.pool_version == POOL_V2:
+            if reserve0 == 0:
+                raise ValueError(f"Pool {self.pool} has no liquidity")
+            return Fraction(reserve1, reserve0) * scale
+        if sqrt_price_x96 == 0:
+            raise ValueError(f"Pool {self.pool} is not initialized")
+        return Fraction(sqrt_price_x96 ** 2, 2 ** 192) * scale
+
+    def _pool_price(self, meta: PoolMetadata, pool_raw: bytes) -> Fraction:
+        """Price of token0 in token1 from `getReserves` or `slot0` return data"""
+        if self.pool_version == POOL_V2:
+            reserve0, reserve1, _ = decode(['uint112', 'uint112', 'uint32'], pool_raw)
+            return self._state_price(meta, reserve0=reserve0, reserve1=reserve1)
+        return self._state_price(meta, sqrt_price_x96=decode(['uint160'], pool_raw[:32])[0])
+
+    def _feed_price(self, meta: PoolMetadata, feed_raw: bytes) -> Fraction:
+        _, answer, _, _, _ = decode(['uint80', 'int256', 'uint256', 'uint256', 'uint80'], feed_raw)
+        if answer <= 0:
+            raise ValueError(f"Quote feed {self.quote_feed} returned invalid answer {answer}")
+        return Fraction(answer, 10 ** meta.feed_decimals)
+
+    def _usd_price(self, meta: PoolMetadata, price0_in_1: Fraction, quote_usd: Fraction) -> float:
+        price_in_quote = price0_in_1 if self.token == meta.token0 else 1 / price0_in_1
+        return float(price_in_quote * quote_usd)
+
+    async def get_price(self) -> float:
+        """Current USD price of the token"""
+        meta = await self.metadata()
+        calls = [(self.pool, GET_RESERVES if self.pool_version == POOL_V2 else SLOT0)]
+        if self.quote_feed:
+            calls.append((self.quote_feed, LATEST_ROUND_DATA))
+        results = await self._aggregate(calls)
+
+        with STAGE_SECONDS.time(stage="parse"):
+            quote_usd = self._feed_price(meta, results[1]) if self.quote_feed else Fraction(1)
+            return self._usd_price(meta, self._pool_price(meta, results[0]), quote_usd)
+
+    async def quote_usd(self) -> Fraction:
+        """USD price of the pool's quote asset, 1 when it is a stablecoin"""
+        meta = await self.metadata()
+        if not self.quote_feed:
+            return Fraction(1)
+        (feed_raw,) = await self._aggregate([(self.quote_feed, LATEST_ROUND_DATA)])
+        return self._feed_price(meta, feed_raw)
+
+    def price_from_log(self, data: bytes, quote_usd: Fraction) -> float:
+        """
+        USD price from the data of a Sync (V2) or Swap (V3) log of this pool.
+        Needs metadata() to have been read.
+        """
+        meta = self._metadata
+        if meta is None:
+            raise RuntimeError("Pool metadata must be read before decoding logs")
+        if self.pool_version == POOL_V2:
+            reserve0, reserve1 = decode(['uint112', 'uint112'], data)
+            price0_in_1 = self._state_price(meta, reserve0=reserve0, reserve1=reserve1)
+        else:
+            _, _, sqrt_price_x96, _, _ = decode(['int256', 'int256', 'uint160', 'uint128', 'int24'], data)
+            price0_in_1 = self._state_price(meta, sqrt_price_x96=sqrt_price_x96)
+        return self._usd_price(meta, price0_in_1, quote_usd)
+
+
+class OnChainPriceSource(PriceSource):
+    """
+    PriceSource over one OnChainPriceEngine per contract. Pool state has no
+    24h history, so quotes carry no 24h change.
+    """
+
+    def __init__(self, engines: Dict[str, OnChainPriceEngine]):
+        self.engines = {contract.lower(): engine for contract, engine in engines.items()}
+
+    async def fetch_many(self, contracts: Iterable[str]) -> Dict[str, PriceQuote]:
+        addresses = [c.lower() for c in contracts if c.lower() in self.engines]
+        prices = await asyncio.gather(
+            *(self.engines[address].get_price() for address in addresses),
+            return_exceptions=True,
+        )
+        quotes = {}
+        for address, price in zip(addresses, prices):
+            if isinstance(price, Exception):
+                logger.warning(f"On-chain price read failed for {address}: {price}")
+                continue
+            quotes[address] = PriceQuote(price=price, change_24h=None)
+        return quotes
+
+    async def close(self):
+        await close_engines(self.engines.values())
+
+
+async def close_engines(engines: Iterable[OnChainPriceEngine]):
+    """Close the HTTP sessions of the engines' web3 providers"""
+    providers = {id(engine.w3.provider): engine.w3.provider for engine in engines}
+    for provider in providers.values():
+        disconnect = getattr(provider, "disconnect", None)
+        if disconnect is not None:
+            await disconnect()
+
+
+def engines_from_config(config: TrackerConfig, w3: Optional[AsyncWeb3] = None) -> Dict[str, OnChainPriceEngine]:
+    """One engine per token with a pool in the tracker config, keyed by contract"""
+    w3 = w3 or build_web3()
+    return {
+        config.tokens[symbol].contract: OnChainPriceEngine(
+            w3, config.tokens[symbol].contract, pool.address, pool.version,
+            quote_feed=pool.quote_feed,
+        )
+        for symbol, pool in config.pools.items()
+    }
+
+
+# Add a test case
+if __name__ == "__main__":
+    import math
+    import threading
+
+    from aiohttp import web
+
+    # A local JSON-RPC stand-in for Base: it understands eth_call to Multicall3
+    # and answers the pool, token and feed reads from fixed state, so the
+    # engine can be exercised without any network access.
+    PDT = to_checksum_address("0x375488f097176507e39b9653b88fdc52cde736bf")
+    WETH = to_checksum_address("0x4200000000000000000000000000000000000006")
+    V2_POOL = to_checksum_address("0x" + "11" * 20)
+    V3_POOL = to_checksum_address("0x" + "22" * 20)
+    FEED = to_checksum_address("0x" + "33" * 20)
+    ETH_USD = 3000
+    PDT_PER_ETH = 60000  # 1 PDT = 0.05 USD
+
+    # token0 = PDT (lower address), token1 = WETH; V3 price is token1 per token0
+    sqrt_price = math.isqrt(2 ** 192 // PDT_PER_ETH)
+
+    STATE = {
+        (V2_POOL, TOKEN0): encode(['address'], [PDT]),
+        (V2_POOL, TOKEN1): encode(['address'], [WETH]),
+        (V2_POOL, GET_RESERVES): encode(['uint112', 'uint112', 'uint32'],
+                                        [PDT_PER_ETH * 100 * 10 ** 18, 100 * 10 ** 18, 0]),
+        (V3_POOL, TOKEN0): encode(['address'], [PDT]),
+        (V3_POOL, TOKEN1): encode(['address'], [WETH]),
+        (V3_POOL, SLOT0): encode(['uint160', 'int24', 'uint16', 'uint16', 'uint16', 'uint8', 'bool'],
+                                 [sqrt_price, 0, 0, 1, 1, 0, True]),
+        (PDT, DECIMALS): encode(['uint8'], [18]),
+        (WETH, DECIMALS): encode(['uint8'], [18]),
+        (FEED, DECIMALS): encode(['uint8'], [8]),
+        (FEED, LATEST_ROUND_DATA): encode(['uint80', 'int256', 'uint256', 'uint256', 'uint80'],
+                                          [1, ETH_USD * 10 ** 8, 0, 0, 1]),
+    }
+    eth_calls = []
+
+    async def rpc(request):
+        body = await request.json()
+        if body['method'] == 'eth_chainId':
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': '0x2105'})
+        tx = body['params'][0]
+        eth_calls.append(tx)
+        data = bytes.fromhex(tx.get('data', tx.get('input'))[2:])
+        assert data[:4] == AGGREGATE3
+        (calls,) = decode(['(address,bool,bytes)[]'], data[4:])
+        results = [(True, STATE[(to_checksum_address(target), call_data[:4])])
+                   for target, _, call_data in calls]
+        result = encode(['(bool,bytes)[]'], [results])
+        return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': '0x' + result.hex()})
+
+    def start_node():
+        ready = threading.Event()
+        address = {}
+
+        async def serve():
+            app = web.Application()
+            app.router.add_post("/", rpc)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            address['port'] = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{address['port']}/"
+
+    async def main(url):
+        w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(url))
+        for pool, version in ((V2_POOL, POOL_V2), (V3_POOL, POOL_V3)):
+            engine = OnChainPriceEngine(w3, PDT, pool, version, quote_feed=FEED)
+            eth_calls.clear()
+            first = await engine.get_price()
+            after_first = len(eth_calls)
+            second = await engine.get_price()
+            print(f"{version}: ${first:.6f} then ${second:.6f} "
+                  f"({after_first} eth_calls cold, {len(eth_calls) - after_first} warm)")
+
+    asyncio.run(main(start_node()))
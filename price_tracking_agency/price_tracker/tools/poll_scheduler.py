@@ -0,0 +1,338 @@
+"""
+Adaptive polling: volatility-driven intervals within bounds and a quota
+budget, with Retry-After aware backoff
+"""
+
+__all__ = ['DEFAULT_POLL_QUOTA', 'RateLimitedError', 'retry_after_from', 'PollPolicy', 'PollScheduler',
+           'retime_loop']
+
+import math
+import os
+import random
+import time
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+# Price polls per day from_env allows unless POLL_QUOTA says otherwise,
+# below the 288 of a fixed 5 minute interval
+DEFAULT_POLL_QUOTA = 250
+
+
+class RateLimitedError(RuntimeError):
+    """A request was refused until `retry_after` seconds from now"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from(error: BaseException) -> Optional[float]:
+    """
+    Seconds the server asked us to wait, from a RateLimitedError or an HTTP
+    429 error carrying a Retry-After header (aiohttp, discord.py)
+    """
+    if isinstance(error, RateLimitedError):
+        return error.retry_after
+    status = getattr(error, "status", None)
+    if status != 429:
+        return None
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return _parse_retry_after(headers.get("Retry-After")) if headers is not None else None
+
+
+@dataclass(frozen=True)
+class PollPolicy:
+    """
+    Bounds and budget for PollScheduler.
+
+    The interval aims for about `target_move_pct` of expected price movement
+    between polls, clamped to [min_interval, max_interval]. A move can only
+    be seen at the next poll, so stretching past `base_interval` while the
+    price is flat saves quota but delays the first poll after it starts
+    moving; with `max_interval` at `base_interval` and no quota, moves show
+    up at least as fast as with a fixed `base_interval`. With `quota` set,
+    at most `quota` polls happen in any `quota_window` seconds; up to
+    `quota_burst` of the quota can be spent faster than the average pace.
+    """
+    base_interval: float = 300.0
+    min_interval: float = 60.0
+    max_interval: float = 900.0
+    target_move_pct: float = 0.25
+    quota: Optional[int] = None
+    quota_window: float = 24 * 3600.0
+    quota_burst: float = 0.1
+    backoff_base: float = 5.0
+    # How fast the volatility estimate decays once the price calms down
+    alpha: float = 0.3
+
+    @classmethod
+    def from_env(cls, base_interval: float = 300.0) -> "PollPolicy":
+        """
+        Policy from POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_TARGET_MOVE_PCT,
+        POLL_QUOTA (DEFAULT_POLL_QUOTA when unset, 0 for none) and
+        POLL_QUOTA_WINDOW. POLL_ADAPTIVE=0 pins the interval to
+        `base_interval` without a quota (backoff still applies).
+        """
+        policy = cls(base_interval=base_interval)
+        if os.getenv("POLL_ADAPTIVE", "1") == "0":
+            return replace(policy, min_interval=base_interval, max_interval=base_interval)
+        quota = int(os.getenv("POLL_QUOTA", DEFAULT_POLL_QUOTA))
+        policy = replace(
+            policy,
+            min_interval=float(os.getenv("POLL_MIN_INTERVAL", policy.min_interval)),
+            max_interval=float(os.getenv("POLL_MAX_INTERVAL", policy.max_interval)),
+            target_move_pct=float(os.getenv("POLL_TARGET_MOVE_PCT", policy.target_move_pct)),
+            quota=quota if quota > 0 else None,
+            quota_window=float(os.getenv("POLL_QUOTA_WINDOW", policy.quota_window)),
+        )
+        if not 0 < policy.min_interval <= policy.max_interval:
+            raise ValueError("POLL_MIN_INTERVAL must be positive and at most POLL_MAX_INTERVAL")
+        return policy
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next price poll.
+
+    Volatility is the variance of log returns per second, tracked per token:
+    it jumps straight to the latest return when that one is larger and
+    otherwise decays as an exponentially weighted average, so a sudden move
+    shortens the interval at the next poll. The most volatile token sets the
+    pace. After failures the delay backs off exponentially with jitter and
+    never undercuts a server's Retry-After. The quota is a token bucket sized
+    so the budget holds over any window. Pure bookkeeping: callers pass
+    `now` (any monotonic clock) and do the sleeping.
+    """
+
+    def __init__(self, policy: Optional[PollPolicy] = None, rng: Optional[random.Random] = None):
+        self.policy = policy or PollPolicy()
+        self.rng = rng or random.Random()
+        self.failures = 0
+        self.polls = 0
+        self._retry_after = 0.0
+        self._last: Dict[str, Tuple[float, float]] = {}
+        self._variance: Dict[str, float] = {}
+        quota = self.policy.quota
+        if quota:
+            self._capacity = max(1.0, quota * self.policy.quota_burst)
+            self._refill = max(quota - self._capacity, 1.0) / self.policy.quota_window
+            self._tokens = self._capacity
+        self._tokens_at: Optional[float] = None
+
+    def _spend(self, now: float):
+        self.polls += 1
+        if not self.policy.quota:
+            return
+        self._tokens = self._available(now) - 1.0
+        self._tokens_at = now
+
+    def _available(self, now: float) -> float:
+        if self._tokens_at is None:
+            return self._tokens
+        return min(self._capacity, self._tokens + (now - self._tokens_at) * self._refill)
+
+    def record_success(self, prices: Mapping[str, float], now: Optional[float] = None):
+        """Account for a successful poll that returned `prices` per token"""
+        now = now if now is not None else time.monotonic()
+        self._spend(now)
+        self.failures = 0
+        self._retry_after = 0.0
+        alpha = self.policy.alpha
+        for token, price in prices.items():
+            if price <= 0:
+                continue
+            last = self._last.get(token)
+            self._last[token] = (now, price)
+            if last is None or now <= last[0]:
+                continue
+            sample = math.log(price / last[1]) ** 2 / (now - last[0])
+            previous = self._variance.get(token)
+            self._variance[token] = sample if previous is None else max(
+                sample, alpha * sample + (1 - alpha) * previous)
+
+    def record_failure(self, retry_after: Optional[float] = None, now: Optional[float] = None):
+        """Account for a failed poll, optionally with the server's Retry-After"""
+        now = now if now is not None else time.monotonic()
+        self._spend(now)
+        self.failures += 1
+        self._retry_after = retry_after or 0.0
+
+    def volatility_interval(self) -> float:
+        """Interval for the current volatility alone, within the policy bounds"""
+        policy = self.policy
+        if not self._variance:
+            interval = policy.base_interval
+        else:
+            variance = max(self._variance.values())
+            target = policy.target_move_pct / 100
+            interval = target * target / variance if variance > 0 else policy.max_interval
+        return min(policy.max_interval, max(policy.min_interval, interval))
+
+    def next_delay(self, now: Optional[float] = None) -> float:
+        """Seconds from `now` until the next poll should start"""
+        now = now if now is not None else time.monotonic()
+        if self.failures:
+            # Equal jitter: at least half the exponential step, capped at max_interval
+            step = min(self.policy.max_interval, self.policy.backoff_base * 2 ** (self.failures - 1))
+            delay = max(step / 2 + self.rng.uniform(0, step / 2), self._retry_after)
+        else:
+            delay = self.volatility_interval()
+        if self.policy.quota:
+            missing = 1.0 - self._available(now)
+            if missing > 0:
+                delay = max(delay, missing / self._refill)
+        return delay
+
+
+def retime_loop(loop, delay: float) -> Optional[float]:
+    """
+    From inside a running discord.ext.tasks.Loop iteration, schedule the
+    next one `delay` seconds after this one's scheduled start. The loop
+    sleeps until that absolute time, so slow iterations do not push later
+    ones back. An iteration that overran its slot is followed `delay`
+    seconds after now instead of immediately, so an overrun never turns
+    into back-to-back polls. Returns the next start as a Unix timestamp.
+    """
+    if not loop.is_running():
+        return None
+    loop.change_interval(seconds=delay)
+    if loop.next_iteration is None:
+        return None
+    behind = time.time() - loop.next_iteration.timestamp()
+    if behind > 0:
+        loop.change_interval(seconds=2 * delay + behind)
+    return loop.next_iteration.timestamp()
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Simulated-clock tests: replay price series second by second, poll when
+    # the scheduler says so, and check quota use and how quickly a move shows
+    # up, against the old fixed 300s interval.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.poll_scheduler
+    import statistics
+
+    DAY = 24 * 3600
+    SHOW_MOVE = 0.01  # a displayed price more than 1% off counts as stale
+
+    def replay_series(seed: int, days: int = 3):
+        """1s random walk: calm, with an hour of turbulence every ~8 hours and one sudden 5% jump"""
+        rng = random.Random(seed)
+        price, series = 0.0421, []
+        for t in range(days * DAY):
+            turbulent = (t // 3600) % 8 == 3
+            price *= math.exp(rng.gauss(0, 0.0004 if turbulent else 0.00002))
+            if t == DAY + 7 * 3600:
+                price *= 1.05
+            series.append(price)
+        return series
+
+    def simulate(series, scheduler, fail_at=(), retry_after=120.0):
+        """Poll on a simulated clock; returns polls, stale seconds and reaction latencies"""
+        shown = None
+        next_poll = 0.0
+        stale_since = None
+        stale_seconds = 0
+        reactions = []
+        for t, price in enumerate(series):
+            if t >= next_poll:
+                scheduled = next_poll
+                if t in fail_at:
+                    scheduler.record_failure(retry_after, now=t)
+                else:
+                    scheduler.record_success({"PDT": price}, now=t)
+                    shown = price
+                    if stale_since is not None:
+                        reactions.append(t - stale_since)
+                        stale_since = None
+                # Anchor on the scheduled start so a late poll does not push later ones back
+                next_poll = max(t, scheduled + scheduler.next_delay(now=t))
+            if shown is not None and abs(price / shown - 1) > SHOW_MOVE:
+                stale_seconds += 1
+                if stale_since is None:
+                    stale_since = t
+        return scheduler.polls, stale_seconds, reactions
+
+    def p95(reactions):
+        return sorted(reactions)[int(0.95 * (len(reactions) - 1))] if reactions else 0
+
+    def describe(label, polls, stale, reactions, days):
+        mean = statistics.mean(reactions) if reactions else 0
+        print(f"{label:>22}: {polls / days:6.0f} polls/day, {stale:6d}s stale, "
+              f"reaction mean {mean:5.0f}s p95 {p95(reactions):4.0f}s over {len(reactions)} moves")
+
+    days = 3
+    fixed_policy = PollPolicy(min_interval=300, max_interval=300)
+    for seed in (1, 2):
+        series = replay_series(seed, days)
+        fixed = simulate(series, PollScheduler(fixed_policy, random.Random(0)))
+        # The default trades reaction time for a budget below the fixed rate
+        default = PollPolicy(quota=DEFAULT_POLL_QUOTA, quota_window=DAY)
+        default_run = simulate(series, PollScheduler(default, random.Random(0)))
+        # Opt-in: never stretch past the fixed interval and spend polls on the moves
+        responsive = simulate(series, PollScheduler(PollPolicy(max_interval=300), random.Random(0)))
+        print(f"series {seed}:")
+        describe("fixed 300s", *fixed, days)
+        describe(f"default 60-900s, {DEFAULT_POLL_QUOTA}/day", *default_run, days)
+        describe("responsive 60-300s", *responsive, days)
+
+        # Quota: never more than DEFAULT_POLL_QUOTA polls in any 24h window
+        polls_at = []
+        scheduler = PollScheduler(default, random.Random(0))
+        next_poll = 0.0
+        for t, price in enumerate(series):
+            if t >= next_poll:
+                scheduler.record_success({"PDT": price}, now=t)
+                polls_at.append(t)
+                next_poll = t + scheduler.next_delay(now=t)
+        busiest = max(sum(1 for p in polls_at if start <= p < start + DAY) for start in polls_at)
+        assert busiest <= DEFAULT_POLL_QUOTA, busiest
+        assert len(polls_at) < len(series) / 300, (len(polls_at), days)
+        # Opt-in is stale for less time than the fixed interval, and every move shows up at least as fast
+        assert responsive[1] < fixed[1], (responsive, fixed)
+        assert statistics.mean(responsive[2]) <= statistics.mean(fixed[2]), (responsive[2], fixed[2])
+        assert p95(responsive[2]) <= p95(fixed[2]), (responsive[2], fixed[2])
+
+    # A burst of 429s with Retry-After: 120 during the turbulent hour
+    burst = range(3 * 3600, 3 * 3600 + 900)
+    failed = []
+
+    class Recording(PollScheduler):
+        def record_failure(self, retry_after=None, now=None):
+            failed.append(now)
+            super().record_failure(retry_after, now)
+
+    simulate(replay_series(1, 1), Recording(PollPolicy(), random.Random(0)), fail_at=set(burst))
+    gaps = [b - a for a, b in zip(failed, failed[1:])]
+    assert failed and all(gap >= 120 for gap in gaps), gaps
+    print(f"429 burst: {len(failed)} refused polls in 15 minutes, gaps {gaps}s")
+
+    # Backoff honours Retry-After and grows with jitter, then resets on success
+    scheduler = PollScheduler(PollPolicy(), random.Random(0))
+    scheduler.record_failure(retry_after=90, now=0)
+    assert scheduler.next_delay(now=0) >= 90
+    delays = []
+    for i in range(1, 8):
+        scheduler.record_failure(now=i)
+        delays.append(scheduler.next_delay(now=i))
+    steps = [min(PollPolicy().max_interval, 5 * 2 ** n) for n in range(1, 8)]
+    assert all(step / 2 <= d <= step for step, d in zip(steps, delays)), delays
+    scheduler.record_success({"PDT": 1.0}, now=10)
+    assert scheduler.next_delay(now=10) == PollPolicy().base_interval
+    print(f"backoff after failures: {[round(d) for d in delays]}s, Retry-After 90s honoured")
@@ -0,0 +1,355 @@
+"""
+Concurrent multi-source price aggregation with hedged requests
+"""
+
+__all__ = ['SourceHealth', 'PriceAggregator', 'build_price_source']
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .metrics import SOURCE_FAILURES, SOURCE_SECONDS
+from .poll_scheduler import RateLimitedError, retry_after_from
+from .price_source import CoinGeckoPriceSource, DexScreenerPriceSource, PriceQuote, PriceSource
+from .tracker_config import TrackerConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SourceHealth:
+    """Rolling health of one price source"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.score = 1.0
+        self.latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.outliers = 0
+
+    def _observe(self, outcome: float):
+        self.score = (1 - self.alpha) * self.score + self.alpha * outcome
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self._observe(1.0)
+        self.latency = latency if self.latency is None else (
+            (1 - self.alpha) * self.latency + self.alpha * latency)
+
+    def record_failure(self):
+        self.failures += 1
+        self._observe(0.0)
+
+    def record_unfinished(self, elapsed: float):
+        # Cancelled before answering: no verdict on the source, but it was at
+        # least `elapsed` slow, which only ever raises its latency
+        if self.latency is None or elapsed > self.latency:
+            self.latency = elapsed if self.latency is None else (
+                (1 - self.alpha) * self.latency + self.alpha * elapsed)
+
+    def record_outlier(self):
+        # The request worked but the price was wrong: undo the success credit
+        self.outliers += 1
+        self._observe(0.0)
+
+    def __repr__(self):
+        latency = f"{self.latency * 1000:.0f}ms" if self.latency is not None else "n/a"
+        return (f"SourceHealth(score={self.score:.2f}, latency={latency}, ok={self.successes}, "
+                f"failed={self.failures}, outliers={self.outliers})")
+
+
+class PriceAggregator(PriceSource):
+    """
+    Combines several price sources into one.
+
+    Each tick starts the `quorum` healthiest sources. If they have not
+    answered after `hedge_delay`, or one fails, or their prices disagree by
+    more than `max_deviation`, the next healthiest source is started as a
+    hedge. The tick completes as soon as every contract has `quorum` agreeing
+    prices, and stragglers are cancelled; a cancelled straggler counts as
+    slow, not as failed. Once every source has been started, the tick waits
+    one more `hedge_delay` and then settles on the answers it has. Every
+    source has its own `source_deadline` and the whole tick is bounded by
+    `deadline`, so one slow or broken source never holds up the update.
+
+    Per contract, the price is the median after dropping prices more than
+    `max_deviation` away from it. With only two disagreeing prices, the one
+    closest to the last combined price wins (the healthier source's on the
+    first tick). The 24h change is the median of the changes the kept
+    sources report.
+
+    A source that answers 429 sits out ticks until its Retry-After has
+    passed; when every source is sitting out, the tick raises
+    RateLimitedError with the shortest wait.
+    """
+
+    def __init__(self, sources: Dict[str, PriceSource], quorum: int = 2,
+                 hedge_delay: float = 1.0, source_deadline: float = 5.0,
+                 deadline: float = 8.0, max_deviation: float = 0.05):
+        if not sources:
+            raise ValueError("PriceAggregator needs at least one source")
+        self.sources = sources
+        self.quorum = quorum
+        self.hedge_delay = hedge_delay
+        self.source_deadline = source_deadline
+        self.deadline = deadline
+        self.max_deviation = max_deviation
+        self.health = {name: SourceHealth() for name in sources}
+        self._last: Dict[str, float] = {}
+        self._cooldown: Dict[str, float] = {}
+
+    def ranked(self) -> List[str]:
+        """Source names, healthiest and fastest first"""
+        return sorted(self.sources, key=lambda name: (
+            -self.health[name].score, self.health[name].latency or 0.0))
+
+    async def _call(self, name: str, contracts: List[str]) -> Tuple[str, Optional[Dict[str, PriceQuote]]]:
+        started = time.monotonic()
+        try:
+            quotes = await asyncio.wait_for(self.sources[name].fetch_many(contracts), self.source_deadline)
+        except asyncio.CancelledError:
+            # Cancelled because faster sources settled the tick, which is not its fault
+            self.health[name].record_unfinished(time.monotonic() - started)
+            raise
+        except Exception as e:
+            self.health[name].record_failure()
+            SOURCE_FAILURES.inc(source=name)
+            logger.warning(f"Price source {name} failed: {type(e).__name__}: {e}")
+            retry_after = retry_after_from(e)
+            if retry_after is not None:
+                self._cooldown[name] = time.monotonic() + retry_after
+            return name, None
+        latency = time.monotonic() - started
+        self.health[name].record_success(latency)
+        SOURCE_SECONDS.observe(latency, source=name)
+        return name, quotes
+
+    def _cooling(self, now: float) -> Dict[str, float]:
+        """Seconds left before each rate limited source may be asked again"""
+        return {name: until - now for name, until in self._cooldown.items() if until > now}
+
+    def _agree(self, prices: List[float]) -> bool:
+        mid = statistics.median(prices)
+        return all(abs(price - mid) <= self.max_deviation * mid for price in prices)
+
+    def _settled(self, contracts: List[str], results: Dict[str, Dict[str, PriceQuote]], quorum: int) -> bool:
+        for contract in contracts:
+            prices = [quotes[contract].price for quotes in results.values() if contract in quotes]
+            if len(prices) < quorum or not self._agree(prices):
+                return False
+        return True
+
+    def _combine(self, contracts: List[str], results: Dict[str, Dict[str, PriceQuote]]) -> Dict[str, PriceQuote]:
+        combined = {}
+        for contract in contracts:
+            answers = [(name, quotes[contract]) for name, quotes in results.items() if contract in quotes]
+            if not answers:
+                continue
+            mid = statistics.median(quote.price for _, quote in answers)
+            kept = [(name, quote) for name, quote in answers
+                    if abs(quote.price - mid) <= self.max_deviation * mid]
+            if len(answers) == 2 and len(kept) < 2:
+                # No majority to tell which one is wrong
+                if contract in self._last:
+                    last = self._last[contract]
+                    kept = [min(answers, key=lambda answer: abs(answer[1].price - last))]
+                else:
+                    kept = [max(answers, key=lambda answer: self.health[answer[0]].score)]
+            elif not kept:
+                kept = answers
+            for name, quote in answers:
+                if (name, quote) not in kept:
+                    self.health[name].record_outlier()
+                    logger.warning(f"Price source {name} reported outlier ${quote.price} for {contract}")
+
+            changes = [quote.change_24h for _, quote in kept if quote.change_24h is not None]
+            if not changes:
+                changes = [quote.change_24h for _, quote in answers if quote.change_24h is not None]
+            combined[contract] = PriceQuote(
+                price=statistics.median(quote.price for _, quote in kept),
+                change_24h=statistics.median(changes) if changes else None,
+            )
+            self._last[contract] = combined[contract].price
+        return combined
+
+    async def fetch_many(self, contracts: Iterable[str]) -> Dict[str, PriceQuote]:
+        contracts = sorted({contract.lower() for contract in contracts})
+        if not contracts:
+            return {}
+        cooling = self._cooling(time.monotonic())
+        if len(cooling) == len(self.sources):
+            raise RateLimitedError("Every price source is rate limited", retry_after=min(cooling.values()))
+        waiting: Deque[str] = deque(name for name in self.ranked() if name not in cooling)
+        quorum = min(self.quorum, len(waiting))
+        running: Set[asyncio.Task] = set()
+        results: Dict[str, Dict[str, PriceQuote]] = {}
+
+        hedge_at = 0.0
+
+        def start(count: int):
+            nonlocal hedge_at
+            for _ in range(count):
+                if waiting:
+                    running.add(asyncio.create_task(self._call(waiting.popleft(), contracts)))
+                    hedge_at = time.monotonic() + self.hedge_delay
+
+        started = time.monotonic()
+        deadline = started + self.deadline
+        start(quorum)
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline:
+                    logger.warning(f"Price aggregation hit its {self.deadline}s deadline")
+                    break
+                timeout = deadline - now
+                if waiting or results:
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+                done, running = await asyncio.wait(running, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if time.monotonic() < hedge_at:
+                        continue
+                    if waiting:
+                        # Too slow: hedge with the next source
+                        start(1)
+                        continue
+                    if results:
+                        # Every source is in; the stragglers had their hedge delay
+                        logger.info(f"Settling on {len(results)} price source answer(s) "
+                                    f"without waiting for {len(running)} straggler(s)")
+                        break
+                    continue
+
+                for task in done:
+                    name, quotes = task.result()
+                    if quotes is None:
+                        start(1)
+                    else:
+                        results[name] = quotes
+                if self._settled(contracts, results, quorum):
+                    break
+                if not running:
+                    # Not enough agreeing answers yet: bring in another source
+                    start(1)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if not results:
+            cooling = self._cooling(time.monotonic())
+            if len(cooling) == len(self.sources):
+                raise RateLimitedError("Every price source failed", retry_after=min(cooling.values()))
+            raise RuntimeError("Every price source failed")
+        return self._combine(contracts, results)
+
+    async def close(self):
+        await asyncio.gather(*(source.close() for source in self.sources.values()))
+
+
+def build_price_source(config: TrackerConfig) -> PriceAggregator:
+    """The price source described by the tracker config's `sources` list"""
+    sources: Dict[str, PriceSource] = {}
+    for name in config.sources:
+        if name == "coingecko":
+            sources[name] = CoinGeckoPriceSource()
+        elif name == "dexscreener":
+            sources[name] = DexScreenerPriceSource()
+        elif name == "onchain":
+            if not config.pools:
+                logger.warning("The onchain price source needs 'pools' in the tracker config, skipping it")
+                continue
+            # web3 is only needed when pricing on-chain
+            from .onchain_price import OnChainPriceSource, engines_from_config
+
+            sources[name] = OnChainPriceSource(engines_from_config(config))
+    # Even a single source goes through the aggregator, which fills in a
+    # missing 24h change and tracks the source's health
+    return PriceAggregator(sources)
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Local HTTP stand-ins for three CoinGecko-style sources whose behaviour is
+    # switched per scenario: healthy, slow, failing or reporting a wrong price.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.price_aggregator
+    import threading
+
+    from aiohttp import web
+
+    CONTRACT = "0xeff2a458e464b07088bdb441c21a42ab4b61e07e"
+    TRUE_PRICE = 0.0421
+    behaviour = {}
+
+    async def handle(request):
+        mode = behaviour[request.match_info['name']]
+        if mode == "slow":
+            await asyncio.sleep(10)
+        if mode == "failing":
+            return web.json_response({"error": "upstream unavailable"}, status=503)
+        if mode == "limited":
+            return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": "30"})
+        price = TRUE_PRICE * (3 if mode == "wrong" else 1)
+        return web.json_response({CONTRACT: {"usd": price, "usd_24h_change": 2.0}})
+
+    def start_stand_ins():
+        ready = threading.Event()
+        address = {}
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/{name}", handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            address['port'] = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{address['port']}"
+
+    SCENARIOS = [
+        ("all healthy", {"a": "ok", "b": "ok", "c": "ok"}),
+        ("a slow", {"a": "slow", "b": "ok", "c": "ok"}),
+        ("b failing", {"a": "ok", "b": "failing", "c": "ok"}),
+        ("c wrong price", {"a": "ok", "b": "ok", "c": "wrong"}),
+        ("a slow, b wrong", {"a": "slow", "b": "wrong", "c": "ok"}),
+        ("b rate limited", {"a": "ok", "b": "limited", "c": "ok"}),
+    ]
+
+    async def main(base_url):
+        aggregator = PriceAggregator(
+            {name: CoinGeckoPriceSource(url=f"{base_url}/{name}") for name in "abc"},
+            hedge_delay=0.3, source_deadline=2.0, deadline=3.0,
+        )
+        try:
+            for label, modes in SCENARIOS:
+                behaviour.update(modes)
+                # Start each scenario with equal health so the ordering is a-b-c
+                aggregator.health = {name: SourceHealth() for name in aggregator.sources}
+                aggregator._cooldown.clear()
+                for _ in range(3):
+                    started = time.perf_counter()
+                    quote = (await aggregator.fetch_many([CONTRACT]))[CONTRACT]
+                    elapsed = time.perf_counter() - started
+                print(f"{label:>16}: ${quote.price} in {elapsed * 1000:4.0f}ms (3rd tick), "
+                      f"ranking {aggregator.ranked()}, cooling down {sorted(aggregator._cooling(time.monotonic()))}")
+            # Every source answering 429 surfaces the shortest Retry-After
+            behaviour.update({"a": "limited", "b": "limited", "c": "limited"})
+            aggregator._cooldown.clear()
+            try:
+                await aggregator.fetch_many([CONTRACT])
+            except RateLimitedError as e:
+                print(f"{'all rate limited':>16}: {e}, retry after {e.retry_after:.0f}s")
+        finally:
+            await aggregator.close()
+
+    asyncio.run(main(start_stand_ins()))
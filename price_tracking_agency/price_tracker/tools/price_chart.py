@@ -0,0 +1,193 @@
+"""
+Sparkline charts of the local price history, rendered with numpy into PNGs
+and cached per time bucket
+"""
+
+__all__ = ['CHART_WIDTH', 'CHART_HEIGHT', 'encode_png', 'render_sparkline', 'ChartCache']
+
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import CHART_CACHE, STAGE_SECONDS
+from .price_history import WINDOWS, PriceHistory
+
+CHART_WIDTH = 400
+CHART_HEIGHT = 120
+# Discord's green and red
+UP_COLOR = (67, 181, 129)
+DOWN_COLOR = (240, 71, 71)
+FILL_ALPHA = 48
+PADDING = 4
+
+ChartKey = Tuple[str, str, int]
+
+
+def encode_png(pixels: np.ndarray, palette: Sequence[Tuple[int, int, int, int]]) -> bytes:
+    """
+    Encode a (height, width) uint8 array of indexes into `palette`, a list of
+    RGBA colors, as an indexed-color PNG. One byte per pixel keeps zlib's
+    input a quarter of the size of RGBA.
+    """
+    height, width = pixels.shape
+    # Each scanline starts with its filter type; 0 is none
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"PLTE", bytes(channel for color in palette for channel in color[:3]))
+            + chunk(b"tRNS", bytes(color[3] for color in palette))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
+
+
+def render_sparkline(timestamps: np.ndarray, prices: np.ndarray, start: float, end: float,
+                     width: int = CHART_WIDTH, height: int = CHART_HEIGHT) -> bytes:
+    """
+    Draw prices between `start` and `end` as a line over a shaded area, green
+    if the price rose and red if it fell. Samples are binned into pixel
+    columns keeping each column's high and low, so short spikes stay
+    visible, and the whole image is drawn with array masks rather than per
+    pixel.
+    """
+    # Pixel column of every sample, then each column's low and high
+    columns = np.clip(((timestamps - start) / (end - start) * (width - 1)).astype(np.int64), 0, width - 1)
+    low = np.full(width, np.inf)
+    high = np.full(width, -np.inf)
+    np.minimum.at(low, columns, prices)
+    np.maximum.at(high, columns, prices)
+    filled = np.isfinite(low)
+    # Columns between samples take the interpolated price; nothing is drawn before the first sample
+    drawn = np.arange(width) >= columns[0]
+    gaps = drawn & ~filled
+    xs = np.flatnonzero(filled)
+    low[gaps] = high[gaps] = np.interp(np.flatnonzero(gaps), xs, (low[xs] + high[xs]) / 2)
+    low[~drawn] = high[~drawn] = prices[0]
+    # Join each column to the one before it
+    middle = (low + high) / 2
+    previous = np.concatenate(([middle[0]], middle[:-1]))
+    low, high = np.minimum(low, previous), np.maximum(high, previous)
+
+    floor, ceiling = prices.min(), prices.max()
+    span = ceiling - floor
+    scale = (height - 1 - 2 * PADDING) / span if span > 0 else 0.0
+
+    def to_row(values: np.ndarray) -> np.ndarray:
+        if not scale:
+            return np.full(values.shape, height // 2)
+        return np.rint(height - 1 - PADDING - (values - floor) * scale).astype(np.int64)
+
+    top, bottom, line_row = to_row(high), to_row(low), to_row(middle)
+    rows = np.arange(height)[:, None]
+    # Two pixels thick: one row either side of each column's span
+    line = (rows >= top - 1) & (rows <= bottom + 1) & drawn
+    area = (rows >= line_row) & drawn
+
+    color = UP_COLOR if prices[-1] >= prices[0] else DOWN_COLOR
+    # Palette: transparent background, shaded area, line
+    pixels = area.astype(np.uint8)
+    pixels[line] = 2
+    return encode_png(pixels, [(0, 0, 0, 0), (*color, FILL_ALPHA), (*color, 255)])
+
+
+class ChartCache:
+    """
+    Rendered charts, keyed by (contract, window, time bucket) and evicted
+    least recently used first.
+
+    A bucket is one pixel column of the window, so a chart is re-rendered
+    at most once per column's worth of time, however many people ask.
+    Rendering is synchronous and takes a couple of milliseconds, so a burst of
+    identical requests on the event loop renders once and the rest hit the
+    cache.
+    """
+
+    def __init__(self, capacity: int = 256, width: int = CHART_WIDTH, height: int = CHART_HEIGHT):
+        self.capacity = capacity
+        self.width = width
+        self.height = height
+        self.renders = 0
+        self._charts: "OrderedDict[ChartKey, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._charts)
+
+    def key(self, contract: str, window: str, now: float) -> ChartKey:
+        return contract, window, int(now // (WINDOWS[window] / self.width))
+
+    def get(self, history: PriceHistory, contract: str, window: str,
+            now: Optional[float] = None) -> Optional[bytes]:
+        """The chart of `window` as a PNG, or None with fewer than two samples in it"""
+        now = now if now is not None else time.time()
+        key = self.key(contract, window, now)
+        png = self._charts.get(key)
+        if png is not None:
+            self._charts.move_to_end(key)
+            CHART_CACHE.inc(result="hit")
+            return png
+
+        CHART_CACHE.inc(result="miss")
+        seconds = WINDOWS[window]
+        timestamps, prices = history.window(seconds, now)
+        if prices.size < 2:
+            return None
+        with STAGE_SECONDS.time(stage="chart"):
+            png = render_sparkline(timestamps, prices, now - seconds, now, self.width, self.height)
+        self.renders += 1
+        self._charts[key] = png
+        if len(self._charts) > self.capacity:
+            self._charts.popitem(last=False)
+        return png
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Renders every window of a random walk to chart_<window>.png in the temp directory and times
+    # the renderer and the cache.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.price_chart
+    import os
+    import tempfile
+    import timeit
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = PriceHistory(os.path.join(tmp, "pdt.bin"), capacity=2 ** 14)
+        now = 1_700_000_000.0
+        samples = 8 * 24 * 60
+        rng = np.random.default_rng(3)
+        walk = 0.04 * np.exp(np.cumsum(rng.normal(0, 0.002, samples)))
+        for i, price in enumerate(walk):
+            history.append(float(price), now - (samples - i) * 60)
+
+        cache = ChartCache(capacity=4)
+        for window, seconds in WINDOWS.items():
+            timestamps, prices = history.window(seconds, now)
+            runs = 200
+            elapsed = timeit.timeit(
+                lambda: render_sparkline(timestamps, prices, now - seconds, now), number=runs)
+            png = cache.get(history, "0xpdt", window, now)
+            assert png.startswith(b"\x89PNG") and png == render_sparkline(timestamps, prices, now - seconds, now)
+            with open(os.path.join(tempfile.gettempdir(), f"chart_{window}.png"), "wb") as f:
+                f.write(png)
+            print(f"{window:>3}: {prices.size:5d} samples, {len(png):5d} bytes, "
+                  f"{elapsed / runs * 1000:.2f}ms per render")
+
+        # A burst inside one bucket renders once
+        before = cache.renders
+        for _ in range(500):
+            cache.get(history, "0xpdt", "24h", now + 1)
+        assert cache.renders == before, cache.renders
+        # Moving to the next bucket renders again; the oldest entry is evicted
+        cache.get(history, "0xpdt", "24h", now + WINDOWS["24h"] / cache.width)
+        cache.get(history, "0xpdt", "1h", now + WINDOWS["1h"] / cache.width)
+        assert cache.renders == before + 2 and len(cache) == cache.capacity, (cache.renders, len(cache))
+        # Too little history renders nothing
+        assert cache.get(PriceHistory(os.path.join(tmp, "empty.bin"), capacity=16), "0xnew", "1h", now) is None
+        print(f"cache: {CHART_CACHE.value(result='hit'):.0f} hits, {CHART_CACHE.value(result='miss'):.0f} misses, "
+              f"{cache.renders} renders")
@@ -0,0 +1,252 @@
+"""
+/price and /chart slash commands, answered from the tracker's in-memory
+snapshot and local price history, and /alert commands managing price alerts
+"""
+
+__all__ = ['PriceCommands', 'AlertCommands']
+
+import io
+import logging
+import time
+from typing import List, Optional
+
+import discord
+from discord import app_commands
+
+from .metrics import COMMAND_SECONDS, ERRORS
+from .price_alerts import KIND_ABOVE, KIND_BELOW, KIND_MOVE, Alert, AlertEngine
+from .price_chart import ChartCache
+from .price_history import WINDOWS, PriceHistoryStore
+from .snapshot_cache import SnapshotCache
+from .tracker_config import TokenConfig, TrackerConfig
+
+logger = logging.getLogger(__name__)
+
+UP_COLOR = discord.Color.from_rgb(67, 181, 129)
+DOWN_COLOR = discord.Color.from_rgb(240, 71, 71)
+MAX_ALERTS_PER_USER = 25
+
+
+class PriceCommands:
+    """
+    Application commands for the tracker:
+
+    - `/price [token]`: latest price, 24h change and the 1h/24h/7d windows
+    - `/chart <window> [token]`: sparkline PNG of the price over the window
+
+    Both read only the snapshot the update loop (or cluster feed) keeps
+    current and the local price history; they never call a price API, so
+    a burst of invocations costs no upstream requests. The token defaults
+    to the one shown in the invoking guild. Charts are served from a
+    ChartCache.
+    """
+
+    def __init__(self, config: TrackerConfig, snapshot: SnapshotCache, history: PriceHistoryStore,
+                 charts: Optional[ChartCache] = None):
+        self._config = config
+        self._snapshot = snapshot
+        self._history = history
+        self.charts = charts or ChartCache()
+        # token_for scans every guild; commands can arrive by the hundred
+        self._guild_tokens = {guild.guild_id: config.tokens[guild.token] for guild in config.guilds}
+
+    def resolve_token(self, symbol: Optional[str], guild_id: Optional[int]) -> Optional[TokenConfig]:
+        """The token named `symbol`, else the guild's token, else the presence token"""
+        if symbol:
+            for name, token in self._config.tokens.items():
+                if name.lower() == symbol.lower():
+                    return token
+            return None
+        return self._guild_tokens.get(guild_id) or self._config.tokens[self._config.presence_token]
+
+    def price_embed(self, token: TokenConfig, now: Optional[float] = None) -> Optional[discord.Embed]:
+        """Embed with the token's cached price, or None before the first price arrives"""
+        cached = self._snapshot.get(token.key, now)
+        if cached is None:
+            return None
+        quote = cached.quote
+        if quote.change_24h is not None:
+            change = f"{'📈' if quote.change_24h >= 0 else '📉'} {quote.change_24h:+.2f}% in 24h"
+            color = UP_COLOR if quote.change_24h >= 0 else DOWN_COLOR
+        else:
+            change, color = "24h change unknown", None
+        embed = discord.Embed(
+            title=f"{token.symbol} ${quote.price:.4f}",
+            description=f"{change}\nUpdated <t:{int(cached.fetched_at)}:R>",
+            color=color,
+        )
+        for window, stats in self._history.window_stats(token.key, now).items():
+            if stats:
+                embed.add_field(name=window, value=(f"{stats.change_pct:+.2f}%\n"
+                                                    f"H ${stats.high:.4f} / L ${stats.low:.4f}"))
+        return embed
+
+    def chart(self, token: TokenConfig, window: str, now: Optional[float] = None) -> Optional[bytes]:
+        """PNG sparkline of `window`, or None without enough history"""
+        return self.charts.get(self._history.get(token.key), token.key, window, now)
+
+    async def _token_choices(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        return [app_commands.Choice(name=symbol, value=symbol)
+                for symbol in self._config.tokens if current.lower() in symbol.lower()][:25]
+
+    async def _unknown_token(self, interaction: discord.Interaction, symbol: str):
+        await interaction.response.send_message(
+            f"Unknown token {symbol}. Tracked tokens: {', '.join(self._config.tokens)}", ephemeral=True)
+
+    def register(self, tree: app_commands.CommandTree):
+        """Add the commands to `tree`; syncing them with Discord is up to the caller"""
+
+        @tree.command(name="price", description="Latest price of a tracked token")
+        @app_commands.describe(token="Token symbol (defaults to this server's token)")
+        @app_commands.autocomplete(token=self._token_choices)
+        async def price(interaction: discord.Interaction, token: Optional[str] = None):
+            started = time.monotonic()
+            try:
+                resolved = self.resolve_token(token, interaction.guild_id)
+                if resolved is None:
+                    await self._unknown_token(interaction, token)
+                    return
+                embed = self.price_embed(resolved)
+                if embed is None:
+                    await interaction.response.send_message(
+                        f"No price for {resolved.symbol} yet, try again in a moment.", ephemeral=True)
+                    return
+                await interaction.response.send_message(embed=embed)
+            except Exception as e:
+                ERRORS.inc(stage="command")
+                logger.error("Command failed", extra={"command": "price", "error": f"{type(e).__name__}: {e}"})
+            finally:
+                COMMAND_SECONDS.observe(time.monotonic() - started, command="price")
+
+        @tree.command(name="chart", description="Price chart of a tracked token")
+        @app_commands.describe(window="Time window", token="Token symbol (defaults to this server's token)")
+        @app_commands.choices(window=[app_commands.Choice(name=window, value=window) for window in WINDOWS])
+        @app_commands.autocomplete(token=self._token_choices)
+        async def chart(interaction: discord.Interaction, window: app_commands.Choice[str],
+                        token: Optional[str] = None):
+            started = time.monotonic()
+            try:
+                resolved = self.resolve_token(token, interaction.guild_id)
+                if resolved is None:
+                    await self._unknown_token(interaction, token)
+                    return
+                png = self.chart(resolved, window.value)
+                if png is None:
+                    await interaction.response.send_message(
+                        f"Not enough {resolved.symbol} history for a {window.value} chart yet.", ephemeral=True)
+                    return
+                filename = f"{resolved.symbol}_{window.value}.png"
+                embed = discord.Embed(title=f"{resolved.symbol} {window.value}")
+                embed.set_image(url=f"attachment://{filename}")
+                await interaction.response.send_message(embed=embed, file=discord.File(io.BytesIO(png), filename))
+            except Exception as e:
+                ERRORS.inc(stage="command")
+                logger.error("Command failed", extra={"command": "chart", "error": f"{type(e).__name__}: {e}"})
+            finally:
+                COMMAND_SECONDS.observe(time.monotonic() - started, command="chart")
+
+
+class AlertCommands:
+    """
+    The `/alert` command group:
+
+    - `/alert above|below <price> [token] [here]`: when the price crosses a level
+    - `/alert move <percent> [token] [here]`: when the 24h change passes ±percent
+    - `/alert list` and `/alert remove <id>`: the caller's own alerts
+
+    Alerts are DMed unless `here` is set, in which case they are posted in
+    the channel the command was used in. Replies are ephemeral, and each
+    user may hold MAX_ALERTS_PER_USER alerts.
+    """
+
+    def __init__(self, engine: AlertEngine, prices: PriceCommands):
+        self._engine = engine
+        self._prices = prices
+
+    def _symbol(self, contract: str) -> str:
+        for token in self._prices._config.tokens.values():
+            if token.key == contract:
+                return token.symbol
+        return contract
+
+    def create(self, interaction: discord.Interaction, kind: str, threshold: float,
+               symbol: Optional[str], here: bool) -> str:
+        """Add an alert for the invoking user and return the reply"""
+        token = self._prices.resolve_token(symbol, interaction.guild_id)
+        if token is None:
+            return f"Unknown token {symbol}. Tracked tokens: {', '.join(self._prices._config.tokens)}"
+        if threshold <= 0:
+            return "The threshold must be positive."
+        if len(self._engine.alerts_for(interaction.user.id)) >= MAX_ALERTS_PER_USER:
+            return f"You already have {MAX_ALERTS_PER_USER} alerts; remove one with /alert remove first."
+        alert = self._engine.add(Alert(
+            user_id=interaction.user.id, guild_id=interaction.guild_id, contract=token.key, kind=kind,
+            threshold=threshold, channel_id=interaction.channel_id if here else None))
+        where = "in this channel" if here else "by DM"
+        return f"Alert #{alert.id} set: {alert.describe(token.symbol)}, delivered {where}."
+
+    def list_alerts(self, user_id: int) -> str:
+        alerts = self._engine.alerts_for(user_id)
+        if not alerts:
+            return "You have no alerts."
+        return "\n".join(
+            f"#{alert.id} {alert.describe(self._symbol(alert.contract))}"
+            f"{'' if alert.armed else ' (fired, re-arms on the way back)'}"
+            for alert in alerts)
+
+    def remove(self, user_id: int, alert_id: int) -> str:
+        if not any(alert.id == alert_id for alert in self._engine.alerts_for(user_id)):
+            return f"You have no alert #{alert_id}."
+        self._engine.remove(alert_id)
+        return f"Alert #{alert_id} removed."
+
+    async def _reply(self, interaction: discord.Interaction, command: str, reply):
+        started = time.monotonic()
+        try:
+            await interaction.response.send_message(reply(), ephemeral=True)
+        except Exception as e:
+            ERRORS.inc(stage="command")
+            logger.error("Command failed", extra={"command": command, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            COMMAND_SECONDS.observe(time.monotonic() - started, command=command)
+
+    def register(self, tree: app_commands.CommandTree):
+        """Add the /alert group to `tree`"""
+        group = app_commands.Group(name="alert", description="Price alerts", guild_only=True)
+        token_choices = self._prices._token_choices
+
+        @group.command(name="above", description="Alert when the price rises above a level")
+        @app_commands.describe(price="Price in USD", token="Token symbol (defaults to this server's token)",
+                               here="Post in this channel instead of a DM")
+        @app_commands.autocomplete(token=token_choices)
+        async def above(interaction: discord.Interaction, price: float, token: Optional[str] = None,
+                        here: bool = False):
+            await self._reply(interaction, "alert", lambda: self.create(interaction, KIND_ABOVE, price, token, here))
+
+        @group.command(name="below", description="Alert when the price falls below a level")
+        @app_commands.describe(price="Price in USD", token="Token symbol (defaults to this server's token)",
+                               here="Post in this channel instead of a DM")
+        @app_commands.autocomplete(token=token_choices)
+        async def below(interaction: discord.Interaction, price: float, token: Optional[str] = None,
+                        here: bool = False):
+            await self._reply(interaction, "alert", lambda: self.create(interaction, KIND_BELOW, price, token, here))
+
+        @group.command(name="move", description="Alert when the 24h change passes ±percent")
+        @app_commands.describe(percent="24h change in percent", token="Token symbol (defaults to this server's token)",
+                               here="Post in this channel instead of a DM")
+        @app_commands.autocomplete(token=token_choices)
+        async def move(interaction: discord.Interaction, percent: float, token: Optional[str] = None,
+                       here: bool = False):
+            await self._reply(interaction, "alert", lambda: self.create(interaction, KIND_MOVE, percent, token, here))
+
+        @group.command(name="list", description="Your price alerts")
+        async def list_(interaction: discord.Interaction):
+            await self._reply(interaction, "alert", lambda: self.list_alerts(interaction.user.id))
+
+        @group.command(name="remove", description="Remove one of your price alerts")
+        @app_commands.rename(alert_id="id")
+        @app_commands.describe(alert_id="Alert number from /alert list")
+        async def remove(interaction: discord.Interaction, alert_id: int):
+            await self._reply(interaction, "alert", lambda: self.remove(interaction.user.id, alert_id))
+
+        tree.add_command(group)
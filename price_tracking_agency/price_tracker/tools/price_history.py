@@ -0,0 +1,210 @@
+"""
+Compact, memory-mapped price history with locally computed rolling windows
+"""
+
+__all__ = ['WINDOWS', 'SAMPLE_SPACING', 'WindowStats', 'PriceHistory', 'PriceHistoryStore']
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_DIR = ".price_history"
+# 2**17 one-minute samples is about 91 days, at 2 MiB per token
+DEFAULT_CAPACITY = 2 ** 17
+# Callers that see prices more often than that (the swap stream) record at most one per this many seconds
+SAMPLE_SPACING = 60.0
+
+# Rolling windows reported for every token, in seconds
+WINDOWS = {
+    "1h": 3600,
+    "24h": 24 * 3600,
+    "7d": 7 * 24 * 3600,
+}
+
+_MAGIC = 0x50445448  # "PDTH"
+_HEADER = 4  # magic, capacity, head, count
+_HEADER_BYTES = _HEADER * 8
+
+
+@dataclass(frozen=True)
+class WindowStats:
+    """Price statistics over one rolling window"""
+    change_pct: float
+    high: float
+    low: float
+    volatility_pct: float
+    samples: int
+
+
+class PriceHistory:
+    """
+    Fixed-size ring buffer of (timestamp, price) samples for one token.
+
+    Timestamps and prices live in two preallocated float64 arrays inside a
+    memory-mapped file, so the history survives restarts and memory stays
+    bounded at `capacity` samples. The oldest samples are overwritten first.
+    """
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        exists = os.path.exists(path)
+        if exists:
+            header = np.memmap(path, dtype=np.int64, mode="r", shape=(_HEADER,))
+            if header[0] != _MAGIC or header[1] != capacity:
+                logger.warning(f"Price history {path} has a different layout, starting fresh")
+                exists = False
+            del header
+
+        size = _HEADER_BYTES + 2 * capacity * 8
+        if not exists:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(size)
+
+        self._maps = (
+            np.memmap(path, dtype=np.int64, mode="r+", shape=(_HEADER,)),
+            np.memmap(path, dtype=np.float64, mode="r+", offset=_HEADER_BYTES, shape=(capacity,)),
+            np.memmap(path, dtype=np.float64, mode="r+", offset=_HEADER_BYTES + capacity * 8,
+                      shape=(capacity,)),
+        )
+        # Plain ndarray views of the same pages skip np.memmap's per-slice overhead
+        self._header, self._timestamps, self._prices = (np.asarray(m) for m in self._maps)
+        if not exists:
+            self._header[:] = (_MAGIC, capacity, 0, 0)
+
+    @property
+    def capacity(self) -> int:
+        return int(self._header[1])
+
+    def __len__(self) -> int:
+        return int(self._header[3])
+
+    def append(self, price: float, timestamp: Optional[float] = None, min_spacing: float = 0.0) -> bool:
+        """
+        Record a sample; samples no newer than the newest one, or less than
+        `min_spacing` seconds after it, are ignored
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        head, count = int(self._header[2]), int(self._header[3])
+        if count and (timestamp <= self._timestamps[head - 1]
+                      or timestamp - self._timestamps[head - 1] < min_spacing):
+            return False
+        self._timestamps[head] = timestamp
+        self._prices[head] = price
+        self._header[2] = (head + 1) % self.capacity
+        self._header[3] = min(count + 1, self.capacity)
+        return True
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        if not len(self):
+            return None
+        head = int(self._header[2])
+        return float(self._timestamps[head - 1]), float(self._prices[head - 1])
+
+    def window(self, seconds: float, now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Chronological (timestamps, prices) of the samples in the last `seconds`"""
+        now = now if now is not None else time.time()
+        start = now - seconds
+        head, count = int(self._header[2]), int(self._header[3])
+        # Oldest-first segments: [head:] only once the buffer has wrapped
+        segments = [(head, self.capacity), (0, head)] if count == self.capacity else [(0, count)]
+
+        ts_parts, px_parts = [], []
+        for lo, hi in segments:
+            ts = self._timestamps[lo:hi]
+            first = int(np.searchsorted(ts, start, side="left"))
+            last = int(np.searchsorted(ts, now, side="right"))
+            if first < last:
+                ts_parts.append(ts[first:last])
+                px_parts.append(self._prices[lo + first:lo + last])
+        if not ts_parts:
+            return np.empty(0), np.empty(0)
+        if len(ts_parts) == 1:
+            return ts_parts[0], px_parts[0]
+        return np.concatenate(ts_parts), np.concatenate(px_parts)
+
+    def stats(self, seconds: float, now: Optional[float] = None) -> Optional[WindowStats]:
+        """Change, high/low and volatility of log returns over the window"""
+        _, prices = self.window(seconds, now)
+        if prices.size < 2:
+            return None
+        returns = np.diff(np.log(prices))
+        return WindowStats(
+            change_pct=float((prices[-1] / prices[0] - 1) * 100),
+            high=float(prices.max()),
+            low=float(prices.min()),
+            volatility_pct=float(returns.std() * 100),
+            samples=int(prices.size),
+        )
+
+    def flush(self):
+        for m in self._maps:
+            m.flush()
+
+
+class PriceHistoryStore:
+    """One PriceHistory file per tracked contract"""
+
+    def __init__(self, directory: Optional[str] = None, capacity: int = DEFAULT_CAPACITY):
+        self.directory = directory or os.getenv("HISTORY_DIR") or DEFAULT_HISTORY_DIR
+        self.capacity = capacity
+        self._histories: Dict[str, PriceHistory] = {}
+
+    def get(self, contract: str) -> PriceHistory:
+        key = contract.lower()
+        history = self._histories.get(key)
+        if history is None:
+            history = PriceHistory(os.path.join(self.directory, f"{key}.bin"), self.capacity)
+            self._histories[key] = history
+        return history
+
+    def record(self, contract: str, price: float, timestamp: Optional[float] = None,
+               min_spacing: float = 0.0) -> bool:
+        return self.get(contract).append(price, timestamp, min_spacing)
+
+    def window_stats(self, contract: str, now: Optional[float] = None) -> Dict[str, Optional[WindowStats]]:
+        """Stats for every window in WINDOWS"""
+        history = self.get(contract)
+        return {name: history.stats(seconds, now) for name, seconds in WINDOWS.items()}
+
+    def flush(self):
+        for history in self._histories.values():
+            history.flush()
+
+
+# Add a test case
+if __name__ == "__main__":
+    import tempfile
+    import timeit
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = PriceHistory(os.path.join(tmp, "pdt.bin"))
+        now = 1_700_000_000.0
+        # Fill past capacity so the ring has wrapped: a one-minute random walk
+        samples = history.capacity + history.capacity // 3
+        rng = np.random.default_rng(7)
+        prices = 0.04 * np.exp(np.cumsum(rng.normal(0, 0.002, samples)))
+        started = time.perf_counter()
+        for i, price in enumerate(prices):
+            history.append(float(price), now - (samples - i) * 60)
+        fill = time.perf_counter() - started
+        history.flush()
+        print(f"{len(history)} samples ({os.path.getsize(history.path) / 2 ** 20:.1f} MiB on disk), "
+              f"{samples / fill:,.0f} appends/s")
+
+        reopened = PriceHistory(history.path)
+        assert reopened.latest() == history.latest()
+
+        for name, seconds in WINDOWS.items():
+            runs = 1000
+            elapsed = timeit.timeit(lambda: reopened.stats(seconds, now), number=runs)
+            stats = reopened.stats(seconds, now)
+            print(f"{name:>3}: {elapsed / runs * 1e6:7.1f}us per query - {stats}")
+        elapsed = timeit.timeit(lambda: reopened.stats(90 * 24 * 3600, now), number=100)
+        print(f"full buffer: {elapsed / 100 * 1e6:7.1f}us per query")
@@ -0,0 +1,210 @@
+"""
+Read-only price, history and alert queries for the agent tools, served from
+a process-wide cache with short TTLs
+"""
+
+__all__ = ['QueryCache', 'PriceQueries', 'price_queries']
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import QUERY_CACHE
+from .price_aggregator import build_price_source
+from .price_alerts import AlertStore, DEFAULT_ALERTS_DB
+from .price_history import WINDOWS, PriceHistoryStore
+from .price_source import PriceQuote
+from .snapshot_cache import CachedQuote, SnapshotCache
+from .tracker_config import TokenConfig, TrackerConfig, load_tracker_config
+
+PRICE_TTL = 15.0
+HISTORY_TTL = 30.0
+ALERTS_TTL = 5.0
+FETCH_TIMEOUT = 20.0
+HISTORY_POINTS = 12
+
+
+class QueryCache:
+    """
+    Thread-safe TTL cache with single flight.
+
+    Agent tool calls run on a thread pool, so the first caller for a
+    missing or expired key runs `load` and any caller that arrives while it
+    runs waits for the same result instead of starting its own. Failures
+    are passed to every waiting caller and not cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self.loads = 0
+
+    def get(self, key: Hashable, ttl: float, load: Callable[[], Any], query: str = "") -> Any:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= ttl:
+                QUERY_CACHE.inc(query=query, result="hit")
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.loads += 1
+        if not owner:
+            QUERY_CACHE.inc(query=query, result="shared")
+            return future.result()
+
+        QUERY_CACHE.inc(query=query, result="miss")
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._values[key] = (time.monotonic(), value)
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class PriceQueries:
+    """
+    What the agent tools can ask about the tracker, without a Discord client.
+
+    Prices come from the snapshot file a running bot keeps when it is fresh,
+    and otherwise from one fetch of every tracked token through the usual
+    price sources, run on a private event loop thread so the HTTP sessions
+    are reused across calls. History windows are read from the memory-mapped
+    history files and alert status from the alerts database, both written by
+    the bot. Every answer goes through one QueryCache.
+    """
+
+    def __init__(self, config: Optional[TrackerConfig] = None, cache: Optional[QueryCache] = None):
+        self.config = config or load_tracker_config()
+        self.cache = cache or QueryCache()
+        self._history = PriceHistoryStore()
+        self._source = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def resolve_token(self, symbol: Optional[str]) -> TokenConfig:
+        """The token named `symbol` (any case), or the presence token"""
+        if not symbol:
+            return self.config.tokens[self.config.presence_token]
+        for name, token in self.config.tokens.items():
+            if name.lower() == symbol.lower():
+                return token
+        raise ValueError(f"Unknown token {symbol}. Tracked tokens: {', '.join(self.config.tokens)}")
+
+    def _run(self, coroutine):
+        """Run `coroutine` on the private event loop and wait for it"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="price-queries", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(FETCH_TIMEOUT)
+
+    async def _fetch(self, contracts: List[str]) -> Dict[str, PriceQuote]:
+        if self._source is None:
+            self._source = build_price_source(self.config)
+        return await self._source.fetch_many(contracts)
+
+    def _load_quotes(self) -> Dict[str, CachedQuote]:
+        contracts = self.config.contracts()
+        snapshot = SnapshotCache()
+        snapshot.load(contracts)
+        if all(snapshot.is_fresh(contract) for contract in contracts):
+            return {contract.lower(): snapshot.get(contract) for contract in contracts}
+        try:
+            self.fetches += 1
+            fetched = self._run(self._fetch(contracts))
+        except Exception:
+            # A stale snapshot beats no answer
+            stale = {contract.lower(): snapshot.get(contract) for contract in contracts}
+            if all(stale.values()):
+                return stale
+            raise
+        now = time.time()
+        return {address: CachedQuote(quote=quote, fetched_at=now) for address, quote in fetched.items()}
+
+    def quote(self, symbol: Optional[str] = None) -> Tuple[TokenConfig, CachedQuote]:
+        """Latest quote of a token and when it was fetched"""
+        token = self.resolve_token(symbol)
+        quotes = self.cache.get("quotes", PRICE_TTL, self._load_quotes, query="price")
+        cached = quotes.get(token.key)
+        if cached is None:
+            raise LookupError(f"No price available for {token.symbol}")
+        return token, cached
+
+    def history(self, symbol: Optional[str], window: str) -> Dict[str, Any]:
+        """Change, high, low and volatility over `window`, plus a few evenly spaced prices"""
+        token = self.resolve_token(symbol)
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window {window}. Windows: {', '.join(WINDOWS)}")
+
+        def load():
+            now = time.time()
+            stats = self._history.window_stats(token.key, now)[window]
+            timestamps, prices = self._history.get(token.key).window(WINDOWS[window], now)
+            step = max(1, -(-len(prices) // HISTORY_POINTS))
+            return {"stats": stats, "points": list(zip(timestamps[::step].tolist(), prices[::step].tolist()))}
+
+        return self.cache.get(("history", token.key, window), HISTORY_TTL, load, query="history")
+
+    def alerts(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Alert counts by kind and state, or one user's alerts"""
+
+        def load():
+            path = os.getenv("ALERTS_DB") or DEFAULT_ALERTS_DB
+            # Opening the store would create the database; no file means no alerts
+            if not os.path.exists(path):
+                return {"total": 0, "armed": 0, "alerts": [], "by_kind": {}}
+            store = AlertStore(path)
+            try:
+                if user_id is None:
+                    counts = store.counts()
+                    alerts = []
+                else:
+                    alerts = store.for_user(user_id)
+                    counts = {}
+                    for alert in alerts:
+                        counts[(alert.kind, alert.armed)] = counts.get((alert.kind, alert.armed), 0) + 1
+            finally:
+                store.close()
+            symbols = {token.key: token.symbol for token in self.config.tokens.values()}
+            by_kind: Dict[str, int] = {}
+            for (kind, _), count in sorted(counts.items()):
+                by_kind[kind] = by_kind.get(kind, 0) + count
+            return {
+                "total": sum(counts.values()),
+                "armed": sum(count for (_, armed), count in counts.items() if armed),
+                "alerts": [(alert.id, alert.describe(symbols.get(alert.contract, alert.contract)), alert.armed)
+                           for alert in alerts],
+                "by_kind": by_kind,
+            }
+
+        return self.cache.get(("alerts", user_id), ALERTS_TTL, load, query="alerts")
+
+
+_shared: Optional[PriceQueries] = None
+_shared_lock = threading.Lock()
+
+
+def price_queries() -> PriceQueries:
+    """The process-wide PriceQueries every agent tool uses"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PriceQueries()
+        return _shared
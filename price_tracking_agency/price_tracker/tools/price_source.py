@@ -0,0 +1,248 @@
+"""
+Async price sources for the price tracking bot
+"""
+
+__all__ = ['PriceQuote', 'PriceSource', 'HTTPPriceSource', 'CoinGeckoPriceSource', 'DexScreenerPriceSource']
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+import aiohttp
+
+from .metrics import ERRORS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+COINGECKO_TOKEN_PRICE_URL = "https://api.coingecko.com/api/v3/simple/token_price/base"
+DEXSCREENER_TOKENS_URL = "https://api.dexscreener.com/tokens/v1/base"
+
+
+@dataclass(frozen=True)
+class PriceQuote:
+    """
+    USD price and 24h change for a single token. Sources that cannot know the
+    24h change (e.g. on-chain reads) leave it as None.
+    """
+    price: float
+    change_24h: Optional[float]
+
+
+class PriceSource:
+    """
+    Base class for async price sources.
+
+    Subclasses implement `fetch_many` and must never block the event loop.
+    Results are keyed by lowercased contract address; tokens the source has
+    no price for are left out.
+    """
+
+    async def fetch_many(self, contracts: Iterable[str]) -> Dict[str, PriceQuote]:
+        raise NotImplementedError
+
+    async def fetch(self, contract: str) -> PriceQuote:
+        quotes = await self.fetch_many([contract])
+        return quotes[contract.lower()]
+
+    async def close(self):
+        """Release any resources held by the source"""
+
+
+class HTTPPriceSource(PriceSource):
+    """
+    Price source backed by one long-lived, pooled aiohttp session.
+
+    The session is created lazily inside the running event loop and reused for
+    every request, so connections to the upstream API are kept alive between
+    ticks. Every request gets its own deadline.
+    """
+
+    def __init__(self, timeout: float = 10.0, connect_timeout: float = 5.0,
+                 pool_size: int = 10, keepalive_timeout: float = 75.0):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                headers={"Accept": "application/json"},
+            )
+        return self._session
+
+    async def get_json(self, url: str, params: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None) -> Any:
+        """GET `url` and decode the JSON body, failing after `timeout` seconds"""
+        session = self._get_session()
+        deadline = aiohttp.ClientTimeout(
+            total=timeout if timeout is not None else self.timeout,
+            connect=self.connect_timeout,
+        )
+        async with session.get(url, params=params, timeout=deadline) as response:
+            response.raise_for_status()
+            body = await response.read()
+        try:
+            with STAGE_SECONDS.time(stage="parse"):
+                return json.loads(body)
+        except ValueError:
+            ERRORS.inc(stage="parse")
+            raise
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class CoinGeckoPriceSource(HTTPPriceSource):
+    """
+    Fetches token prices from CoinGecko's `/simple/token_price/base` endpoint.
+
+    All requested contracts go into a single comma-separated request.
+    """
+
+    def __init__(self, url: str = COINGECKO_TOKEN_PRICE_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+
+    async def fetch_many(self, contracts: Iterable[str]) -> Dict[str, PriceQuote]:
+        addresses = sorted({contract.lower() for contract in contracts})
+        if not addresses:
+            return {}
+        params = {
+            "contract_addresses": ",".join(addresses),
+            "vs_currencies": "usd",
+            "include_24hr_change": "true",
+        }
+        data = await self.get_json(self.url, params=params)
+
+        quotes = {}
+        for address in addresses:
+            entry = data.get(address)
+            if not entry or entry.get('usd') is None:
+                logger.warning(f"CoinGecko returned no price for {address}")
+                continue
+            change = entry.get('usd_24h_change')
+            quotes[address] = PriceQuote(
+                price=float(entry['usd']),
+                change_24h=float(change) if change is not None else None,
+            )
+        return quotes
+
+
+class DexScreenerPriceSource(HTTPPriceSource):
+    """
+    Fetches token prices from DexScreener's token endpoint for Base.
+
+    Up to 30 contracts go into one request; for each token the most liquid
+    pair quoting it as the base token is used.
+    """
+
+    MAX_ADDRESSES = 30
+
+    def __init__(self, url: str = DEXSCREENER_TOKENS_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url.rstrip("/")
+
+    async def fetch_many(self, contracts: Iterable[str]) -> Dict[str, PriceQuote]:
+        addresses = sorted({contract.lower() for contract in contracts})
+        quotes = {}
+        for start in range(0, len(addresses), self.MAX_ADDRESSES):
+            batch = addresses[start:start + self.MAX_ADDRESSES]
+            pairs = await self.get_json(f"{self.url}/{','.join(batch)}")
+
+            best = {}
+            for pair in pairs or []:
+                address = (pair.get('baseToken') or {}).get('address', '').lower()
+                if address not in batch or pair.get('priceUsd') is None:
+                    continue
+                liquidity = float((pair.get('liquidity') or {}).get('usd') or 0.0)
+                if address not in best or liquidity > best[address][0]:
+                    best[address] = (liquidity, pair)
+
+            for address, (_, pair) in best.items():
+                change = (pair.get('priceChange') or {}).get('h24')
+                quotes[address] = PriceQuote(
+                    price=float(pair['priceUsd']),
+                    change_24h=float(change) if change is not None else None,
+                )
+        return quotes
+
+
+# Add a test case
+if __name__ == "__main__":
+    import threading
+    import time
+
+    import requests
+    from aiohttp import web
+
+    CONTRACT = "0xeff2a458e464b07088bdb441c21a42ab4b61e07e"
+    DELAY = 2.0
+
+    def start_slow_server():
+        """Run a slow CoinGecko stand-in on its own thread and return its URL"""
+        ready = threading.Event()
+        address = {}
+
+        async def slow_price(request):
+            await asyncio.sleep(DELAY)
+            return web.json_response({CONTRACT: {"usd": 0.0421, "usd_24h_change": 3.5}})
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/price", slow_price)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            address['port'] = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{address['port']}/price"
+
+    async def heartbeat(samples, stop, interval=0.05):
+        # Stands in for the discord.py gateway heartbeat: measures how late
+        # each beat fires relative to its schedule
+        while not stop.is_set():
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            samples.append(time.perf_counter() - expected)
+
+    async def measure(label, fetch):
+        samples, stop = [], asyncio.Event()
+        beat = asyncio.create_task(heartbeat(samples, stop))
+        await asyncio.sleep(0.2)
+        quote = await fetch()
+        stop.set()
+        await beat
+        print(f"{label}: {quote} - heartbeat lag max {max(samples) * 1000:.1f}ms "
+              f"over {len(samples)} beats")
+
+    async def main(url):
+        async def blocking_fetch():
+            data = requests.get(url, timeout=10).json()[CONTRACT]
+            return PriceQuote(data['usd'], data['usd_24h_change'])
+
+        source = CoinGeckoPriceSource(url=url, timeout=5)
+        try:
+            await measure("blocking requests.get", blocking_fetch)
+            await measure("CoinGeckoPriceSource", lambda: source.fetch(CONTRACT))
+        finally:
+            await source.close()
+
+    asyncio.run(main(start_slow_server()))
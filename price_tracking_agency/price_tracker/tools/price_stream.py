@@ -0,0 +1,355 @@
+"""
+Push-based token prices from pool events over a JSON-RPC WebSocket
+"""
+
+__all__ = ['PriceStream', 'build_price_stream']
+
+import asyncio
+import json
+import logging
+import os
+import time
+from fractions import Fraction
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+import aiohttp
+
+from .metrics import ERRORS, STAGE_SECONDS, STREAM_CONNECTED, STREAM_EVENTS, STREAM_RECONNECTS
+from .poll_scheduler import PollPolicy, PollScheduler
+from .tracker_config import TrackerConfig
+
+if TYPE_CHECKING:
+    # web3 is only imported once a stream is actually built
+    from .onchain_price import OnChainPriceEngine
+
+logger = logging.getLogger(__name__)
+
+PriceCallback = Callable[[str, float], None]
+StateCallback = Callable[[bool], None]
+
+# Reconnects back off from 1s up to a minute, with jitter
+RECONNECT_POLICY = PollPolicy(backoff_base=1.0, max_interval=60.0)
+
+
+class PriceStream:
+    """
+    Streams token prices from pool events.
+
+    Subscribes with `eth_subscribe("logs")` to the Sync (V2) or Swap (V3)
+    events of every engine's pool and decodes each log to a USD price as it
+    arrives, calling `on_price(contract, price)`. The quote asset's USD price
+    comes from its Chainlink feed, re-read every `quote_refresh` seconds.
+
+    Every connection resubscribes and then reads each pool's current state
+    once, so swaps missed while disconnected are not lost. Lost connections
+    are retried with jittered exponential backoff, and `on_state` is told
+    when the stream goes up or down so the caller can fall back to polling.
+    """
+
+    def __init__(self, url: str, engines: Dict[str, "OnChainPriceEngine"], on_price: PriceCallback,
+                 on_state: Optional[StateCallback] = None, quote_refresh: float = 60.0,
+                 heartbeat: float = 30.0):
+        self.url = url
+        self.engines = {contract.lower(): engine for contract, engine in engines.items()}
+        self.on_price = on_price
+        self.on_state = on_state
+        self.quote_refresh = quote_refresh
+        self.heartbeat = heartbeat
+        self.connected = False
+        self.connections = 0
+        self.events = 0
+        self._pools = {engine.pool.lower(): contract for contract, engine in self.engines.items()}
+        self._quote_usd: Dict[str, Fraction] = {}
+        self._backoff = PollScheduler(RECONNECT_POLICY)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._set_connected(False)
+        from .onchain_price import close_engines
+
+        await close_engines(self.engines.values())
+
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        STREAM_CONNECTED.set(1 if connected else 0)
+        if self.on_state:
+            self.on_state(connected)
+
+    async def _run(self):
+        while True:
+            try:
+                await self._stream()
+                logger.warning("Price stream closed by the server")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Price stream failed: {type(e).__name__}: {e}")
+            self._set_connected(False)
+            STREAM_RECONNECTS.inc()
+            self._backoff.record_failure()
+            delay = self._backoff.next_delay()
+            logger.info("Reconnecting price stream", extra={"in_s": round(delay, 1)})
+            await asyncio.sleep(delay)
+
+    async def _refresh_quotes(self):
+        for contract, engine in self.engines.items():
+            self._quote_usd[contract] = await engine.quote_usd()
+
+    async def _stream(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        async with self._session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+            await ws.send_json({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["logs", {
+                "address": [engine.pool for engine in self.engines.values()],
+                "topics": [sorted({engine.log_topic for engine in self.engines.values()})],
+            }]})
+            reply = await ws.receive_json(timeout=10)
+            if "error" in reply:
+                raise RuntimeError(f"eth_subscribe refused: {reply['error']}")
+            subscription = reply["result"]
+
+            # Subscribed first, so nothing falls between this read and the events
+            await self._refresh_quotes()
+            for contract, engine in self.engines.items():
+                self.on_price(contract, await engine.get_price())
+            self.connections += 1
+            self._backoff.record_success({})
+            self._set_connected(True)
+            logger.info("Price stream subscribed", extra={"pools": len(self.engines), "subscription": subscription})
+
+            refresh_at = time.monotonic() + self.quote_refresh
+            while True:
+                try:
+                    msg = await ws.receive(timeout=max(0.0, refresh_at - time.monotonic()))
+                except asyncio.TimeoutError:
+                    try:
+                        await self._refresh_quotes()
+                    except Exception as e:
+                        logger.warning(f"Quote feed refresh failed, keeping the last value: {e}")
+                    refresh_at = time.monotonic() + self.quote_refresh
+                    continue
+                if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED,
+                                aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                    return
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._handle(json.loads(msg.data), subscription)
+
+    def _handle(self, message: dict, subscription: str):
+        params = message.get("params") or {}
+        if message.get("method") != "eth_subscription" or params.get("subscription") != subscription:
+            return
+        log = params["result"]
+        if log.get("removed"):
+            # Reorged out; the replacing block's events carry the current state
+            return
+        contract = self._pools.get(log["address"].lower())
+        if contract is None:
+            return
+        engine = self.engines[contract]
+        if not log["topics"] or log["topics"][0].lower() != engine.log_topic:
+            return
+        try:
+            with STAGE_SECONDS.time(stage="parse"):
+                price = engine.price_from_log(bytes.fromhex(log["data"][2:]), self._quote_usd[contract])
+        except Exception as e:
+            ERRORS.inc(stage="parse")
+            logger.warning(f"Could not decode pool event from {engine.pool}: {e}")
+            return
+        self.events += 1
+        STREAM_EVENTS.inc(pool=engine.pool)
+        self.on_price(contract, price)
+
+
+def build_price_stream(config: TrackerConfig, on_price: PriceCallback,
+                       on_state: Optional[StateCallback] = None) -> Optional[PriceStream]:
+    """
+    A stream over the tracker config's pools when PRICE_STREAM_URL (a ws://
+    or wss:// JSON-RPC endpoint) is set, else None
+    """
+    url = os.getenv("PRICE_STREAM_URL")
+    if not url:
+        return None
+    if not config.pools:
+        logger.warning("PRICE_STREAM_URL needs 'pools' in the tracker config, polling only")
+        return None
+    # web3 is only needed when pricing on-chain
+    from .onchain_price import engines_from_config
+
+    return PriceStream(url, engines_from_config(config), on_price, on_state)
+
+
+# Add a test case
+if __name__ == "__main__":
+    # A local node stand-in: JSON-RPC over HTTP answers the engine's Multicall3
+    # reads, and a WebSocket endpoint replays recorded Sync events for
+    # eth_subscribe. The first connection is dropped halfway through to check
+    # reconnect, resubscribe and catch-up. Pass a JSONL file of recorded logs
+    # (as eth_subscription results) to replay those instead of the built-in ones.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.price_stream [logs.jsonl]
+    import random
+    import sys
+    import threading
+
+    from aiohttp import web
+    from eth_abi import decode, encode
+    from eth_utils import to_checksum_address
+    from web3 import AsyncWeb3
+
+    from .onchain_price import (
+        AGGREGATE3, DECIMALS, GET_RESERVES, LATEST_ROUND_DATA, SYNC_TOPIC, TOKEN0, TOKEN1, OnChainPriceEngine,
+    )
+
+    PDT = to_checksum_address("0x375488f097176507e39b9653b88fdc52cde736bf")
+    WETH = to_checksum_address("0x4200000000000000000000000000000000000006")
+    POOL = to_checksum_address("0x" + "11" * 20)
+    OTHER_POOL = to_checksum_address("0x" + "44" * 20)
+    FEED = to_checksum_address("0x" + "33" * 20)
+    ETH_USD = 3000
+
+    def recorded_syncs(count: int = 40, seed: int = 7):
+        """Sync logs of a V2 PDT/WETH pool under random trades, plus a reorged and a foreign log"""
+        rng = random.Random(seed)
+        reserve_pdt, reserve_eth = 6_000_000 * 10 ** 18, 100 * 10 ** 18
+        logs = []
+        for block in range(count):
+            # Constant product trade of up to 2% of the ETH reserve
+            eth_in = int(reserve_eth * rng.uniform(-0.02, 0.02))
+            k = reserve_pdt * reserve_eth
+            reserve_eth += eth_in
+            reserve_pdt = k // reserve_eth
+            logs.append({"address": POOL.lower(), "topics": [SYNC_TOPIC], "removed": False,
+                         "blockNumber": hex(1000 + block),
+                         "data": "0x" + encode(['uint112', 'uint112'], [reserve_pdt, reserve_eth]).hex()})
+        logs.insert(5, dict(logs[4], removed=True))
+        logs.insert(9, dict(logs[8], address=OTHER_POOL.lower()))
+        return logs
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            LOGS = [json.loads(line) for line in f if line.strip()]
+    else:
+        LOGS = recorded_syncs()
+
+    STATE = {
+        (POOL, TOKEN0): encode(['address'], [PDT]),
+        (POOL, TOKEN1): encode(['address'], [WETH]),
+        (PDT, DECIMALS): encode(['uint8'], [18]),
+        (WETH, DECIMALS): encode(['uint8'], [18]),
+        (FEED, DECIMALS): encode(['uint8'], [8]),
+        (FEED, LATEST_ROUND_DATA): encode(['uint80', 'int256', 'uint256', 'uint256', 'uint80'],
+                                          [1, ETH_USD * 10 ** 8, 0, 0, 1]),
+    }
+    replayed = {"next": 0, "connections": 0, "subscriptions": 0}
+
+    def set_reserves(log):
+        reserves = decode(['uint112', 'uint112'], bytes.fromhex(log["data"][2:]))
+        STATE[(POOL, GET_RESERVES)] = encode(['uint112', 'uint112', 'uint32'], [*reserves, 0])
+
+    set_reserves(next(log for log in LOGS if log["address"] == POOL.lower()))
+
+    async def rpc(request):
+        body = await request.json()
+        if body['method'] == 'eth_chainId':
+            return web.json_response({'jsonrpc': '2.0', 'id': body['id'], 'result': '0x2105'})
+        data = bytes.fromhex(body['params'][0]['data'][2:])
+        assert data[:4] == AGGREGATE3
+        (calls,) = decode(['(address,bool,bytes)[]'], data[4:])
+        results = [(True, STATE[(to_checksum_address(target), call_data[:4])]) for target, _, call_data in calls]
+        return web.json_response({'jsonrpc': '2.0', 'id': body['id'],
+                                  'result': '0x' + encode(['(bool,bytes)[]'], [results]).hex()})
+
+    async def subscribe(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        replayed["connections"] += 1
+        message = json.loads((await ws.receive()).data)
+        assert message["method"] == "eth_subscribe" and message["params"][0] == "logs"
+        replayed["subscriptions"] += 1
+        subscription = f"0x{replayed['subscriptions']:x}"
+        await ws.send_json({"jsonrpc": "2.0", "id": message["id"], "result": subscription})
+        await asyncio.sleep(0.05)
+        drop_at = len(LOGS) // 2 if replayed["connections"] == 1 else None
+        while replayed["next"] < len(LOGS):
+            if replayed["next"] == drop_at:
+                # Three swaps happen while the client is disconnected
+                for missed in LOGS[drop_at:drop_at + 3]:
+                    set_reserves(missed)
+                replayed["next"] += 3
+                await ws.close()
+                return ws
+            log = LOGS[replayed["next"]]
+            replayed["next"] += 1
+            if log["address"] == POOL.lower() and not log.get("removed"):
+                set_reserves(log)
+            await ws.send_json({"jsonrpc": "2.0", "method": "eth_subscription",
+                                "params": {"subscription": subscription, "result": log}})
+            await asyncio.sleep(0.005)
+        await ws.receive()
+        return ws
+
+    def start_node():
+        ready = threading.Event()
+        address = {}
+
+        async def serve():
+            app = web.Application()
+            app.router.add_post("/", rpc)
+            app.router.add_get("/ws", subscribe)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            address['port'] = site._server.sockets[0].getsockname()[1]
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+        return f"127.0.0.1:{address['port']}"
+
+    def expected_price(log) -> float:
+        reserve_pdt, reserve_eth = decode(['uint112', 'uint112'], bytes.fromhex(log["data"][2:]))
+        return reserve_eth / reserve_pdt * ETH_USD
+
+    async def main(host):
+        w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(f"http://{host}/"))
+        engine = OnChainPriceEngine(w3, PDT, POOL, "v2", quote_feed=FEED)
+        prices, states = [], []
+        stream = PriceStream(f"ws://{host}/ws", {PDT: engine}, lambda contract, price: prices.append(price),
+                             on_state=states.append)
+        # Reconnect quickly for the test
+        stream._backoff = PollScheduler(PollPolicy(backoff_base=0.2, max_interval=1.0))
+        started = time.perf_counter()
+        stream.start()
+        while replayed["next"] < len(LOGS) or stream.connections < 2:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)
+        await stream.close()
+        elapsed = time.perf_counter() - started
+
+        streamed = [log for log in LOGS if log["address"] == POOL.lower() and not log.get("removed")]
+        final = expected_price(streamed[-1])
+        assert stream.connections == 2 and replayed["subscriptions"] == 2, replayed
+        assert states == [True, False, True, False], states
+        assert abs(prices[-1] - final) < 1e-12 * final, (prices[-1], final)
+        assert stream.events == len(streamed) - 3, stream.events
+        print(f"{len(LOGS)} recorded logs replayed in {elapsed:.2f}s: {stream.events} decoded, "
+              f"{len(prices) - stream.events} catch-up reads, {stream.connections} connections "
+              f"(1 dropped mid-replay, resubscribed)")
+        print(f"first ${prices[0]:.6f}, last ${prices[-1]:.6f} (expected ${final:.6f})")
+
+    asyncio.run(main(start_node()))
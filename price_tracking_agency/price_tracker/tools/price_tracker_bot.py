@@ -0,0 +1,494 @@
+"""
+Discord price tracker: fetches token prices and renders them to every
+configured guild
+"""
+
+__all__ = ['PriceTrackerBot']
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import discord
+from discord import app_commands
+from discord.ext import tasks
+from dotenv import load_dotenv
+
+from .discord_gateway import client_options, own_member
+from .discord_writer import SURFACE_NICKNAME, SURFACE_PRESENCE, DiscordWriter
+from .log_config import configure_logging
+from .metrics import ERRORS, GATEWAY_LATENCY, LOOP_DRIFT, SOURCE_HEALTH, STAGE_SECONDS, start_metrics_server
+from .poll_scheduler import PollPolicy, PollScheduler, retime_loop, retry_after_from
+from .price_aggregator import build_price_source
+from .price_alerts import AlertNotifier, build_alerts
+from .price_commands import AlertCommands, PriceCommands
+from .price_history import SAMPLE_SPACING, PriceHistoryStore
+from .price_source import PriceQuote
+from .price_stream import build_price_stream
+from .snapshot_cache import SnapshotCache
+from .tracker_config import GuildConfig, TrackerConfig, load_tracker_config
+
+load_dotenv()
+
+# Constants
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+
+logger = logging.getLogger(__name__)
+
+class PriceTrackerBot:
+    """
+    Tracks token prices and updates Discord nicknames/status across every
+    guild in the tracker config.
+
+    This is plain Python with no agent framework imports, so bot mode starts
+    without loading agency_swarm; PriceTrackerTool wraps it for the agent.
+
+    `update_interval` is the first interval; after that a PollScheduler
+    polls faster when prices move and slower when they are flat, within the
+    POLL_* bounds and quota, and backs off on failures.
+
+    With PRICE_STREAM_URL set, prices for tokens with a configured pool are
+    pushed from swap events as they happen. Bursts of events coalesce into
+    at most one render every STREAM_MIN_INTERVAL seconds, and the writer
+    still rate limits the Discord writes. Polling then only refreshes the
+    24h change at the longest interval, and takes over again whenever the
+    stream is down.
+
+    As a cluster worker (`price_feed` set to a PricePublisher socket), the
+    bot runs only `shard_ids` of `shard_count` shards and renders the prices
+    it is sent instead of fetching them; `writer` then carries this
+    worker's share of Discord's global rate limit.
+
+    `/price` and `/chart` slash commands answer from the snapshot and local
+    history. They are synced with Discord on startup unless
+    SYNC_COMMANDS=0; in a cluster only the worker with shard 0 syncs them.
+
+    `/alert` subscriptions are checked against every set of quotes applied
+    and delivered through the writer alongside the nickname writes, unless
+    ALERTS=0. A cluster worker loads only the alerts of its own shards'
+    guilds.
+    """
+
+    def __init__(self, update_interval: int = 300, config: Optional[TrackerConfig] = None,
+                 shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None,
+                 price_feed: Optional[str] = None, writer: Optional[DiscordWriter] = None):
+        self.update_interval = update_interval
+        # Lean gateway by default: guilds intent only, no member cache or chunking
+        client_kwargs = client_options()
+        self.price_update_loop: Optional[tasks.Loop] = None
+        self._config = config or load_tracker_config()
+        self._previous_prices: Dict[str, float] = {}
+        self._scheduler = PollScheduler(PollPolicy.from_env(update_interval))
+        # Wall-clock time the loop scheduled the next tick for
+        self._next_tick: Optional[float] = None
+        print("Initializing Discord client with intents:", client_kwargs["intents"])
+        if shard_count is not None:
+            self._discord_client = discord.AutoShardedClient(
+                shard_ids=shard_ids, shard_count=shard_count, **client_kwargs)
+        else:
+            self._discord_client = discord.Client(**client_kwargs)
+        # Workers are sent their prices; only a standalone bot fetches them
+        self.price_feed = price_feed
+        self._feed_task: Optional[asyncio.Task] = None
+        self._price_source = build_price_source(self._config) if price_feed is None else None
+        self._writer = writer or DiscordWriter()
+        self._snapshot = SnapshotCache()
+        self._history = PriceHistoryStore()
+        self._commands = PriceCommands(self._config, self._snapshot, self._history)
+        self._command_tree = app_commands.CommandTree(self._discord_client)
+        self._commands.register(self._command_tree)
+        # Same shard formula as discord.py: (guild_id >> 22) % shard_count
+        self._alerts = build_alerts(None if shard_count is None else (
+            lambda guild_id: (guild_id >> 22) % shard_count in (shard_ids or range(shard_count))))
+        self._notifier = AlertNotifier(self._discord_client, self._writer, self._config.tokens)
+        if self._alerts is not None:
+            AlertCommands(self._alerts, self._commands).register(self._command_tree)
+        self.sync_commands = os.getenv("SYNC_COMMANDS", "1") != "0" and (shard_ids is None or 0 in shard_ids)
+        self._sync_task: Optional[asyncio.Task] = None
+        self.stream_interval = float(os.getenv("STREAM_MIN_INTERVAL", "2"))
+        self._stream = build_price_stream(
+            self._config, self._on_stream_price, self._on_stream_state) if price_feed is None else None
+        self._stream_prices: Dict[str, float] = {}
+        # When each token last took a streamed price (time.monotonic())
+        self._streamed_at: Dict[str, float] = {}
+        self._stream_wakeup = asyncio.Event()
+        self._stream_task: Optional[asyncio.Task] = None
+        if self._snapshot.load(self._config.contracts()):
+            print(f"Loaded price snapshot from {self._snapshot.path}")
+            self._previous_prices = {
+                address: quote.price
+                for address, quote in self._snapshot.quotes(self._config.contracts()).items()
+            }
+            # Presence does not survive a reconnect, so only nicknames are restored
+            self._writer.restore({
+                key: value for key, value in self._snapshot.applied.items()
+                if key[1] == SURFACE_NICKNAME
+            })
+        self.setup_discord_bot()
+
+    def create_price_loop(self):
+        try:
+            loop = tasks.loop(seconds=self.update_interval)(self.price_update_loop_func)
+            logger.debug(f"Created price update loop with interval: {self.update_interval} seconds")
+            return loop
+        except Exception as e:
+            logger.error(f"Error creating price update loop: {e}")
+            return None
+
+    async def price_update_loop_func(self):
+        started = time.monotonic()
+        if self._next_tick is not None:
+            LOOP_DRIFT.observe(time.time() - self._next_tick)
+        try:
+            logger.debug("Running price update")
+            contracts = self._config.contracts()
+            if not self._scheduler.polls and all(self._snapshot.is_fresh(contract) for contract in contracts):
+                # Right after a restart the snapshot may still be fresh
+                logger.debug("Using fresh cached price data")
+                quotes = self._snapshot.quotes(contracts)
+            else:
+                # Fetch every tracked token in one request per source
+                polled_at = time.monotonic()
+                try:
+                    with STAGE_SECONDS.time(stage="fetch"):
+                        quotes = await self._price_source.fetch_many(contracts)
+                except Exception as e:
+                    ERRORS.inc(stage="fetch")
+                    self._scheduler.record_failure(retry_after_from(e))
+                    raise
+                self._scheduler.record_success({address: quote.price for address, quote in quotes.items()})
+                if self._stream is not None and self._stream.connected:
+                    # A swap that arrived while fetching is newer than the poll, which
+                    # then only brings the 24h change. On a quiet pool the polled price
+                    # is the newer one: the streamed price does not follow the quote
+                    # asset's USD price between swaps.
+                    streamed = self._snapshot.quotes(self._stream.engines)
+                    quotes = {
+                        address: PriceQuote(price=streamed[address].price, change_24h=quote.change_24h)
+                        if address in streamed and self._streamed_at.get(address, polled_at) > polled_at
+                        else quote
+                        for address, quote in quotes.items()
+                    }
+                for name, health in self._price_source.health.items():
+                    SOURCE_HEALTH.set(health.score, source=name)
+                    logger.debug(f"Price source {name}: {health}")
+                for address, quote in quotes.items():
+                    self._snapshot.put(address, quote)
+                    self._history.record(address, quote.price)
+
+            for symbol, token in self._config.tokens.items():
+                quote = quotes.get(token.key)
+                if quote:
+                    logger.info("Price update", extra={
+                        "token": symbol, "price": quote.price, "change_24h": quote.change_24h})
+                    # Trend windows come from the local history, not extra API calls
+                    for window, stats in self._history.window_stats(token.key).items():
+                        if stats:
+                            logger.debug("Price window", extra={
+                                "token": symbol, "window": window, "change_pct": stats.change_pct,
+                                "high": stats.high, "low": stats.low, "volatility_pct": stats.volatility_pct})
+
+            await self.apply_quotes(quotes)
+
+            for address, quote in quotes.items():
+                self._previous_prices[address] = quote.price
+            self.save_snapshot()
+            logger.info("Price update complete", extra={"seconds": round(time.monotonic() - started, 3)})
+
+        except Exception as e:
+            ERRORS.inc(stage="cycle")
+            logger.error("Price update failed", extra={"error": f"{type(e).__name__}: {e}"})
+        finally:
+            STAGE_SECONDS.observe(time.monotonic() - started, stage="cycle")
+            delay = self._schedule_next()
+            logger.debug("Next price update scheduled", extra={"next_update_s": round(delay, 1)})
+
+    def _schedule_next(self) -> float:
+        """Retime the loop's next tick from the poll scheduler and return the delay"""
+        delay = self._scheduler.next_delay()
+        if self._stream is not None and self._stream.connected:
+            delay = max(delay, self._scheduler.policy.max_interval)
+        loop = self.price_update_loop
+        self._next_tick = retime_loop(loop, delay) if loop is not None else None
+        return delay
+
+    def _on_stream_price(self, contract: str, price: float):
+        # Only the latest price per token is kept until the next render
+        self._stream_prices[contract] = price
+        self._stream_wakeup.set()
+
+    def _on_stream_state(self, connected: bool):
+        if connected:
+            logger.info("Price stream up, polling for the 24h change only")
+        else:
+            logger.warning("Price stream down, falling back to polling")
+        self._schedule_next()
+
+    async def _apply_stream(self):
+        """Render streamed prices, at most once every `stream_interval` seconds"""
+        while True:
+            await self._stream_wakeup.wait()
+            self._stream_wakeup.clear()
+            prices, self._stream_prices = self._stream_prices, {}
+            started = time.monotonic()
+            try:
+                for address, price in prices.items():
+                    last = self._snapshot.quotes([address]).get(address)
+                    if last is None:
+                        # Pool events carry no 24h change: the first poll renders this token
+                        continue
+                    quote = PriceQuote(price=price, change_24h=last.change_24h)
+                    self._snapshot.put(address, quote)
+                    self._streamed_at[address] = time.monotonic()
+                    # Swaps can come every few seconds; the ring holds months of minute samples
+                    self._history.record(address, price, min_spacing=SAMPLE_SPACING)
+                    self._previous_prices[address] = price
+                await self.apply_quotes(self._snapshot.quotes(self._config.contracts()))
+            except Exception as e:
+                ERRORS.inc(stage="stream")
+                logger.error("Streamed price update failed", extra={"error": f"{type(e).__name__}: {e}"})
+            finally:
+                STAGE_SECONDS.observe(time.monotonic() - started, stage="stream")
+            await asyncio.sleep(self.stream_interval)
+
+    async def _follow_feed(self):
+        """Render every tick from the cluster's price publisher"""
+        from .shard_cluster import PriceSubscriber
+
+        subscriber = PriceSubscriber(self.price_feed)
+        try:
+            async for quotes in subscriber:
+                started = time.monotonic()
+                try:
+                    for address, quote in quotes.items():
+                        self._snapshot.put(address, quote)
+                        self._previous_prices[address] = quote.price
+                    await self.apply_quotes(self._snapshot.quotes(self._config.contracts()))
+                    self.save_snapshot()
+                except Exception as e:
+                    ERRORS.inc(stage="cycle")
+                    logger.error("Price update failed", extra={"error": f"{type(e).__name__}: {e}"})
+                finally:
+                    STAGE_SECONDS.observe(time.monotonic() - started, stage="cycle")
+        finally:
+            await subscriber.close()
+
+    async def apply_quotes(self, quotes: Dict[str, PriceQuote]):
+        """Render `quotes` to every configured guild and the bot's presence"""
+        # Fan the result out to every configured guild
+        for guild_config in self._config.guilds:
+            token = self._config.tokens[guild_config.token]
+            quote = quotes.get(token.key)
+            if not quote:
+                logger.warning("No price, skipping guild", extra={
+                    "token": token.symbol, "guild_id": guild_config.guild_id})
+                continue
+            await self.update_guild(guild_config, quote)
+
+        presence_token = self._config.tokens[self._config.presence_token]
+        presence_quote = quotes.get(presence_token.key)
+        if presence_quote:
+            if presence_quote.change_24h is not None:
+                status_text = f"{presence_token.symbol} 24h: {presence_quote.change_24h:+.2f}%"
+            else:
+                status_text = f"{presence_token.symbol} ${presence_quote.price:.4f}"
+            self._writer.submit(None, SURFACE_PRESENCE, status_text, self._apply_presence)
+
+        if self._alerts is not None:
+            self._notifier.notify(self._alerts.observe(quotes))
+
+        # Wait for the queued nickname, presence and alert writes to go out
+        await self._writer.flush()
+        logger.debug("Discord writes", extra=self._writer.stats())
+
+    def save_snapshot(self):
+        """Persist the cached prices, applied nicknames and price history"""
+        self._snapshot.set_applied({
+            key: value for key, value in self._writer.applied().items()
+            if key[1] == SURFACE_NICKNAME
+        })
+        self._snapshot.save()
+        self._history.flush()
+
+    async def update_guild(self, guild_config: GuildConfig, quote: PriceQuote):
+        """Update the bot's nickname in one guild with its token's price"""
+        token = self._config.tokens[guild_config.token]
+        try:
+            guild = self._discord_client.get_guild(guild_config.guild_id)
+            if not guild:
+                logger.warning("Guild not found", extra={"guild_id": guild_config.guild_id})
+                return
+
+            # Get bot's role; fetched on demand since members are not cached
+            bot_member = await own_member(self._discord_client, guild)
+
+            # Skip the per-guild dumps entirely unless debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                # Debug role hierarchy
+                logger.debug("\nRole hierarchy:")
+                for role in sorted(guild.roles, key=lambda r: r.position, reverse=True):
+                    logger.debug(f"- {role.name} (position: {role.position})")
+
+                # Debug bot permissions
+                logger.debug("\nBot permissions:")
+                for perm, value in bot_member.guild_permissions:
+                    if value:
+                        logger.debug(f"- {perm}")
+
+                logger.debug(f"Bot's role position in {guild.name}: {bot_member.top_role.position}")
+
+            # Queue the nickname write; unchanged nicknames are dropped
+            nick = f"{token.symbol} ${quote.price:.4f}"
+            if quote.change_24h is not None:
+                nick += f" {'📈' if quote.change_24h >= 0 else '📉'}"
+
+            async def apply_nickname(value: str):
+                await bot_member.edit(nick=value)
+                logger.info("Updated nickname", extra={"guild": guild.name, "nick": value})
+
+            if not self._writer.submit(guild.id, SURFACE_NICKNAME, nick, apply_nickname):
+                logger.debug(f"Nickname in {guild.name} unchanged, skipping edit")
+
+        except Exception as e:
+            ERRORS.inc(stage=SURFACE_NICKNAME)
+            logger.error("Error accessing guild", extra={"guild_id": guild_config.guild_id, "error": str(e)})
+
+    async def _apply_presence(self, text: str):
+        await self._discord_client.change_presence(
+            status=discord.Status.online,
+            activity=discord.Activity(
+                type=discord.ActivityType.watching,
+                name=text
+            )
+        )
+        logger.info("Status updated", extra={"status": text})
+
+    def setup_discord_bot(self):
+        print("\nChecking Discord permissions...")
+        
+        @self._discord_client.event
+        async def on_ready():
+            logger.info("Bot logged in", extra={
+                "user": str(self._discord_client.user),
+                "guilds": [g.name for g in self._discord_client.guilds]})
+            if not self.price_update_loop and self._feed_task is None:
+                # Check bot's role position
+                for guild in self._discord_client.guilds:
+                    try:
+                        bot_member = await own_member(self._discord_client, guild)
+                    except discord.HTTPException as e:
+                        logger.warning(f"Could not fetch the bot's member in {guild.name}: {e}")
+                        bot_member = None
+                    if bot_member:
+                        bot_role = bot_member.top_role
+                        logger.info(f"\nChecking bot role in {guild.name}:")
+                        logger.info(f"Bot role: {bot_role.name} (position: {bot_role.position})")
+                        
+                        # Check if any roles are above bot's role
+                        higher_roles = [r for r in guild.roles if r.position > bot_role.position]
+                        if higher_roles:
+                            logger.warning("WARNING: These roles are above the bot's role:")
+                            for role in higher_roles:
+                                logger.warning(f"- {role.name} (position: {role.position})")
+                            logger.warning("Consider moving the bot's role higher for better functionality")
+
+                cached = self._snapshot.quotes(self._config.contracts())
+                if cached:
+                    # Render the last known prices now; the loop revalidates them
+                    logger.info("Rendering cached prices while fetching fresh ones")
+                    await self.apply_quotes(cached)
+                else:
+                    # Set initial activity; a single presence update replaces any old one
+                    self._writer.submit(None, SURFACE_PRESENCE, "Loading PDT Tracker...", self._apply_presence)
+                    await self._writer.flush()
+                logger.info("Initial status set")
+
+                if self.price_feed is not None:
+                    self._feed_task = asyncio.create_task(self._follow_feed())
+                    logger.info("Following cluster price feed", extra={"socket": self.price_feed})
+                else:
+                    # Then start the price update loop
+                    self.price_update_loop = self.create_price_loop()
+                    self.price_update_loop.start()
+                    logger.info("Price update loop started", extra={"interval_s": self.update_interval})
+
+                    if self._stream is not None:
+                        self._stream.start()
+                        self._stream_task = asyncio.create_task(self._apply_stream())
+
+                # Prices are already updating, so a failed sync only costs the slash commands
+                if self.sync_commands and self._sync_task is None:
+                    self._sync_task = asyncio.create_task(self._sync_commands())
+
+    async def _sync_commands(self):
+        """Register the slash commands with Discord"""
+        try:
+            if self._discord_client.application_id is None:
+                logger.warning("Not syncing slash commands: the client has no application ID")
+                return
+            synced = await self._command_tree.sync()
+            logger.info("Slash commands synced", extra={"commands": [c.name for c in synced]})
+        except Exception as e:
+            # Usually the bot was invited without the applications.commands scope
+            logger.warning(f"Could not sync slash commands: {type(e).__name__}: {e}")
+
+    def run(self):
+        """
+        Start the Discord bot and price tracking
+        """
+        print("Checking Discord token...")
+        if not DISCORD_TOKEN or DISCORD_TOKEN == "your_discord_bot_token":
+            raise ValueError(
+                "Invalid Discord token. Please update your .env file with a valid token from "
+                "https://discord.com/developers/applications"
+            )
+        
+        print("Starting bot...")
+        print(f"Tracking tokens: {', '.join(self._config.tokens)}")
+        print(f"Using guild IDs: {[g.guild_id for g in self._config.guilds]}")
+        
+        print("Connecting to Discord...")
+        configure_logging()
+        try:
+            asyncio.run(self._run_client())
+        except KeyboardInterrupt:
+            pass
+        return "Bot started successfully"
+
+    async def _run_client(self):
+        """Run the Discord client and release the price source on shutdown"""
+        metrics_server = await start_metrics_server()
+        GATEWAY_LATENCY.set_function(lambda: self._discord_client.latency)
+        try:
+            async with self._discord_client:
+                await self._discord_client.start(DISCORD_TOKEN)
+        finally:
+            if self._stream is not None:
+                await self._stream.close()
+            if self._stream_task is not None:
+                self._stream_task.cancel()
+            if self._sync_task is not None:
+                self._sync_task.cancel()
+            if self._feed_task is not None:
+                self._feed_task.cancel()
+                await asyncio.gather(self._feed_task, return_exceptions=True)
+            if self._price_source is not None:
+                await self._price_source.close()
+            if self._alerts is not None:
+                self._alerts.store.close()
+            if metrics_server:
+                await metrics_server.stop()
+
+    async def force_status_update(self, text: str):
+        """Force update the bot's status"""
+        try:
+            # Forget the applied value so the write goes out even if unchanged
+            self._writer.invalidate(None, SURFACE_PRESENCE)
+            self._writer.submit(None, SURFACE_PRESENCE, text, self._apply_presence)
+            await self._writer.flush()
+            logger.info("Forced status update", extra={"status": text})
+        except Exception as e:
+            ERRORS.inc(stage=SURFACE_PRESENCE)
+            logger.error("Error forcing status update", extra={"error": str(e)}) 
\ No newline at end of file
@@ -0,0 +1,443 @@
+"""
+A pool of Base JSON-RPC endpoints behind one web3 provider, with health based
+selection, failover and request batching
+"""
+
+__all__ = ['DEFAULT_RPC_URL', 'RpcEndpoint', 'RpcEndpointPool', 'rpc_urls_from_env', 'build_web3']
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from web3 import AsyncWeb3
+from web3.exceptions import ProviderConnectionError
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from .metrics import RPC_CALLS, RPC_FAILURES, RPC_HEALTH, RPC_SECONDS
+from .poll_scheduler import RateLimitedError, retry_after_from
+from .price_aggregator import SourceHealth
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RPC_URL = "https://mainnet.base.org"
+# An endpoint that fails sits out this long, doubling with each failure in a row
+FAILURE_COOLDOWN = 2.0
+MAX_COOLDOWN = 60.0
+# Health below this counts as this, so a bad endpoint's cost stays finite
+MIN_SCORE = 0.05
+# Answers that cannot change while the endpoints serve the same chain.
+# web3 asks for the chain ID around every eth_call.
+CONSTANT_METHODS = frozenset({"eth_chainId", "net_version"})
+
+
+class RpcEndpoint:
+    """One JSON-RPC URL, its rolling health and when it may be used again"""
+
+    def __init__(self, url: str, name: str):
+        self.url = url
+        # URLs often carry API keys, so logs and metrics only show the host
+        self.name = name
+        self.health = SourceHealth()
+        self.failures_in_row = 0
+        self.cooling_until = 0.0
+        self.rate_limited = False
+        self.last_used = 0.0
+        self.probing = False
+
+    def cost(self) -> float:
+        """Expected seconds per useful answer: rolling latency over health. 0 until measured."""
+        if self.health.latency is None:
+            return 0.0
+        return self.health.latency / max(self.health.score, MIN_SCORE)
+
+    def __repr__(self):
+        return f"RpcEndpoint({self.name}, {self.health!r})"
+
+
+def _endpoint_names(urls: List[str]) -> List[str]:
+    names = []
+    for index, url in enumerate(urls):
+        parts = urlsplit(url)
+        name = parts.hostname or f"endpoint{index}"
+        if parts.port:
+            name += f":{parts.port}"
+        names.append(name if name not in names else f"{name}#{index}")
+    return names
+
+
+class RpcEndpointPool(AsyncJSONBaseProvider):
+    """
+    web3 async provider over several JSON-RPC endpoints.
+
+    Each post goes to the ready endpoint with the lowest cost, its rolling
+    latency divided by its health score (the SourceHealth price sources
+    use), and fails over down that ranking when an endpoint errors, times
+    out or answers a non-2xx status. A failed endpoint then sits out
+    FAILURE_COOLDOWN seconds, doubling with each failure in a row, or its
+    Retry-After. Endpoints still cooling are tried last rather than never.
+    Every endpoint left idle for `probe_interval` seconds, cooling or not
+    unless it asked to be left alone with a Retry-After, is sent an
+    eth_blockNumber in the background, so a recovered or faster endpoint
+    wins traffic back without a caller waiting on it.
+
+    Calls made in the same event loop iteration, such as reads started
+    together with asyncio.gather, go out as one JSON-RPC batch of up to
+    `max_batch` calls; `batch_window` seconds lets more calls join.
+    `w3.batch_requests()` batches are sent as they are. All endpoints share
+    one aiohttp session, so connections stay open between ticks.
+
+    The first answer to a CONSTANT_METHODS call is kept and reused, which
+    saves web3's eth_chainId round trips around every eth_call. All the URLs
+    must serve the same chain.
+
+    JSON-RPC errors inside a response (a reverted eth_call, say) are the
+    caller's answer, not the endpoint's fault, and are passed through.
+    """
+
+    def __init__(self, urls: List[str], timeout: float = 5.0, connect_timeout: float = 3.0,
+                 max_batch: int = 20, batch_window: float = 0.0, probe_interval: float = 30.0,
+                 pool_size: int = 20, keepalive_timeout: float = 75.0):
+        if not urls:
+            raise ValueError("RpcEndpointPool needs at least one URL")
+        super().__init__()
+        self.endpoints = [RpcEndpoint(url, name) for url, name in zip(urls, _endpoint_names(urls))]
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.probe_interval = probe_interval
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.posts = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._constants: Dict[str, Any] = {}
+
+    def __str__(self) -> str:
+        return f"RPC pool {', '.join(endpoint.name for endpoint in self.endpoints)}"
+
+    def ranked(self, now: Optional[float] = None) -> List[RpcEndpoint]:
+        """Endpoints in the order to try them: ready ones cheapest first, then cooling ones soonest first"""
+        now = now if now is not None else time.monotonic()
+        ready = sorted((e for e in self.endpoints if e.cooling_until <= now), key=RpcEndpoint.cost)
+        cooling = sorted((e for e in self.endpoints if e.cooling_until > now), key=lambda e: e.cooling_until)
+        return ready + cooling
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                headers={"Content-Type": "application/json", "Accept": "application/json"},
+            )
+        return self._session
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request = self.form_request(method, params)
+        if method in self._constants:
+            return {"jsonrpc": "2.0", "id": request["id"], "result": self._constants[method]}
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = (loop.call_later(self.batch_window, self._flush) if self.batch_window
+                                  else loop.call_soon(self._flush))
+        response = await future
+        if method in CONSTANT_METHODS and "error" not in response and response.get("result") is not None:
+            self._constants[method] = response["result"]
+        return response
+
+    async def make_batch_request(self, requests: List[Tuple[RPCEndpoint, Any]]) -> List[RPCResponse]:
+        return await self._post([self.form_request(method, params) for method, params in requests])
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._spawn(self._send(batch))
+        self._probe_idle()
+
+    async def _send(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            responses = await self._post([request for request, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+    async def _attempt(self, endpoint: RpcEndpoint, requests: List[dict], body: bytes) -> List[RPCResponse]:
+        """Post `body` to `endpoint`; its responses in request order, or raise"""
+        async with self._get_session().post(endpoint.url, data=body) as response:
+            response.raise_for_status()
+            raw = await response.read()
+        decoded = self.decode_rpc_response(raw)
+        if len(requests) == 1 and isinstance(decoded, dict):
+            decoded = [decoded]
+        if not isinstance(decoded, list):
+            raise ValueError(f"Expected a batch response, got {str(decoded)[:200]}")
+        by_id = {response.get("id"): response for response in decoded if isinstance(response, dict)}
+        missing = [request["id"] for request in requests if request["id"] not in by_id]
+        if missing:
+            raise ValueError(f"No response to call IDs {missing}")
+        return [by_id[request["id"]] for request in requests]
+
+    async def _post(self, requests: List[dict]) -> List[RPCResponse]:
+        """Send `requests` as one post, failing over across endpoints"""
+        body = (self.encode_rpc_dict(requests[0]) if len(requests) == 1
+                else self.encode_batch_request_dicts(requests))
+        errors = []
+        retry_afters = []
+        for endpoint in self.ranked():
+            started = time.monotonic()
+            endpoint.last_used = started
+            self.posts += 1
+            RPC_CALLS.inc(len(requests), endpoint=endpoint.name)
+            try:
+                responses = await self._attempt(endpoint, requests, body)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                retry_after = self._record_failure(endpoint, e)
+                retry_afters.append(retry_after)
+                errors.append(f"{endpoint.name}: {type(e).__name__}: {e}")
+                continue
+            self._record_success(endpoint, time.monotonic() - started)
+            return responses
+        if all(retry_after is not None for retry_after in retry_afters):
+            raise RateLimitedError(f"Every JSON-RPC endpoint is rate limited: {'; '.join(errors)}",
+                                   min(retry_afters))
+        raise ProviderConnectionError(f"Every JSON-RPC endpoint failed: {'; '.join(errors)}")
+
+    def _record_success(self, endpoint: RpcEndpoint, latency: float):
+        endpoint.health.record_success(latency)
+        endpoint.failures_in_row = 0
+        endpoint.cooling_until = 0.0
+        endpoint.rate_limited = False
+        RPC_SECONDS.observe(latency, endpoint=endpoint.name)
+        RPC_HEALTH.set(endpoint.health.score, endpoint=endpoint.name)
+
+    def _record_failure(self, endpoint: RpcEndpoint, error: BaseException) -> Optional[float]:
+        """Count a failure and cool the endpoint down; the Retry-After it sent, if any"""
+        endpoint.health.record_failure()
+        endpoint.failures_in_row += 1
+        retry_after = retry_after_from(error)
+        cooldown = retry_after if retry_after is not None else min(
+            MAX_COOLDOWN, FAILURE_COOLDOWN * 2 ** (endpoint.failures_in_row - 1))
+        endpoint.cooling_until = time.monotonic() + cooldown
+        endpoint.rate_limited = retry_after is not None
+        RPC_FAILURES.inc(endpoint=endpoint.name)
+        RPC_HEALTH.set(endpoint.health.score, endpoint=endpoint.name)
+        logger.warning(f"JSON-RPC endpoint {endpoint.name} failed, cooling down {cooldown:.0f}s: "
+                       f"{type(error).__name__}: {error}")
+        return retry_after
+
+    def _probe_idle(self):
+        """Measure endpoints that have not been used for a while, off the callers' path"""
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            if (not endpoint.probing and not (endpoint.rate_limited and endpoint.cooling_until > now)
+                    and now - endpoint.last_used >= self.probe_interval):
+                endpoint.probing = True
+                endpoint.last_used = now
+                self._spawn(self._probe(endpoint))
+
+    async def _probe(self, endpoint: RpcEndpoint):
+        request = self.form_request(RPCEndpoint("eth_blockNumber"), [])
+        started = time.monotonic()
+        try:
+            await self._attempt(endpoint, [request], self.encode_rpc_dict(request))
+        except Exception as e:
+            self._record_failure(endpoint, e)
+        else:
+            self._record_success(endpoint, time.monotonic() - started)
+        finally:
+            endpoint.probing = False
+
+    async def disconnect(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def rpc_urls_from_env() -> List[str]:
+    """BASE_RPC_URLS (comma separated), else BASE_RPC_URL, else the public Base endpoint"""
+    urls = [url.strip() for url in os.getenv("BASE_RPC_URLS", "").split(",") if url.strip()]
+    return urls or [os.getenv("BASE_RPC_URL") or DEFAULT_RPC_URL]
+
+
+def build_web3(urls: Optional[List[str]] = None) -> AsyncWeb3:
+    """AsyncWeb3 over an RpcEndpointPool of `urls` or the configured endpoints"""
+    return AsyncWeb3(RpcEndpointPool(urls or rpc_urls_from_env(),
+                                     batch_window=float(os.getenv("RPC_BATCH_WINDOW", "0"))))
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Three local JSON-RPC stand-ins with injected latency and failures: a
+    # fast one, a slow one and a flaky one. Compares the pool with a plain
+    # AsyncHTTPProvider on each, takes the fast one down mid-run, and counts
+    # posts and connections for concurrent reads.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.rpc_pool
+    import random
+    import statistics
+    import threading
+
+    from aiohttp import web
+
+    TARGET = "0xcA11bde05977b3631167028862bE2a173976CA11"
+    RESULTS = {"eth_call": "0x" + "00" * 31 + "2a", "eth_blockNumber": "0x10", "eth_chainId": "0x2105"}
+
+    class StandInNode:
+        """JSON-RPC over HTTP that answers slowly, fails at random or goes down on demand"""
+
+        def __init__(self, latency: float, error_rate: float = 0.0, seed: int = 0):
+            self.latency = latency
+            self.error_rate = error_rate
+            self.down = False
+            self.rng = random.Random(seed)
+            self.posts = 0
+            self.calls = 0
+            self.connections = set()
+            self.url = ""
+
+        async def handle(self, request):
+            self.posts += 1
+            self.connections.add(request.transport.get_extra_info("peername"))
+            await asyncio.sleep(self.latency * self.rng.uniform(0.8, 1.2))
+            if self.down or self.rng.random() < self.error_rate:
+                return web.Response(status=503)
+            body = await request.json()
+            calls = body if isinstance(body, list) else [body]
+            self.calls += len(calls)
+            answers = [{"jsonrpc": "2.0", "id": call["id"], "result": RESULTS[call["method"]]} for call in calls]
+            return web.json_response(answers if isinstance(body, list) else answers[0])
+
+    def start_nodes(nodes):
+        ready = threading.Event()
+
+        async def serve():
+            for node in nodes:
+                app = web.Application()
+                app.router.add_post("/", node.handle)
+                runner = web.AppRunner(app)
+                await runner.setup()
+                site = web.TCPSite(runner, "127.0.0.1", 0)
+                await site.start()
+                node.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+            ready.set()
+            await asyncio.Event().wait()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        ready.wait()
+
+    fast = StandInNode(0.02, seed=1)
+    slow = StandInNode(0.12, seed=2)
+    flaky = StandInNode(0.01, error_rate=0.4, seed=3)
+    nodes = {"fast": fast, "slow": slow, "flaky": flaky}
+    start_nodes(list(nodes.values()))
+
+    async def ticks(w3: AsyncWeb3, count: int, pause: float = 0.0, during=None) -> Tuple[List[float], int]:
+        """Run `count` sequential eth_calls; their latencies and how many failed"""
+        seconds, failed = [], 0
+        for i in range(count):
+            if during:
+                during(i)
+            started = time.perf_counter()
+            try:
+                await w3.eth.call({"to": TARGET, "data": "0x"})
+                seconds.append(time.perf_counter() - started)
+            except Exception:
+                failed += 1
+            await asyncio.sleep(pause)
+        return seconds, failed
+
+    def calls_by_node(before):
+        return {name: node.calls - before[name] for name, node in nodes.items()}
+
+    def report(label, seconds, failed):
+        p99 = sorted(seconds)[int(len(seconds) * 0.99) - 1] if seconds else float("nan")
+        print(f"{label:<26} p50 {statistics.median(seconds) * 1000:6.1f}ms, p99 {p99 * 1000:6.1f}ms, "
+              f"{failed:3d} failed")
+
+    async def main():
+        # Each endpoint alone
+        for name, node in nodes.items():
+            w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(node.url, exception_retry_configuration=None))
+            report(f"AsyncHTTPProvider {name}", *await ticks(w3, 100))
+            await w3.provider.disconnect()
+
+        # The pool picks the fast endpoint and shrugs off the flaky one
+        pool = RpcEndpointPool([slow.url, flaky.url, fast.url], probe_interval=1.0)
+        w3 = AsyncWeb3(pool)
+        before = {name: node.calls for name, node in nodes.items()}
+        seconds, failed = await ticks(w3, 300)
+        report("pool", seconds, failed)
+        assert failed == 0
+        served = calls_by_node(before)
+        print(f"  calls served: {served}")
+        assert served["fast"] > 0.8 * sum(served.values()), served
+
+        # The fast endpoint goes down for a while and comes back
+        def outage(i):
+            fast.down = 100 <= i < 200
+
+        before = {name: node.calls for name, node in nodes.items()}
+        seconds, failed = await ticks(w3, 400, pause=0.01, during=outage)
+        report("pool, fast one down 100-200", seconds, failed)
+        assert failed == 0
+        served = calls_by_node(before)
+        print(f"  calls served: {served}, endpoints: {pool.endpoints}")
+        # Probes bring the fast endpoint back once it recovers
+        assert served["fast"] > served["slow"], served
+
+        # Concurrent reads share one post; keep-alive keeps the connection count flat
+        for label, provider in (("AsyncHTTPProvider", AsyncWeb3.AsyncHTTPProvider(fast.url)),
+                                ("pool", RpcEndpointPool([fast.url]))):
+            batch_w3 = AsyncWeb3(provider)
+            posts, connections = fast.posts, len(fast.connections)
+            started = time.perf_counter()
+            for _ in range(5):
+                results = await asyncio.gather(*(batch_w3.eth.call({"to": TARGET, "data": "0x"}) for _ in range(10)))
+                assert all(int.from_bytes(result, "big") == 42 for result in results)
+            elapsed = time.perf_counter() - started
+            print(f"{label:<26} 5 rounds of 10 concurrent eth_calls: {fast.posts - posts} posts, "
+                  f"{len(fast.connections) - connections} new connections, {elapsed * 1000:.0f}ms")
+            await provider.disconnect()
+
+        async with w3.batch_requests() as batch:
+            batch.add(w3.eth.block_number)
+            batch.add(w3.eth.chain_id)
+            block_number, chain_id = await batch.async_execute()
+        assert (block_number, chain_id) == (16, 8453)
+        await pool.disconnect()
+
+    asyncio.run(main())
@@ -0,0 +1,467 @@
+"""
+Sharded multi-process deployment: one price publisher feeding many Discord
+worker processes over a local Unix socket
+"""
+
+__all__ = [
+    'PricePublisher', 'PriceSubscriber', 'WorkerSpec', 'ShardSupervisor',
+    'shard_for', 'recommended_shards', 'assign_shards', 'run_worker', 'run_cluster',
+]
+
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .log_config import configure_logging
+from .metrics import ERRORS, STAGE_SECONDS, start_metrics_server
+from .poll_scheduler import PollPolicy, PollScheduler, retry_after_from
+from .price_source import PriceQuote
+from .tracker_config import TrackerConfig, load_tracker_config
+
+logger = logging.getLogger(__name__)
+
+# Discord requires a shard per 2,500 guilds; staying well under leaves room to grow
+GUILDS_PER_SHARD = 1000
+# Discord's global limit is 50 requests per second per bot, shared by every shard
+DEFAULT_GLOBAL_RATE = 50
+# A worker this far behind is disconnected and resumes from the latest tick
+MAX_BUFFERED_BYTES = 1 << 20
+# Workers that stay up this long are considered healthy again
+STABLE_AFTER = 60.0
+
+RECONNECT_POLICY = PollPolicy(backoff_base=0.5, max_interval=30.0)
+RESTART_POLICY = PollPolicy(backoff_base=1.0, max_interval=60.0)
+
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    """The shard Discord delivers `guild_id` to"""
+    return (guild_id >> 22) % shard_count
+
+
+def recommended_shards(guild_count: int, workers: int) -> int:
+    """Enough shards for `guild_count` guilds, and at least one per worker"""
+    return max(workers, math.ceil(guild_count / GUILDS_PER_SHARD))
+
+
+def assign_shards(shard_count: int, workers: int) -> List[Tuple[int, ...]]:
+    """Spread shard IDs round-robin so every worker gets a similar share"""
+    return [tuple(range(index, shard_count, workers)) for index in range(workers)]
+
+
+def _encode_tick(tick: int, quotes: Dict[str, PriceQuote]) -> bytes:
+    payload = {"tick": tick, "quotes": {address: asdict(quote) for address, quote in quotes.items()}}
+    return (json.dumps(payload) + "\n").encode()
+
+
+class PricePublisher:
+    """
+    Broadcasts price ticks to every connected worker over a Unix socket, one
+    JSON line per tick. Each tick carries every tracked token, and a worker
+    that connects (or reconnects) is sent the latest tick straight away.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.quotes: Dict[str, PriceQuote] = {}
+        self.ticks = 0
+        self._latest: Optional[bytes] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._handlers: Set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._writers)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Left behind by a previous run that did not shut down cleanly
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._connected, path=self.path)
+
+    async def _connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._handlers.add(asyncio.current_task())
+        self._writers.add(writer)
+        if self._latest is not None:
+            writer.write(self._latest)
+        try:
+            # Workers never send anything; this returns when they disconnect
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            self._writers.discard(writer)
+            writer.close()
+
+    def publish(self, quotes: Dict[str, PriceQuote]):
+        """Merge `quotes` into the current prices and send them to every worker"""
+        self.quotes.update(quotes)
+        self.ticks += 1
+        self._latest = _encode_tick(self.ticks, self.quotes)
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+                logger.warning("Disconnecting a worker that stopped reading price ticks")
+                self._writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(self._latest)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class PriceSubscriber:
+    """
+    Follows a PricePublisher from a worker. Iterating yields the newest
+    quotes; ticks that arrive while the worker is still rendering are merged,
+    so a slow worker skips straight to the latest prices. Lost connections
+    are retried with backoff.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connected = False
+        self.ticks = 0
+        self._quotes: Dict[str, PriceQuote] = {}
+        self._fresh = asyncio.Event()
+        self._backoff = PollScheduler(RECONNECT_POLICY)
+        self._task: Optional[asyncio.Task] = None
+
+    def __aiter__(self) -> "PriceSubscriber":
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._follow())
+        return self
+
+    async def __anext__(self) -> Dict[str, PriceQuote]:
+        await self._fresh.wait()
+        self._fresh.clear()
+        quotes, self._quotes = self._quotes, {}
+        return quotes
+
+    async def _follow(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_BUFFERED_BYTES)
+                self.connected = True
+                self._backoff.record_success({})
+                try:
+                    while line := await reader.readline():
+                        tick = json.loads(line)
+                        self._quotes.update({
+                            address: PriceQuote(**quote) for address, quote in tick["quotes"].items()})
+                        self.ticks = tick["tick"]
+                        self._fresh.set()
+                finally:
+                    self.connected = False
+                    writer.close()
+                logger.warning("Price publisher closed the connection")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Price publisher unavailable: {type(e).__name__}: {e}")
+            self._backoff.record_failure()
+            await asyncio.sleep(self._backoff.next_delay())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+@dataclass(frozen=True)
+class WorkerSpec:
+    """What one worker process runs: its shards and its share of the global rate limit"""
+    index: int
+    shard_ids: Tuple[int, ...]
+    shard_count: int
+    socket_path: str
+    global_rate: int
+
+
+def run_worker(spec: WorkerSpec, config: TrackerConfig):
+    """Entry point of a worker process: a sharded bot that renders published prices"""
+    from .discord_writer import DiscordWriter
+    from .price_tracker_bot import PriceTrackerBot
+
+    # Per-worker snapshot and metrics port; the publisher owns the price history
+    snapshot_path = os.getenv("SNAPSHOT_PATH", ".price_snapshot.json")
+    os.environ["SNAPSHOT_PATH"] = f"{snapshot_path}.shard{spec.index}"
+    metrics_port = os.getenv("METRICS_PORT", "9108")
+    if metrics_port.isdigit():
+        os.environ["METRICS_PORT"] = str(int(metrics_port) + 1 + spec.index)
+
+    guilds = [guild for guild in config.guilds if shard_for(guild.guild_id, spec.shard_count) in spec.shard_ids]
+    bot = PriceTrackerBot(
+        config=replace(config, guilds=guilds),
+        shard_ids=list(spec.shard_ids),
+        shard_count=spec.shard_count,
+        price_feed=spec.socket_path,
+        writer=DiscordWriter(global_limit=(spec.global_rate, 1.0)),
+    )
+    logger.info("Worker starting", extra={
+        "worker": spec.index, "shards": list(spec.shard_ids), "guilds": len(guilds)})
+    bot.run()
+
+
+class ShardSupervisor:
+    """
+    Runs a sharded deployment from one process.
+
+    This process fetches prices (adaptive polling, plus the swap stream when
+    PRICE_STREAM_URL is set) and publishes every tick over a Unix socket.
+    `workers` child processes each run a discord.py AutoShardedClient for
+    their shards and only render what they receive, so adding workers never
+    adds price API calls. Discord's global rate limit is split evenly
+    between workers. Workers that exit are restarted with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, workers: int, config: Optional[TrackerConfig] = None, shard_count: Optional[int] = None,
+                 socket_path: Optional[str] = None, update_interval: int = 300,
+                 target: Callable[[WorkerSpec, TrackerConfig], None] = run_worker):
+        if workers < 1:
+            raise ValueError("A cluster needs at least one worker")
+        self.config = config or load_tracker_config()
+        self.workers = workers
+        self.shard_count = shard_count or recommended_shards(len(self.config.guilds), workers)
+        if self.shard_count < workers:
+            raise ValueError(f"{workers} workers need at least as many shards, got {self.shard_count}")
+        self.socket_path = socket_path or os.path.join(tempfile.gettempdir(), f"price-tracker-{os.getpid()}.sock")
+        self.update_interval = update_interval
+        self.target = target
+        global_rate = int(os.getenv("DISCORD_GLOBAL_RATE", DEFAULT_GLOBAL_RATE))
+        self.specs = [
+            WorkerSpec(index, shard_ids, self.shard_count, self.socket_path, max(1, global_rate // workers))
+            for index, shard_ids in enumerate(assign_shards(self.shard_count, workers))
+        ]
+        self.publisher = PricePublisher(self.socket_path)
+        # When each token's streamed price was last published (time.monotonic())
+        self._streamed_at: Dict[str, float] = {}
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * workers
+        self._started_at = [0.0] * workers
+        self._restart_at = [0.0] * workers
+        self._backoff = [PollScheduler(RESTART_POLICY) for _ in range(workers)]
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(self.specs[index], self.config),
+            name=f"price-tracker-worker-{index}", daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def start_workers(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        logger.info("Workers started", extra={"workers": self.workers, "shards": self.shard_count})
+
+    def alive(self) -> List[bool]:
+        return [process is not None and process.is_alive() for process in self._processes]
+
+    async def supervise(self, check_every: float = 1.0):
+        """Restart workers that exit, backing off when they keep failing"""
+        while True:
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if process is not None and process.is_alive():
+                    if now - self._started_at[index] >= STABLE_AFTER:
+                        self._backoff[index].record_success({})
+                    continue
+                if process is not None:
+                    # Just exited: schedule its restart
+                    logger.warning("Worker exited", extra={"worker": index, "exitcode": process.exitcode})
+                    process.close()
+                    self._processes[index] = None
+                    self._backoff[index].record_failure()
+                    self._restart_at[index] = now + self._backoff[index].next_delay()
+                elif now >= self._restart_at[index]:
+                    self.restarts += 1
+                    logger.info("Restarting worker", extra={"worker": index})
+                    self._start_worker(index)
+            await asyncio.sleep(check_every)
+
+    def stop_workers(self, timeout: float = 5.0):
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+
+    async def _poll(self, stream):
+        from .price_aggregator import build_price_source
+        from .price_history import PriceHistoryStore
+
+        source = build_price_source(self.config)
+        history = PriceHistoryStore()
+        scheduler = PollScheduler(PollPolicy.from_env(self.update_interval))
+        contracts = self.config.contracts()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    with STAGE_SECONDS.time(stage="fetch"):
+                        quotes = await source.fetch_many(contracts)
+                except Exception as e:
+                    ERRORS.inc(stage="fetch")
+                    scheduler.record_failure(retry_after_from(e))
+                    logger.error("Price fetch failed", extra={"error": f"{type(e).__name__}: {e}"})
+                else:
+                    scheduler.record_success({address: quote.price for address, quote in quotes.items()})
+                    if stream is not None and stream.connected:
+                        # Only a swap published while fetching is newer than the poll;
+                        # a quiet pool's streamed price misses quote asset USD moves
+                        quotes = {
+                            address: replace(quote, price=self.publisher.quotes[address].price)
+                            if (address in stream.engines and address in self.publisher.quotes
+                                and self._streamed_at.get(address, started) > started) else quote
+                            for address, quote in quotes.items()
+                        }
+                    for address, quote in quotes.items():
+                        history.record(address, quote.price)
+                    history.flush()
+                    self.publisher.publish(quotes)
+                delay = scheduler.next_delay()
+                if stream is not None and stream.connected:
+                    delay = max(delay, scheduler.policy.max_interval)
+                # Sleep until an absolute time so fetch time does not add up
+                await asyncio.sleep(max(0.0, started + delay - time.monotonic()))
+        finally:
+            await source.close()
+
+    async def run(self):
+        """Publish prices and keep every worker running until cancelled"""
+        from .price_stream import build_price_stream
+
+        streamed: Dict[str, float] = {}
+        wakeup = asyncio.Event()
+
+        def on_price(contract: str, price: float):
+            streamed[contract] = price
+            wakeup.set()
+
+        async def publish_stream(stream_interval: float):
+            while True:
+                await wakeup.wait()
+                wakeup.clear()
+                # Pool events carry no 24h change, so a token's streamed
+                # prices are dropped until a poll has published one
+                ready = {address: price for address, price in streamed.items()
+                         if address in self.publisher.quotes}
+                streamed.clear()
+                if ready:
+                    self.publisher.publish({
+                        address: replace(self.publisher.quotes[address], price=price)
+                        for address, price in ready.items()
+                    })
+                    now = time.monotonic()
+                    self._streamed_at.update((address, now) for address in ready)
+                await asyncio.sleep(stream_interval)
+
+        metrics_server = await start_metrics_server()
+        await self.publisher.start()
+        self.start_workers()
+        stream = build_price_stream(self.config, on_price)
+        tasks = [asyncio.create_task(self.supervise()), asyncio.create_task(self._poll(stream))]
+        if stream is not None:
+            stream.start()
+            tasks.append(asyncio.create_task(publish_stream(float(os.getenv("STREAM_MIN_INTERVAL", "2")))))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if stream is not None:
+                await stream.close()
+            self.stop_workers()
+            await self.publisher.close()
+            if metrics_server:
+                await metrics_server.stop()
+
+
+def run_cluster(workers: Optional[int] = None, shard_count: Optional[int] = None):
+    """
+    Run the tracker as one publisher and `workers` sharded worker processes
+    (`$CLUSTER_WORKERS`, else one per CPU core)
+    """
+    from .price_tracker_bot import DISCORD_TOKEN
+
+    if not DISCORD_TOKEN or DISCORD_TOKEN == "your_discord_bot_token":
+        raise ValueError(
+            "Invalid Discord token. Please update your .env file with a valid token from "
+            "https://discord.com/developers/applications"
+        )
+    workers = workers or int(os.getenv("CLUSTER_WORKERS", "0")) or os.cpu_count() or 1
+    shard_count = shard_count or int(os.getenv("SHARD_COUNT", "0")) or None
+    configure_logging()
+    supervisor = ShardSupervisor(workers, shard_count=shard_count)
+    print(f"Running {workers} workers over {supervisor.shard_count} shards "
+          f"for {len(supervisor.config.guilds)} guilds")
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        pass
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Publisher and subscribers over a real Unix socket: late joiners get the
+    # latest tick, a slow worker only sees the newest prices, and a worker
+    # reconnects after the publisher restarts.
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.shard_cluster
+    print("shards for 100 guilds / 4 workers:", assign_shards(recommended_shards(100, 4), 4))
+    print("shards for 9000 guilds / 4 workers:", assign_shards(recommended_shards(9000, 4), 4))
+    assert shard_for(81384788765712384, 4) == (81384788765712384 >> 22) % 4
+
+    async def main(path):
+        publisher = PricePublisher(path)
+        await publisher.start()
+        publisher.publish({"0xpdt": PriceQuote(price=0.0421, change_24h=1.5)})
+
+        subscriber = PriceSubscriber(path)
+        feed = aiter(subscriber)
+        first = await anext(feed)
+        assert first["0xpdt"].price == 0.0421, first
+
+        # Twenty ticks while the worker is busy arrive as one update
+        for tick in range(20):
+            publisher.publish({"0xpdt": PriceQuote(price=0.05 + tick / 1000, change_24h=1.5)})
+        await asyncio.sleep(0.1)
+        merged = await anext(feed)
+        assert merged["0xpdt"].price == 0.05 + 19 / 1000, merged
+        print(f"late join got tick 1, 20 ticks merged into one update ending at ${merged['0xpdt'].price}")
+
+        # Publisher restart: the worker reconnects and gets the latest tick
+        await publisher.close()
+        publisher = PricePublisher(path)
+        await publisher.start()
+        publisher.publish({"0xpdt": PriceQuote(price=0.06, change_24h=2.0)})
+        started = time.perf_counter()
+        again = await asyncio.wait_for(anext(feed), 10)
+        assert again["0xpdt"].price == 0.06, again
+        print(f"reconnected to a restarted publisher in {time.perf_counter() - started:.2f}s")
+        await subscriber.close()
+        await publisher.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(main(os.path.join(tmp, "prices.sock")))
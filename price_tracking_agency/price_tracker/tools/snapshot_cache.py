@@ -0,0 +1,228 @@
+"""
+Persistent TTL cache of the last good prices and applied Discord state
+"""
+
+__all__ = ['CachedQuote', 'SnapshotCache']
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .price_source import PriceQuote
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_PATH = ".price_snapshot.json"
+SNAPSHOT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class CachedQuote:
+    """A quote together with the time it was fetched"""
+    quote: PriceQuote
+    fetched_at: float
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.time()) - self.fetched_at
+
+
+class SnapshotCache:
+    """
+    Last good quote per contract plus the last Discord values applied,
+    persisted to a small JSON file so a restart can render immediately.
+
+    Freshness rules:
+    - younger than `fresh_ttl`: fresh, served without refetching
+    - younger than `max_age`: stale, served while a refetch runs
+    - older than `max_age`: expired and evicted, never served
+    Contracts that are no longer tracked are evicted on load.
+    """
+
+    def __init__(self, path: Optional[str] = None, fresh_ttl: float = 60.0,
+                 max_age: float = 24 * 3600.0):
+        self.path = path or os.getenv("SNAPSHOT_PATH") or DEFAULT_SNAPSHOT_PATH
+        self.fresh_ttl = fresh_ttl
+        self.max_age = max_age
+        self._quotes: Dict[str, CachedQuote] = {}
+        self._applied: Dict[Tuple[Optional[int], str], Any] = {}
+
+    def get(self, contract: str, now: Optional[float] = None) -> Optional[CachedQuote]:
+        """Cached quote for `contract`, or None if missing or expired"""
+        key = contract.lower()
+        cached = self._quotes.get(key)
+        if cached is None:
+            return None
+        if cached.age(now) > self.max_age:
+            del self._quotes[key]
+            return None
+        return cached
+
+    def is_fresh(self, contract: str, now: Optional[float] = None) -> bool:
+        cached = self.get(contract, now)
+        return cached is not None and cached.age(now) <= self.fresh_ttl
+
+    def quotes(self, contracts: Iterable[str], now: Optional[float] = None) -> Dict[str, PriceQuote]:
+        """Every unexpired cached quote among `contracts`"""
+        result = {}
+        for contract in contracts:
+            cached = self.get(contract, now)
+            if cached is not None:
+                result[contract.lower()] = cached.quote
+        return result
+
+    def put(self, contract: str, quote: PriceQuote, now: Optional[float] = None):
+        fetched_at = now if now is not None else time.time()
+        self._quotes[contract.lower()] = CachedQuote(quote=quote, fetched_at=fetched_at)
+
+    @property
+    def applied(self) -> Dict[Tuple[Optional[int], str], Any]:
+        """Last value applied per (guild, surface)"""
+        return dict(self._applied)
+
+    def set_applied(self, applied: Dict[Tuple[Optional[int], str], Any]):
+        self._applied = dict(applied)
+
+    def load(self, contracts: Optional[Iterable[str]] = None) -> bool:
+        """
+        Read the snapshot file, dropping expired entries and contracts not in
+        `contracts`. Returns False when there is no usable snapshot.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable price snapshot {self.path}: {e}")
+            return False
+        if raw.get("version") != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring price snapshot {self.path} with unknown version")
+            return False
+
+        tracked = {c.lower() for c in contracts} if contracts is not None else None
+        now = time.time()
+        for contract, entry in (raw.get("quotes") or {}).items():
+            if tracked is not None and contract not in tracked:
+                continue
+            try:
+                change = entry.get("change_24h")
+                cached = CachedQuote(
+                    quote=PriceQuote(price=float(entry["price"]),
+                                     change_24h=float(change) if change is not None else None),
+                    fetched_at=float(entry["fetched_at"]),
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+            if cached.age(now) <= self.max_age:
+                self._quotes[contract] = cached
+
+        for entry in raw.get("applied") or []:
+            try:
+                guild_id, surface, value = entry
+            except (TypeError, ValueError):
+                continue
+            self._applied[(guild_id, surface)] = value
+        return bool(self._quotes)
+
+    def save(self):
+        """Atomically write the snapshot file"""
+        raw = {
+            "version": SNAPSHOT_VERSION,
+            "quotes": {
+                contract: {
+                    "price": cached.quote.price,
+                    "change_24h": cached.quote.change_24h,
+                    "fetched_at": cached.fetched_at,
+                }
+                for contract, cached in self._quotes.items()
+            },
+            "applied": [[guild_id, surface, value] for (guild_id, surface), value in self._applied.items()],
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(raw, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write price snapshot {self.path}: {e}")
+
+
+# Add a test case
+if __name__ == "__main__":
+    # Startup benchmark: time from READY to the first correct nickname, cold
+    # (wait for a slow upstream fetch) versus warm (render from the snapshot).
+    # Run from the project root: python -m price_tracking_agency.price_tracker.tools.snapshot_cache
+    import asyncio
+    import tempfile
+    from types import SimpleNamespace
+
+    from price_tracking_agency.price_tracker.tools.price_aggregator import PriceAggregator
+    from price_tracking_agency.price_tracker.tools.price_source import PriceSource
+    from price_tracking_agency.price_tracker.tools.price_tracker_bot import PriceTrackerBot
+
+    FETCH_LATENCY = 1.5
+    QUOTE = PriceQuote(price=0.0421, change_24h=3.5)
+
+    class SlowSource(PriceSource):
+        async def fetch_many(self, contracts):
+            await asyncio.sleep(FETCH_LATENCY)
+            return {c.lower(): QUOTE for c in contracts}
+
+    class FakeClient:
+        """Just enough of discord.Client for the update path"""
+
+        def __init__(self, guild_ids, nick_seen):
+            self.user = SimpleNamespace(id=1)
+            # Not logged in, so the slash commands are not synced
+            self.application_id = None
+
+            async def edit(nick):
+                if not nick_seen.done():
+                    nick_seen.set_result(nick)
+            member = SimpleNamespace(
+                guild_permissions=[], top_role=SimpleNamespace(name="bot", position=1), edit=edit)
+            self.guilds = [SimpleNamespace(id=g, name=f"guild {g}", roles=[], get_member=lambda _: member)
+                           for g in guild_ids]
+
+        def get_guild(self, guild_id):
+            return next((g for g in self.guilds if g.id == guild_id), None)
+
+        async def change_presence(self, **kwargs):
+            pass
+
+    async def time_to_first_nickname(snapshot_path):
+        bot = PriceTrackerBot(update_interval=3600)
+        bot._snapshot = SnapshotCache(snapshot_path)
+        bot._snapshot.load(bot._config.contracts())
+        bot._price_source = PriceAggregator({"slow": SlowSource()})
+        nick_seen = asyncio.get_running_loop().create_future()
+        on_ready = bot._discord_client.on_ready
+        bot._discord_client = FakeClient([g.guild_id for g in bot._config.guilds], nick_seen)
+
+        started = time.perf_counter()
+        await on_ready()
+        nick = await nick_seen
+        elapsed = time.perf_counter() - started
+        bot.price_update_loop.cancel()
+        bot.save_snapshot()
+        return elapsed, nick
+
+    async def main():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshot.json")
+            cold, nick = await time_to_first_nickname(path)
+            print(f"cold start: first nickname {nick!r} after {cold * 1000:.0f}ms")
+            # The cold run saved a snapshot; a restart renders from it. The
+            # persisted applied state would skip the identical write, so drop
+            # it to time the render itself.
+            cache = SnapshotCache(path)
+            cache.load()
+            cache.set_applied({})
+            cache.save()
+            warm, nick = await time_to_first_nickname(path)
+            print(f"warm start: first nickname {nick!r} after {warm * 1000:.0f}ms")
+
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Guild-to-token configuration for the price tracking bot
+"""
+
+__all__ = ['TokenConfig', 'GuildConfig', 'PoolConfig', 'TrackerConfig', 'load_tracker_config']
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CONFIG_PATH = "tracker_config.json"
+
+# Token tracked when falling back to the legacy single-guild GUILD_ID setup
+LEGACY_TOKEN_SYMBOL = "PDT"
+LEGACY_TOKEN_CONTRACT = "0xeff2A458E464b07088bDB441C21A42AB4b61e07E"
+
+# Price sources queried for every tick, see price_aggregator.py
+KNOWN_SOURCES = ("coingecko", "dexscreener", "onchain")
+DEFAULT_SOURCES = ["coingecko", "dexscreener"]
+
+# Chainlink ETH / USD price feed on Base mainnet, the default quote feed of a pool
+ETH_USD_FEED_BASE = "0x71041dddad3595F9CEd3DcCFBe3D1F4b0a16Bb70"
+
+
+@dataclass(frozen=True)
+class TokenConfig:
+    """A tracked token and its Base contract address"""
+    symbol: str
+    contract: str
+
+    @property
+    def key(self) -> str:
+        """Lowercased contract address, as used in CoinGecko responses"""
+        return self.contract.lower()
+
+
+@dataclass(frozen=True)
+class GuildConfig:
+    """A Discord guild and the symbol of the token it displays"""
+    guild_id: int
+    token: str
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """Liquidity pool used to price a token on-chain, `quote_feed` None for a USD stablecoin quote"""
+    address: str
+    version: str = "v2"
+    quote_feed: Optional[str] = ETH_USD_FEED_BASE
+
+
+@dataclass
+class TrackerConfig:
+    """
+    Which tokens are tracked and which guild shows which token.
+
+    Bot presence is shared by every guild, so it follows `presence_token`.
+    `pools` maps token symbols to the pools the on-chain source reads.
+    """
+    tokens: Dict[str, TokenConfig]
+    guilds: List[GuildConfig]
+    presence_token: str
+    sources: List[str] = field(default_factory=lambda: list(DEFAULT_SOURCES))
+    pools: Dict[str, PoolConfig] = field(default_factory=dict)
+
+    def contracts(self) -> List[str]:
+        """Distinct lowercased contract addresses, one per tracked token"""
+        return sorted({token.key for token in self.tokens.values()})
+
+    def token_for(self, guild_id: int) -> Optional[TokenConfig]:
+        for guild in self.guilds:
+            if guild.guild_id == guild_id:
+                return self.tokens[guild.token]
+        return None
+
+
+def _parse_config(raw: dict) -> TrackerConfig:
+    tokens = {}
+    for symbol, contract in (raw.get("tokens") or {}).items():
+        if not isinstance(contract, str) or not contract.startswith("0x"):
+            raise ValueError(f"Token {symbol} needs a contract address, got {contract!r}")
+        tokens[symbol] = TokenConfig(symbol=symbol, contract=contract)
+    if not tokens:
+        raise ValueError("Tracker config must define at least one token under 'tokens'")
+
+    guilds = []
+    for guild_id, symbol in (raw.get("guilds") or {}).items():
+        if symbol not in tokens:
+            raise ValueError(f"Guild {guild_id} tracks unknown token {symbol!r}")
+        try:
+            guilds.append(GuildConfig(guild_id=int(guild_id), token=symbol))
+        except ValueError:
+            raise ValueError(f"Invalid guild ID in tracker config: {guild_id!r}")
+    if not guilds:
+        raise ValueError("Tracker config must map at least one guild under 'guilds'")
+
+    presence_token = raw.get("presence_token") or guilds[0].token
+    if presence_token not in tokens:
+        raise ValueError(f"presence_token {presence_token!r} is not a configured token")
+
+    sources = raw.get("sources") or list(DEFAULT_SOURCES)
+    unknown = [source for source in sources if source not in KNOWN_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown price sources {unknown}, expected some of {list(KNOWN_SOURCES)}")
+
+    pools = {}
+    for symbol, pool in (raw.get("pools") or {}).items():
+        if symbol not in tokens:
+            raise ValueError(f"Pool configured for unknown token {symbol!r}")
+        if isinstance(pool, str):
+            pool = {"address": pool}
+        if not pool.get("address"):
+            raise ValueError(f"Pool for {symbol} needs an address")
+        pools[symbol] = PoolConfig(
+            address=pool["address"],
+            version=pool.get("version", "v2"),
+            quote_feed=pool.get("quote_feed", ETH_USD_FEED_BASE) or None,
+        )
+
+    return TrackerConfig(tokens=tokens, guilds=guilds, presence_token=presence_token,
+                         sources=sources, pools=pools)
+
+
+def _legacy_config() -> TrackerConfig:
+    guild_id = os.getenv("GUILD_ID")
+    if not guild_id:
+        raise ValueError(
+            f"No tracker config found. Create {DEFAULT_CONFIG_PATH} (see "
+            "tracker_config.example.json) or set GUILD_ID in your .env file"
+        )
+    if guild_id == 'your_discord_server_id':
+        raise ValueError("Please replace 'your_discord_server_id' in .env with your actual Discord server ID")
+    return _parse_config({
+        "tokens": {LEGACY_TOKEN_SYMBOL: LEGACY_TOKEN_CONTRACT},
+        "guilds": {guild_id: LEGACY_TOKEN_SYMBOL},
+    })
+
+
+def load_tracker_config(path: Optional[str] = None) -> TrackerConfig:
+    """
+    Load the tracker config from `path`, `$TRACKER_CONFIG` or tracker_config.json.
+
+    When neither names a file and tracker_config.json does not exist, a
+    single-guild PDT config is built from the legacy GUILD_ID environment
+    variable. A named file that does not exist raises FileNotFoundError
+    rather than quietly tracking the wrong guilds.
+    """
+    explicit = path or os.getenv("TRACKER_CONFIG")
+    path = explicit or DEFAULT_CONFIG_PATH
+    if not os.path.exists(path):
+        if explicit:
+            raise FileNotFoundError(f"Tracker config {path} does not exist")
+        return _legacy_config()
+    with open(path, encoding="utf-8") as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in tracker config {path}: {e}")
+    return _parse_config(raw)
+
+
+# Add a test case
+if __name__ == "__main__":
+    config = load_tracker_config()
+    print(f"Tracking {len(config.tokens)} tokens across {len(config.guilds)} guilds")
+    print(f"Contracts fetched per tick: {config.contracts()}")
@@ -1,71 +1,116 @@
 import os
 import sys
+import time
 import logging
 import discord
+from discord.ext import tasks
 from dotenv import load_dotenv
-from web3 import Web3
 
-# Setup logging
-logging.basicConfig(
-    level=logging.DEBUG if os.getenv('DEBUG') == '1' else logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from price_tracking_agency.price_tracker.tools.discord_gateway import client_options, own_member
+from price_tracking_agency.price_tracker.tools.log_config import configure_logging
+from price_tracking_agency.price_tracker.tools.metrics import (
+    ERRORS, GATEWAY_LATENCY, LOOP_DRIFT, STAGE_SECONDS, start_metrics_server,
 )
-logger = logging.getLogger('PDTBot')
+from price_tracking_agency.price_tracker.tools.onchain_price import ETH_USD_FEED_BASE, OnChainPriceEngine
+from price_tracking_agency.price_tracker.tools.poll_scheduler import (
+    PollPolicy, PollScheduler, retime_loop, retry_after_from,
+)
+from price_tracking_agency.price_tracker.tools.rpc_pool import build_web3
 
-# Load environment variables
+# Load environment variables before anything reads them
 load_dotenv()
 
+# Setup logging: LOG_LEVEL (or DEBUG=1) and LOG_FORMAT=text|json
+configure_logging()
+logger = logging.getLogger('PDTBot')
+
+PDT_TOKEN = '0x375488F097176507e39B9653b88FDc52cDE736Bf'
+
 class PDTBot(discord.Client):
     def __init__(self):
-        super().__init__(intents=discord.Intents.all())
+        # Only the bot's own member is needed, so skip member caching and chunking
+        super().__init__(**client_options())
         self.guild_id = int(os.getenv('GUILD_ID'))
-        self.web3 = Web3(Web3.HTTPProvider('https://mainnet.base.org'))
-        self.pdt_contract = self.web3.eth.contract(
-            address='0x375488F097176507e39B9653b88FDc52cDE736Bf',
-            abi=[{"inputs":[],"name":"decimals","outputs":[{"internalType":"uint8","name":"","type":"uint8"}],"stateMutability":"view","type":"function"},
-                 {"inputs":[],"name":"totalSupply","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"}]
+        # BASE_RPC_URLS endpoints behind one provider: fastest healthy one first, failover, batching
+        self.web3 = build_web3()
+        # Prices PDT from its pool and the quote asset's USD feed in one Multicall3 read
+        self.price_engine = OnChainPriceEngine(
+            self.web3,
+            token=PDT_TOKEN,
+            pool=os.getenv('PDT_POOL_ADDRESS'),
+            pool_version=os.getenv('PDT_POOL_VERSION', 'v2'),
+            quote_feed=os.getenv('QUOTE_USD_FEED', ETH_USD_FEED_BASE) or None,
         )
-        
+        self.metrics_server = None
+        # Polls every 5 minutes at first, then adapts to how fast the price moves
+        self.scheduler = PollScheduler(PollPolicy.from_env(base_interval=5 * 60))
+        self._next_tick = None
+
     async def setup_hook(self):
+        self.metrics_server = await start_metrics_server()
+        GATEWAY_LATENCY.set_function(lambda: self.latency)
         self.update_price.start()
 
+    async def close(self):
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.web3.provider.disconnect()
+        await super().close()
+
     @tasks.loop(minutes=5)
     async def update_price(self):
         """Update bot's nickname with current PDT price"""
+        started = time.monotonic()
+        if self._next_tick is not None:
+            LOOP_DRIFT.observe(time.time() - self._next_tick)
         try:
             guild = self.get_guild(self.guild_id)
             if not guild:
-                logger.error(f"Could not find guild with ID {self.guild_id}")
+                logger.error("Could not find guild", extra={"guild_id": self.guild_id})
                 return
 
-            # Get PDT price from contract
+            # Get PDT price from the pool
             price = await self.get_pdt_price()
-            
+            if price is None:
+                return
+
             # Update nickname with price
-            await guild.me.edit(nick=f"PDT: ${price:.4f}")
-            logger.info(f"Updated price to ${price:.4f}")
+            me = await own_member(self, guild)
+            with STAGE_SECONDS.time(stage="nickname"):
+                await me.edit(nick=f"PDT: ${price:.4f}")
+            logger.info("Updated price", extra={"price": price})
 
         except Exception as e:
-            logger.error(f"Error updating price: {e}")
+            ERRORS.inc(stage="cycle")
+            logger.error("Error updating price", extra={"error": str(e)})
+        finally:
+            STAGE_SECONDS.observe(time.monotonic() - started, stage="cycle")
+            delay = self.scheduler.next_delay()
+            self._next_tick = retime_loop(self.update_price, delay)
+            logger.debug("Next price update scheduled", extra={"next_update_s": round(delay, 1)})
+
+    @update_price.before_loop
+    async def before_update_price(self):
+        # The guild cache is empty until READY
+        await self.wait_until_ready()
 
     async def get_pdt_price(self):
         """Get current PDT token price"""
         try:
-            # Get price from contract
-            decimals = self.pdt_contract.functions.decimals().call()
-            total_supply = self.pdt_contract.functions.totalSupply().call()
-            
-            # Calculate price (implement your price calculation logic here)
-            price = total_supply / (10 ** decimals)
+            with STAGE_SECONDS.time(stage="fetch"):
+                price = await self.price_engine.get_price()
+            self.scheduler.record_success({"PDT": price})
             return price
 
         except Exception as e:
-            logger.error(f"Error fetching price: {e}")
-            return 0.0
+            ERRORS.inc(stage="fetch")
+            self.scheduler.record_failure(retry_after_from(e))
+            logger.error("Error fetching price", extra={"error": str(e)})
+            return None
 
 def check_environment():
     """Check required environment variables"""
-    required_vars = ['DISCORD_TOKEN', 'GUILD_ID']
+    required_vars = ['DISCORD_TOKEN', 'GUILD_ID', 'PDT_POOL_ADDRESS']
     missing = [var for var in required_vars if not os.getenv(var)]
     if missing:
         logger.error(f"Missing required environment variables: {', '.join(missing)}")
@@ -80,11 +125,12 @@ def main():
     
     try:
         bot = PDTBot()
-        bot.run(os.getenv('DISCORD_TOKEN'))
+        # Logging is already configured above
+        bot.run(os.getenv('DISCORD_TOKEN'), log_handler=None)
     except discord.LoginFailure:
         logger.error("Failed to login. Please check your Discord token.")
     except discord.PrivilegedIntentsRequired:
-        logger.error("Bot requires privileged intents. Please enable them in Discord Developer Portal.")
+        logger.error("GATEWAY_MODE=full requires privileged intents. Enable them in the Discord Developer Portal or use the default lean mode.")
     except Exception as e:
         logger.exception("Unexpected error occurred")
         sys.exit(1)
@@ -7,8 +7,10 @@ setup(
     install_requires=[
         'agency-swarm',
         'discord.py',
-        'web3',
+        'aiohttp',
+        'web3>=7.0.0',
         'requests',
-        'python-dotenv'
+        'python-dotenv',
+        'numpy'
     ],
 ) 
\ No newline at end of file